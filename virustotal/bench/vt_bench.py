@@ -0,0 +1,741 @@
+#!/usr/bin/env python3
+# vt_bench.py
+# Offline throughput benchmark for detailed_apk_scanner and large_apk_scanner.
+# Runs both scanners against a local VirusTotal stand-in on a synthetic APK
+# corpus, with every sleep and backoff driven by a virtual clock.
+#
+#   python bench/vt_bench.py                     # both scanners, 20 APKs, 1 key
+#   python bench/vt_bench.py -n 60 --keys 3      # bigger corpus, key pool
+#   python bench/vt_bench.py --fault-rate 0.1    # inject random 429s
+#   python bench/vt_bench.py serve               # just run the mock server
+#   python bench/vt_bench.py check               # correctness scenarios, exit 1 on failure
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import struct
+import zipfile
+import hashlib
+import argparse
+import tempfile
+import threading
+import functools
+import contextlib
+import importlib.util
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCANNER_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, SCANNER_DIR)
+
+DETAILED_SCANNER = os.path.join(SCANNER_DIR, "detailed_apk_scanner_v1.6.1.py")
+LARGE_SCANNER = os.path.join(SCANNER_DIR, "large_apk_scanner_v1.0.0.py")
+
+# =============================================
+# BENCHMARK CONFIGURATION
+# =============================================
+BENCH_CONFIG = {
+    "apks": 20,
+    "keys": 1,
+    "min_size": 64 * 1024,
+    "max_size": 2 * 1024 * 1024,
+    "known_ratio": 0.7,  # Share of the corpus VT already knows (the rest 404s)
+    "infected_ratio": 0.2,  # Share of known files that come back malicious
+    "server_rpm": 4,  # Public API quota enforced by the mock, per key
+    "fault_rate": 0.0,  # Extra random 429s, as a probability per lookup
+    "seed": 1337
+}
+
+BOLD = "\033[1m"
+RESET = "\033[0m"
+NEON_GREEN = "\033[38;2;57;255;20m"
+NEON_YELLOW = "\033[38;2;255;255;20m"
+NEON_BLUE = "\033[38;2;57;97;255m"
+
+# =============================================
+# VIRTUAL CLOCK
+# =============================================
+
+class VirtualClock:
+    """Drop-in for the time module where sleeping costs no real time.
+
+    sleep() parks the caller until simulated time reaches its wake-up point. A
+    ticker jumps the clock to the earliest wake-up once no thread has touched the
+    clock for a short real-time quantum, so concurrent sleepers overlap exactly
+    as they would on a real clock while the run finishes in seconds.
+    """
+    def __init__(self, start=None, quantum=0.02):
+        self.epoch = start if start is not None else time.time()
+        self.quantum = quantum
+        self.now = 0.0
+        self.wakeups = []
+        self.last_activity = time.monotonic()
+        self.cond = threading.Condition()
+        self.ticker = threading.Thread(target=self._tick, name="virtual-clock", daemon=True)
+        self.ticker.start()
+
+    def _tick(self):
+        while True:
+            with self.cond:
+                pending = [t for t in self.wakeups if t > self.now]
+                idle = time.monotonic() - self.last_activity
+                if pending and idle >= self.quantum:
+                    self.now = min(pending)
+                    self.last_activity = time.monotonic()
+                    self.cond.notify_all()
+                else:
+                    self.cond.wait(self.quantum)
+
+    def monotonic(self):
+        with self.cond:
+            self.last_activity = time.monotonic()
+            return self.now
+
+    def time(self):
+        return self.epoch + self.monotonic()
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        with self.cond:
+            target = self.now + seconds
+            self.wakeups.append(target)
+            self.last_activity = time.monotonic()
+            while self.now < target:
+                self.cond.wait()
+            self.wakeups.remove(target)
+            self.last_activity = time.monotonic()
+
+    def elapsed(self):
+        """Current simulated time, read without counting as activity"""
+        with self.cond:
+            return self.now
+
+    # Anything else (strftime, gmtime, ...) comes from the real module
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+# =============================================
+# SYNTHETIC APK CORPUS
+# =============================================
+
+def build_corpus(directory, count, rng):
+    """Write count small but valid APK-shaped ZIPs, return {sha256: profile}"""
+    os.makedirs(directory, exist_ok=True)
+    profiles = {}
+    for i in range(count):
+        path = os.path.join(directory, f"bench_app_{i:04d}.apk")
+        size = rng.randint(BENCH_CONFIG["min_size"], BENCH_CONFIG["max_size"])
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as apk:
+            apk.writestr("AndroidManifest.xml", f"<manifest package=\"bench.app{i}\"/>")
+            apk.writestr("classes.dex", rng.randbytes(size))
+            apk.writestr("META-INF/CERT.RSA", rng.randbytes(512))
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+        if rng.random() >= BENCH_CONFIG["known_ratio"]:
+            profiles[digest] = "unknown"
+        elif rng.random() < BENCH_CONFIG["infected_ratio"]:
+            profiles[digest] = "infected"
+        else:
+            profiles[digest] = "clean"
+    return profiles
+
+def _length_prefixed(data):
+    return struct.pack("<I", len(data)) + data
+
+def compiled_manifest(package, version_code, version_name):
+    """AndroidManifest.xml as aapt2 compiles it: string pool, resource map, <manifest> start tag"""
+    strings = ["versionCode", "versionName", "android", "http://schemas.android.com/apk/res/android",
+               "package", "manifest", package, version_name]
+    offsets, pool = [], b""
+    for string in strings:
+        offsets.append(len(pool))
+        pool += struct.pack("<H", len(string)) + string.encode("utf-16-le") + b"\0\0"
+    pool += b"\0" * (-len(pool) % 4)
+    strings_start = 28 + 4 * len(strings)
+    string_chunk = struct.pack("<HHIIIIII", 0x0001, 28, strings_start + len(pool), len(strings), 0, 0, strings_start, 0)
+    string_chunk += struct.pack(f"<{len(offsets)}I", *offsets) + pool
+    resource_map = struct.pack("<HHIII", 0x0180, 8, 16, 0x0101021b, 0x0101021c)
+    namespace = struct.pack("<HHIIIII", 0x0100, 16, 24, 1, 0xFFFFFFFF, 2, 3)
+    attributes = [
+        (3, 0, 0xFFFFFFFF, 0x10, version_code),  # android:versionCode, an int
+        (3, 1, 7, 0x03, 7),  # android:versionName, a string
+        (0xFFFFFFFF, 4, 6, 0x03, 6)  # package, a string
+    ]
+    element = struct.pack("<HHIIIIIHHHHHH", 0x0102, 16, 36 + 20 * len(attributes), 1, 0xFFFFFFFF,
+                          0xFFFFFFFF, 5, 20, 20, len(attributes), 0, 0, 0)
+    for ns, name, raw, data_type, value in attributes:
+        element += struct.pack("<IIIHBBI", ns, name, raw, 8, 0, data_type, value)
+    body = string_chunk + resource_map + namespace + element
+    return struct.pack("<HHI", 0x0003, 8, 8 + len(body)) + body
+
+def v2_signed_apk(path, certificate, manifest):
+    """An APK with an APK Signature Scheme v2 block in front of its central directory"""
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as apk:
+        apk.writestr("AndroidManifest.xml", manifest)
+        apk.writestr("classes.dex", b"dex\n035\0" + bytes(1024))
+        apk.writestr("META-INF/CERT.RSA", os.urandom(512))  # Unparseable v1 signature: only v2 can name the signer
+    with open(path, "rb") as f:
+        data = f.read()
+
+    digests = _length_prefixed(_length_prefixed(struct.pack("<I", 0x0103) + _length_prefixed(bytes(32))))
+    signed_data = digests + _length_prefixed(_length_prefixed(certificate)) + _length_prefixed(b"")
+    signer = _length_prefixed(signed_data) + _length_prefixed(b"") + _length_prefixed(b"")
+    scheme = _length_prefixed(_length_prefixed(signer))
+    pairs = struct.pack("<QI", 4 + len(scheme), 0x7109871a) + scheme
+    block_size = len(pairs) + 24
+    block = struct.pack("<Q", block_size) + pairs + struct.pack("<Q", block_size) + b"APK Sig Block 42"
+
+    eocd = data.rfind(b"PK\x05\x06")
+    cd_offset = struct.unpack_from("<I", data, eocd + 16)[0]
+    eocd_record = data[eocd:eocd + 16] + struct.pack("<I", cd_offset + len(block)) + data[eocd + 20:]
+    with open(path, "wb") as f:
+        f.write(data[:cd_offset] + block + data[cd_offset:eocd] + eocd_record)
+
+def malformed_apk(path, defect):
+    """An APK whose manifest entry is readable in the central directory but not decodable.
+
+    defect is "encrypted" (flag bit set), "bad_deflate" (garbage compressed
+    stream) or "unsupported" (an unknown compression method).
+    """
+    compression = zipfile.ZIP_DEFLATED if defect == "bad_deflate" else zipfile.ZIP_STORED
+    with zipfile.ZipFile(path, "w", compression) as apk:
+        apk.writestr("AndroidManifest.xml", compiled_manifest("com.bench.broken", 1, "1.0"))
+        apk.writestr("classes.dex", b"dex\n035\0" + bytes(1024))
+    with zipfile.ZipFile(path) as apk:
+        info = apk.getinfo("AndroidManifest.xml")
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+
+    local = info.header_offset
+    central = data.find(b"PK\x01\x02")  # The manifest was written first, so its entry leads the directory
+    if defect == "encrypted":
+        data[local + 6] |= 0x01
+        data[central + 8] |= 0x01
+    elif defect == "unsupported":
+        struct.pack_into("<H", data, local + 8, 99)
+        struct.pack_into("<H", data, central + 10, 99)
+    else:
+        start = local + 30 + struct.unpack_from("<H", data, local + 26)[0] + struct.unpack_from("<H", data, local + 28)[0]
+        data[start:start + info.compress_size] = b"\xff" * info.compress_size
+    with open(path, "wb") as f:
+        f.write(data)
+
+def fake_report(file_hash, profile, now):
+    """A /files/{hash} response with enough vendors to exercise categorization"""
+    vendors = {}
+    for n in range(60):
+        vendors[f"Vendor{n:02d}"] = {"category": "undetected", "result": None, "method": "blacklist"}
+    if profile == "infected":
+        vendors["Vendor00"] = {"category": "malicious", "result": "Trojan.AndroidOS.Bench", "method": "blacklist"}
+        vendors["Vendor01"] = {"category": "malicious", "result": "Android.Malware.Gen", "method": "blacklist"}
+    else:
+        vendors["Vendor02"] = {"category": "malicious", "result": "Adware.Bench", "method": "blacklist"}
+
+    stats = {"malicious": 0, "suspicious": 0, "undetected": 0, "harmless": 0}
+    for info in vendors.values():
+        stats[info["category"]] += 1
+    return {"data": {"id": file_hash, "type": "file", "attributes": {
+        "last_analysis_date": int(now),
+        "last_analysis_stats": stats,
+        "last_analysis_results": vendors,
+        "reputation": 0,
+        "times_submitted": 1,
+        "meaningful_name": f"{file_hash[:8]}.apk"
+    }}}
+
+# =============================================
+# MOCK VIRUSTOTAL SERVER
+# =============================================
+
+class MockVTServer:
+    """Local stand-in for the /api/v3 endpoints both scanners use"""
+    def __init__(self, clock, profiles, rpm=None, fault_rate=None, seed=None):
+        self.clock = clock
+        self.profiles = profiles
+        self.rpm = rpm or BENCH_CONFIG["server_rpm"]
+        self.fault_rate = BENCH_CONFIG["fault_rate"] if fault_rate is None else fault_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.windows = {}  # api key -> request times in the last simulated minute
+        self.reset_stats()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/api/v3"
+
+    def reset_stats(self):
+        with self.lock:
+            self.windows = {}
+            self.stats = {"lookups": 0, "found": 0, "not_found": 0, "rate_limited": 0,
+                          "uploads": 0, "upload_bytes": 0, "polls": 0, "first_found_at": None}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _admit(self, api_key):
+        """Sliding one-minute window per key in simulated time, returns Retry-After or 0"""
+        now = self.clock.elapsed()
+        with self.lock:
+            window = [t for t in self.windows.get(api_key, []) if now - t < 60]
+            if len(window) >= self.rpm or self.rng.random() < self.fault_rate:
+                self.windows[api_key] = window
+                retry_after = 60 - (now - window[0]) if len(window) >= self.rpm else 15
+                return max(1, int(retry_after + 0.999))
+            window.append(now)
+            self.windows[api_key] = window
+            return 0
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=None, headers=None):
+                payload = json.dumps(body or {}).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _drain(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                remaining = length
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                return length
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/api/v3/files/upload_url":
+                    host, port = server.httpd.server_address
+                    return self._send(200, {"data": f"http://{host}:{port}/upload"})
+                if path.startswith("/api/v3/analyses/"):
+                    return self._analysis(path.rsplit("/", 1)[1])
+                if not path.startswith("/api/v3/files/"):
+                    return self._send(404, {"error": {"code": "NotFoundError"}})
+
+                file_hash = path.rsplit("/", 1)[1]
+                retry_after = server._admit(self.headers.get("x-apikey", ""))
+                with server.lock:
+                    server.stats["lookups"] += 1
+                if retry_after:
+                    with server.lock:
+                        server.stats["rate_limited"] += 1
+                    return self._send(429, {"error": {"code": "QuotaExceededError"}},
+                                      {"Retry-After": str(retry_after)})
+
+                profile = server.profiles.get(file_hash, "unknown")
+                if profile == "unknown":
+                    with server.lock:
+                        server.stats["not_found"] += 1
+                    return self._send(404, {"error": {"code": "NotFoundError"}})
+                with server.lock:
+                    server.stats["found"] += 1
+                    if server.stats["first_found_at"] is None:
+                        server.stats["first_found_at"] = server.clock.elapsed()
+                return self._send(200, fake_report(file_hash, profile, server.clock.time()))
+
+            def _analysis(self, analysis_id):
+                """Uploads always finish as clean on their first poll"""
+                retry_after = server._admit(self.headers.get("x-apikey", ""))
+                with server.lock:
+                    server.stats["polls"] += 1
+                if retry_after:
+                    with server.lock:
+                        server.stats["rate_limited"] += 1
+                    return self._send(429, {"error": {"code": "QuotaExceededError"}},
+                                      {"Retry-After": str(retry_after)})
+                attrs = fake_report(analysis_id, "clean", server.clock.time())["data"]["attributes"]
+                return self._send(200, {"data": {"id": analysis_id, "type": "analysis", "attributes": {
+                    "status": "completed",
+                    "stats": attrs["last_analysis_stats"],
+                    "results": attrs["last_analysis_results"]
+                }}})
+
+            def do_POST(self):
+                path = self.path.split("?", 1)[0]
+                if path not in ("/api/v3/files", "/upload"):
+                    self._drain()
+                    return self._send(404, {"error": {"code": "NotFoundError"}})
+                received = self._drain()
+                with server.lock:
+                    server.stats["uploads"] += 1
+                    server.stats["upload_bytes"] += received
+                analysis_id = hashlib.sha1(os.urandom(8)).hexdigest()
+                return self._send(200, {"data": {"type": "analysis", "id": analysis_id}})
+
+        return Handler
+
+# =============================================
+# SCANNER RUNS
+# =============================================
+
+def load_scanner(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def scanner_layout(workdir):
+    base = os.path.join(workdir, "APKs")
+    return {
+        "base": base,
+        "clean": os.path.join(base, "Clean_and_Safe_APKs"),
+        "infected": os.path.join(base, "Infected_and_High_Risk_APKs"),
+        "too_large": os.path.join(base, "Too_Large_For_VT_APKs"),
+        "pending": os.path.join(base, "Pending_Manual_Review_APKs"),
+        "logs": os.path.join(base, "Termux–VirusTotal_Scan_Logs"),
+        "results": os.path.join(base, "Termux–VirusTotal_Scan_Results"),
+        "state_db": os.path.join(base, "vt_state.sqlite3")
+    }
+
+def run_detailed(server, clock, scan_dir, layout, api_keys, hook=None):
+    """power_scan_all against the mock, returning the virtual time of each verdict"""
+    sys.modules["vt"] = None  # Force the requests backend, which is what the mock speaks
+    m = load_scanner(DETAILED_SCANNER, "bench_detailed_scanner")
+    m.BASE_URL = server.base_url
+    m.API_KEYS = api_keys
+    m.SCAN_DIRECTORIES = [scan_dir]
+    m.APKS_BASE_DIR = layout["base"]
+    m.CLEAN_APKS_DIR = layout["clean"]
+    m.INFECTED_APKS_DIR = layout["infected"]
+    m.SCAN_LOGS_DIR = layout["logs"]
+    m.SCAN_RESULTS_DIR = layout["results"]
+    m.VT_STATE_DB = layout["state_db"]
+    m.VTAPIClient = functools.partial(m.VTAPIClient, clock=clock)
+
+    verdict_times = []
+    scan_apk = m.power_scan_apk
+
+    def timed_scan_apk(*args, **kwargs):
+        result = scan_apk(*args, **kwargs)
+        if result.get("category") in ("clean", "infected"):
+            verdict_times.append(clock.elapsed())
+        return result
+
+    m.power_scan_apk = timed_scan_apk
+    if hook:
+        hook(m)
+    m.power_scan_all()
+    if m.logger:
+        m.logger.close()
+    return verdict_times
+
+def run_large(server, clock, scan_dir, layout, api_keys):
+    """scan_files against the mock, returning the virtual time of each verdict"""
+    m = load_scanner(LARGE_SCANNER, "bench_large_scanner")
+    m.time = clock
+    m.BASE_URL = server.base_url
+    m.API_KEY = api_keys[0]
+    m.SCAN_DIRS = [scan_dir]
+    m.APK_BASE = layout["base"]
+    m.CLEAN_APKS_DIR = layout["clean"]
+    m.INFECTED_APKS_DIR = layout["infected"]
+    m.TOO_LARGE_DIR = layout["too_large"]
+    m.PENDING_DIR = layout["pending"]
+    m.RESULTS_DIR = layout["results"]
+    m.LOGS_DIR = layout["logs"]
+    m.STATE_DB = layout["state_db"]
+    for directory in (layout["clean"], layout["infected"], layout["too_large"],
+                      layout["pending"], layout["results"], layout["logs"]):
+        os.makedirs(directory, exist_ok=True)
+
+    verdict_times = []
+    save_result = m.save_scan_text_result
+
+    def timed_save_result(scan_result):
+        if scan_result.get("category") in ("CLEAN", "INFECTED"):
+            verdict_times.append(clock.elapsed())
+        return save_result(scan_result)
+
+    m.save_scan_text_result = timed_save_result
+    m.scan_files()
+    return verdict_times
+
+def bench_scanner(name, runner, profiles, corpus_dir, args):
+    """Run one scanner on a fresh copy of the corpus and summarize it"""
+    workdir = tempfile.mkdtemp(prefix=f"vt_bench_{name}_")
+    try:
+        scan_dir = os.path.join(workdir, "Download")
+        shutil.copytree(corpus_dir, scan_dir)
+        layout = scanner_layout(workdir)
+        os.makedirs(layout["base"], exist_ok=True)
+
+        clock = VirtualClock()
+        server = MockVTServer(clock, profiles, args.server_rpm, args.fault_rate, args.seed).start()
+        api_keys = [f"bench-key-{n:04d}-{hashlib.sha1(str(n).encode()).hexdigest()[:24]}" for n in range(args.keys)]
+
+        started = time.perf_counter()
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+        with output:
+            verdict_times = runner(server, clock, scan_dir, layout, api_keys)
+        wall = time.perf_counter() - started
+        server.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    stats = server.stats
+    simulated = clock.elapsed()
+    verdicts = len(verdict_times)
+    return {
+        "scanner": name,
+        "apks": len(profiles),
+        "verdicts": verdicts,
+        "simulated_seconds": round(simulated, 1),
+        "apks_per_minute": round(len(profiles) / (simulated / 60), 2) if simulated else None,
+        "verdicts_per_minute": round(verdicts / (simulated / 60), 2) if simulated else None,
+        "time_to_first_verdict": round(verdict_times[0], 1) if verdict_times else None,
+        "lookups": stats["lookups"],
+        "rate_limited": stats["rate_limited"],
+        "not_found": stats["not_found"],
+        "uploads": stats["uploads"],
+        "polls": stats["polls"],
+        "quota_efficiency": round(verdicts / stats["lookups"], 3) if stats["lookups"] else None,
+        "wall_seconds": round(wall, 2)
+    }
+
+# =============================================
+# CORRECTNESS CHECKS
+# =============================================
+
+def hold_back_copy(copy_path, original_hash):
+    """run_detailed hook: hash copy_path only once original_hash is in the scan history"""
+    def hook(m):
+        reported = threading.Event()
+        pipeline_cls, record_history = m.ScanPipeline, m.record_history
+
+        def staged(batches):
+            for batch in batches:
+                yield [item for item in batch if str(item.path) != copy_path]
+                held = [item for item in batch if str(item.path) == copy_path]
+                if held:
+                    reported.wait(60)  # Real seconds; the lookups before it run on the virtual clock
+                    yield held
+
+        def record_and_signal(result, pipeline):
+            record_history(result, pipeline)
+            if result.get("file_hash") == original_hash:
+                m.scan_history.flush()
+                reported.set()
+
+        m.ScanPipeline = lambda vt_client, batches, journal=None: pipeline_cls(vt_client, staged(batches), journal)
+        m.record_history = record_and_signal
+    return hook
+
+def check_late_duplicate(corpus_dir, profiles, args):
+    """A copy hashed after its original was reported is folded or organized, not left behind"""
+    workdir = tempfile.mkdtemp(prefix="vt_check_late_dup_")
+    try:
+        scan_dir = os.path.join(workdir, "Download")
+        shutil.copytree(corpus_dir, scan_dir)
+        layout = scanner_layout(workdir)
+        os.makedirs(layout["base"], exist_ok=True)
+
+        original = original_hash = None
+        for name in sorted(os.listdir(scan_dir)):
+            with open(os.path.join(scan_dir, name), "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            if profiles.get(digest) in ("clean", "infected"):
+                original, original_hash = name, digest
+                break
+        if original is None:
+            return "corpus has no APK VirusTotal knows; raise -n"
+        copy_path = os.path.join(scan_dir, f"zzz_dup_of_{original}")
+        shutil.copyfile(os.path.join(scan_dir, original), copy_path)
+
+        clock = VirtualClock()
+        server = MockVTServer(clock, profiles, args.server_rpm, args.fault_rate, args.seed).start()
+        try:
+            run_detailed(server, clock, scan_dir, layout, ["bench-key-check"],
+                         hook=hold_back_copy(copy_path, original_hash))
+        finally:
+            server.stop()
+
+        if os.path.exists(copy_path):
+            return f"{os.path.basename(copy_path)} was left in the scan directory"
+        organized = [os.path.join(layout[c], original) for c in ("clean", "infected")]
+        if not any(os.path.exists(path) for path in organized):
+            return f"{original} is missing from the Clean and Infected folders"
+        return None
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def check_signed_identity(corpus_dir, profiles, args):
+    """read_apk_identity names the v2 signer and the compiled manifest's package and version"""
+    import vt_common
+
+    workdir = tempfile.mkdtemp(prefix="vt_check_identity_")
+    try:
+        certificate = b"\x30\x82\x01\x0a" + hashlib.sha512(b"bench signer").digest() * 4
+        path = os.path.join(workdir, "signed.apk")
+        v2_signed_apk(path, certificate, compiled_manifest("com.bench.signed", 4021, "4.2.1"))
+        expected = vt_common.ApkIdentity(hashlib.sha256(certificate).hexdigest(), "com.bench.signed", 4021, "4.2.1")
+        identity = vt_common.read_apk_identity(path)
+        if identity != expected:
+            return f"read {identity}, expected {expected}"
+
+        trust = vt_common.SignerTrust(os.path.join(workdir, "trust.sqlite3"))
+        try:
+            if trust.is_seeded() or trust.seed([workdir]) != 1 or not trust.is_seeded():
+                return "seeding from the Clean folder did not run exactly once"
+            if not trust.lookup(identity):
+                return "the seeded signer + package is not trusted"
+        finally:
+            trust.close()
+        return None
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def check_malformed_apks(corpus_dir, profiles, args):
+    """APKs whose manifest cannot be decoded still hash, look up and come out of the engine"""
+    import vt_common
+    from pathlib import Path
+
+    workdir = tempfile.mkdtemp(prefix="vt_check_malformed_")
+    try:
+        scan_dir = os.path.join(workdir, "Download")
+        os.makedirs(scan_dir)
+        for defect in ("encrypted", "bad_deflate", "unsupported"):
+            malformed_apk(os.path.join(scan_dir, f"{defect}.apk"), defect)
+        v2_signed_apk(os.path.join(scan_dir, "zz_signed.apk"), b"\x30\x03\x02\x01\x01",
+                      compiled_manifest("com.bench.signed", 1, "1.0"))
+        paths = sorted(Path(scan_dir).iterdir())
+
+        db_path = os.path.join(workdir, "state.sqlite3")
+        trust = vt_common.SignerTrust(db_path)
+        try:
+            trust.seed([scan_dir])
+        except Exception as e:
+            return f"seeding a folder of malformed APKs raised {e!r}"
+        finally:
+            trust.close()
+
+        engine = vt_common.ScanEngine(lambda file_hash: {"status": "not_found"}, [paths], db_path)
+        yielded = [file_info["apk_name"] for _, file_info in engine.run()]
+        if len(yielded) != len(paths) or engine.hash_failures:
+            return f"engine yielded {sorted(yielded)} of {len(paths)} files ({engine.hash_failures} hash failures)"
+        return None
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+CHECKS = [
+    ("late duplicate is folded", check_late_duplicate),
+    ("v2 signer and compiled manifest", check_signed_identity),
+    ("malformed manifests do not stop the scan", check_malformed_apks)
+]
+
+def run_checks(args):
+    """Run every correctness scenario, return how many failed"""
+    corpus_dir = tempfile.mkdtemp(prefix="vt_bench_corpus_")
+    failures = 0
+    try:
+        profiles = build_corpus(corpus_dir, args.apks, random.Random(args.seed))
+        for name, check in CHECKS:
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+            with output:
+                problem = check(corpus_dir, profiles, args)
+            if problem:
+                failures += 1
+                print(f"      ❌ {name}: {problem}")
+            else:
+                print(f"      ✅ {NEON_GREEN}{name}{RESET}")
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+    return failures
+
+# =============================================
+# REPORTING
+# =============================================
+
+def print_report(summaries, args):
+    print(f"{BOLD}📊 VirusTotal Scanner Benchmark{RESET} "
+          f"({args.apks} APKs, {args.keys} key(s), mock quota {args.server_rpm}/min, fault rate {args.fault_rate})")
+    print()
+    for s in summaries:
+        print(f"{NEON_BLUE}{BOLD}🔍 {s['scanner']}{RESET}")
+        print(f"      ⚡ APKs/minute: {NEON_GREEN}{s['apks_per_minute']}{RESET}"
+              f" ({s['verdicts_per_minute']} verdicts/minute)")
+        print(f"      ⏱️  Time to first verdict: {s['time_to_first_verdict']}s simulated")
+        print(f"      🎯 Quota efficiency: {s['quota_efficiency']} verdicts per request"
+              f" ({s['verdicts']} verdicts / {s['lookups']} lookups)")
+        limit_color = NEON_YELLOW if s["rate_limited"] else NEON_GREEN
+        print(f"      🚦 429 responses: {limit_color}{s['rate_limited']}{RESET}, 404s: {s['not_found']}, uploads: {s['uploads']}")
+        print(f"      🕐 {s['simulated_seconds']}s simulated in {s['wall_seconds']}s wall")
+        print()
+
+def serve(args):
+    """Run only the mock server on a real clock, for poking at it by hand"""
+    clock = VirtualClock()
+    clock.sleep = time.sleep
+    clock.elapsed = time.monotonic
+    server = MockVTServer(clock, {}, args.server_rpm, args.fault_rate, args.seed).start()
+    print(f"{BOLD}🧪 Mock VirusTotal listening on {server.base_url}{RESET} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the VirusTotal APK scanners")
+    parser.add_argument("mode", nargs="?", choices=["run", "serve", "check"], default="run")
+    parser.add_argument("-n", "--apks", type=int, default=BENCH_CONFIG["apks"])
+    parser.add_argument("--keys", type=int, default=BENCH_CONFIG["keys"])
+    parser.add_argument("--server-rpm", type=int, default=BENCH_CONFIG["server_rpm"])
+    parser.add_argument("--fault-rate", type=float, default=BENCH_CONFIG["fault_rate"])
+    parser.add_argument("--seed", type=int, default=BENCH_CONFIG["seed"])
+    parser.add_argument("--scanner", choices=["detailed", "large", "both"], default="both")
+    parser.add_argument("--json", action="store_true", help="Print summaries as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show scanner output")
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        serve(args)
+        return
+    if args.mode == "check":
+        sys.exit(1 if run_checks(args) else 0)
+
+    corpus_dir = tempfile.mkdtemp(prefix="vt_bench_corpus_")
+    try:
+        profiles = build_corpus(corpus_dir, args.apks, random.Random(args.seed))
+        runners = []
+        if args.scanner in ("detailed", "both"):
+            runners.append(("detailed_apk_scanner", run_detailed))
+        if args.scanner in ("large", "both"):
+            runners.append(("large_apk_scanner", run_large))
+        summaries = [bench_scanner(name, runner, profiles, corpus_dir, args) for name, runner in runners]
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+    else:
+        print_report(summaries, args)
+
+if __name__ == "__main__":
+    main()
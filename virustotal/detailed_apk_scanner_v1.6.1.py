@@ -1,13 +1,28 @@
 import time
 import requests
 import os
+import sys
 import hashlib
 import shutil
 import random
 import json
+import re
+import atexit
+import queue
+import select
+import struct
+import ctypes
+import functools
+import sqlite3
+import threading
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 from dotenv import load_dotenv
+from vt_common import (
+    DISCOVERY_CONFIG, QUOTA_CONFIG, ApkIdentity, ApkOrganizer, DetectionMatcher, QuotaLedger,
+    ScanEngine, SignerTrust, VerdictCache, dedupe_copy, discover_apks, found_result_from_report,
+    key_fingerprint, matches_discovery_rules, place_file, retry_after_seconds, shared_transport
+)
 
 # Load environment variables
 load_dotenv()
@@ -17,15 +32,41 @@ load_dotenv()
 # =============================================
 VERSION = "1.6.1"
 API_KEY = os.getenv("VT_API_KEY")
-HEADERS = {"x-apikey": API_KEY}
+# Optional comma-separated pool of keys; falls back to the single VT_API_KEY
+API_KEYS = [k.strip() for k in os.getenv("VT_API_KEYS", "").split(",") if k.strip()] or ([API_KEY] if API_KEY else [])
 BASE_URL = "https://www.virustotal.com/api/v3"
 
 # Rate Limit Configuration
+# Per-key pacing and daily/monthly quota live in vt_common.QUOTA_CONFIG, shared by both scanners
 RATE_LIMIT_CONFIG = {
-    "requests_per_minute": 4,  # VT free tier limit
+    "requests_per_minute": QUOTA_CONFIG["requests_per_minute"],
     "max_retries": 3,
     "backoff_factor": 2,
-    "batch_size": 4
+    "burst": QUOTA_CONFIG["burst"],
+    "max_in_flight": 4  # Concurrent lookups per key (requests backend only)
+}
+
+# Pipeline Configuration
+PIPELINE_CONFIG = {
+    "queue_size": 8  # Bounded hand-off between hashing, lookup and organize stages
+}
+
+# Watch Mode Configuration
+WATCH_CONFIG = {
+    "poll_interval": 5,  # Seconds between scandir snapshots (and inotify wake-ups)
+    "stable_seconds": 10  # A new APK must keep the same size this long before it is queued
+}
+
+# Scan History Configuration
+HISTORY_CONFIG = {
+    "flush_every": 8,  # Buffered records written per transaction
+    "write_text_reports": True  # Also render each record to SCAN_RESULTS_DIR as .txt
+}
+
+# Console Output Configuration
+OUTPUT_CONFIG = {
+    "mode": "tty",  # "tty": full colour report, "quiet": one line per APK plus the summary, "json": NDJSON events
+    "buffer_bytes": 64 * 1024  # Console text held before a forced write
 }
 
 # Directory Configuration
@@ -42,6 +83,17 @@ SCAN_LOGS_DIR = f"{APKS_BASE_DIR}/Termux–VirusTotal_Scan_Logs"
 SCAN_RESULTS_DIR = f"{APKS_BASE_DIR}/Termux–VirusTotal_Scan_Results"
 WHITELIST_FILE = f"{APKS_BASE_DIR}/whitelist.json"
 BLACKLIST_FILE = f"{APKS_BASE_DIR}/blacklist.json"
+VT_STATE_DB = f"{APKS_BASE_DIR}/vt_state.sqlite3"
+
+# Session Log Configuration
+LOG_CONFIG = {
+    "flush_interval": 2.0,  # Seconds a buffered line may wait before hitting disk
+    "batch_size": 64,  # Lines per write once the buffer fills
+    "max_bytes": 2 * 1024 * 1024,  # Start a new log segment past this size
+    "max_age_days": 3,  # Prune segments older than this
+    "max_files": 30,  # Keep at most this many segments
+    "index_file": "log_index.json"  # Segments this logger wrote, kept in SCAN_LOGS_DIR
+}
 
 # Backup Configuration
 SCRIPT_DIR = "/data/data/com.termux/files/home/kh-scripts/virustotal"
@@ -124,10 +176,90 @@ def get_apk_color(apk_name):
     except Exception:
         return random.choice(TRUE_COLORS)
 
+@functools.lru_cache(maxsize=4096)
 def colorize_apk_name(apk_name):
     r, g, b = get_apk_color(apk_name)
     return f"\033[38;2;{r};{g};{b}m{apk_name}{RESET}"
 
+# =============================================
+# CONSOLE RENDERER
+# =============================================
+
+class ConsoleRenderer:
+    """Single buffered sink for scan output in tty, quiet or json (NDJSON) mode.
+    
+    Detail lines render only in tty mode, summary lines in tty and quiet mode,
+    and events only in json mode, so stdout then carries nothing but NDJSON.
+    Text is written when flush() is called (the pipeline went idle) or the
+    buffer fills, instead of one terminal write per line.
+    """
+    def __init__(self, mode=None, stream=None):
+        self.mode = mode or OUTPUT_CONFIG["mode"]
+        self.stream = stream
+        self.parts = []
+        self.size = 0
+        self.lock = threading.Lock()
+    
+    def _write(self, text):
+        with self.lock:
+            self.parts.append(text)
+            self.size += len(text)
+            if self.size >= OUTPUT_CONFIG["buffer_bytes"]:
+                self._drain()
+    
+    def _drain(self):
+        if self.parts:
+            stream = self.stream or sys.stdout
+            stream.write("".join(self.parts))
+            stream.flush()
+            self.parts = []
+            self.size = 0
+    
+    def line(self, text=""):
+        """Detail line, tty mode only"""
+        if self.mode == "tty":
+            self._write(f"{text}\n")
+    
+    def summary(self, text=""):
+        """Line that is still shown with --quiet"""
+        if self.mode != "json":
+            self._write(f"{text}\n")
+    
+    def event(self, kind, **fields):
+        """One NDJSON object, json mode only"""
+        if self.mode == "json":
+            self._write(json.dumps({"event": kind, "time": round(time.time(), 3), **fields}, default=str) + "\n")
+    
+    def result(self, result, file_number, total_files):
+        """Per-APK outcome: one verdict line with --quiet, a result event with --json"""
+        if self.mode == "json":
+            self.event("result", **result)
+            return
+        if self.mode != "quiet":
+            return
+        category = result.get("category", "unknown")
+        color, icon = QUIET_CATEGORY_STYLE.get(category, QUIET_CATEGORY_STYLE["unknown"])
+        if "total" in result:
+            detail = f"{result['malicious']} malicious, {result['suspicious']} suspicious of {result['total']}"
+        else:
+            detail = result.get("reason", "")
+        self._write(f"{icon} [{file_number}/{total_files}] {color}{category.upper():<8}{RESET} "
+                    f"{colorize_apk_name(result.get('file', ''))}  {detail}\n")
+    
+    def flush(self):
+        with self.lock:
+            self._drain()
+
+# Colour and icon of the one-line verdict printed per APK with --quiet
+QUIET_CATEGORY_STYLE = {
+    "clean": (NEON_GREEN, "✅"),
+    "infected": (NEON_RED, "🚨"),
+    "unknown": (NEON_YELLOW, "❓")
+}
+
+console = ConsoleRenderer()
+atexit.register(console.flush)
+
 # =============================================
 # WHITELIST & BLACKLIST MANAGEMENT
 # =============================================
@@ -136,6 +268,10 @@ class DetectionListManager:
     def __init__(self):
         self.whitelist = self.load_list(WHITELIST_FILE)
         self.blacklist = self.load_list(BLACKLIST_FILE)
+        # Bumped on every list change; the compiled matcher is rebuilt only then
+        self.version = 0
+        self._matcher = None
+        self._matcher_version = None
     
     def load_list(self, file_path):
         """Load whitelist or blacklist from JSON file"""
@@ -160,6 +296,7 @@ class DetectionListManager:
     def add_to_whitelist(self, detection_pattern):
         """Add a detection pattern to whitelist"""
         self.whitelist.add(detection_pattern.strip())
+        self.version += 1
         if self.save_list(WHITELIST_FILE, self.whitelist):
             print(f"{NEON_GREEN}✅ Added to whitelist: {detection_pattern}{RESET}")
             return True
@@ -168,6 +305,7 @@ class DetectionListManager:
     def add_to_blacklist(self, detection_pattern):
         """Add a detection pattern to blacklist"""
         self.blacklist.add(detection_pattern.strip())
+        self.version += 1
         if self.save_list(BLACKLIST_FILE, self.blacklist):
             print(f"{NEON_RED}✅ Added to blacklist: {detection_pattern}{RESET}")
             return True
@@ -177,6 +315,7 @@ class DetectionListManager:
         """Remove a detection pattern from whitelist"""
         if detection_pattern in self.whitelist:
             self.whitelist.remove(detection_pattern)
+            self.version += 1
             if self.save_list(WHITELIST_FILE, self.whitelist):
                 print(f"{NEON_YELLOW}✅ Removed from whitelist: {detection_pattern}{RESET}")
                 return True
@@ -188,6 +327,7 @@ class DetectionListManager:
         """Remove a detection pattern from blacklist"""
         if detection_pattern in self.blacklist:
             self.blacklist.remove(detection_pattern)
+            self.version += 1
             if self.save_list(BLACKLIST_FILE, self.blacklist):
                 print(f"{NEON_YELLOW}✅ Removed from blacklist: {detection_pattern}{RESET}")
                 return True
@@ -209,6 +349,7 @@ class DetectionListManager:
     def clear_whitelist(self):
         """Clear all whitelist entries"""
         self.whitelist.clear()
+        self.version += 1
         if self.save_list(WHITELIST_FILE, self.whitelist):
             print(f"{NEON_YELLOW}✅ Whitelist cleared{RESET}")
             return True
@@ -217,55 +358,130 @@ class DetectionListManager:
     def clear_blacklist(self):
         """Clear all blacklist entries"""
         self.blacklist.clear()
+        self.version += 1
         if self.save_list(BLACKLIST_FILE, self.blacklist):
             print(f"{NEON_YELLOW}✅ Blacklist cleared{RESET}")
             return True
         return False
     
+    def get_matcher(self):
+        """Compiled matcher for the current lists, rebuilt only after a change"""
+        if self._matcher is None or self._matcher_version != self.version:
+            self._matcher = DetectionMatcher(self.whitelist, self.blacklist)
+            self._matcher_version = self.version
+        return self._matcher
+    
+    def classify(self, vendor, result):
+        """Whitelist, blacklist, safe and malicious labels for a detection in one pass"""
+        return self.get_matcher().classify(vendor, result)
+    
     def is_whitelisted(self, vendor, result):
         """Check if a detection is whitelisted"""
-        detection_string = f"{vendor}: {result}"
-        for pattern in self.whitelist:
-            if pattern.lower() in detection_string.lower():
-                return True
-        return False
+        return "whitelisted" in self.classify(vendor, result)
     
     def is_blacklisted(self, vendor, result):
         """Check if a detection is blacklisted"""
-        detection_string = f"{vendor}: {result}"
-        for pattern in self.blacklist:
-            if pattern.lower() in detection_string.lower():
-                return True
-        return False
+        return "blacklisted" in self.classify(vendor, result)
 
 # Initialize detection list manager
 detection_manager = DetectionListManager()
 
 # =============================================
-# ENHANCED VT CLIENT WITH EXPONENTIAL BACKOFF
+# VERDICT REPORTS (cache lives in vt_common)
 # =============================================
 
-class VTAPIClient:
+def report_to_json(full_data):
+    """Normalize an SDK object or requests JSON into the /files/{hash} JSON shape"""
+    if hasattr(full_data, 'to_dict'):
+        return {"data": full_data.to_dict()}
+    return full_data
+
+# =============================================
+# MULTI-KEY API POOL
+# =============================================
+
+class APIKeySlot:
+    """One API key and its session counters; pacing lives in the shared QuotaLedger"""
     def __init__(self, api_key):
         self.api_key = api_key
-        self.client = None
+        self.key_id = key_fingerprint(api_key)
+        self.label = f"…{api_key[-4:]}"
+        self.requests = 0
+        self.rate_limits = 0
+
+class KeyPool:
+    """Spreads lookups across API keys, skipping exhausted or rate-limited keys.
+    
+    Every reservation goes through the SQLite QuotaLedger, so other scanner
+    processes using the same keys share the same per-minute pacing, 429 blocks
+    and daily/monthly counts. clock is anything shaped like the time module; the
+    benchmark passes a virtual clock so pacing and backoff run in simulated time.
+    """
+    def __init__(self, api_keys, ledger, clock=time):
+        self.keys = [APIKeySlot(k) for k in dict.fromkeys(api_keys)]
+        self.ledger = ledger
+        self.clock = clock
+        self.limits = {
+            "requests_per_minute": RATE_LIMIT_CONFIG["requests_per_minute"],
+            "burst": RATE_LIMIT_CONFIG["burst"],
+            "daily_limit": QUOTA_CONFIG["daily_limit"],
+            "monthly_limit": QUOTA_CONFIG["monthly_limit"]
+        }
+    
+    def acquire(self):
+        """Block until some key may send a request, return it (None when every key is exhausted)"""
+        while True:
+            waits = []
+            for key in self.keys:
+                wait = self.ledger.reserve(key.key_id, self.clock.time(), **self.limits)
+                if wait is None:
+                    continue
+                if wait <= 0:
+                    return key
+                waits.append(wait)
+            if not waits:
+                return None
+            self.clock.sleep(max(min(waits), 0.05))
+    
+    def record(self, key):
+        key.requests += 1
+    
+    def mark_rate_limited(self, key, delay):
+        """Bench a key after a 429, for this and every other scanner process"""
+        key.rate_limits += 1
+        now = self.clock.time()
+        self.ledger.block(key.key_id, now + delay, now)
+
+# =============================================
+# ENHANCED VT CLIENT WITH EXPONENTIAL BACKOFF
+# =============================================
+
+class VTAPIClient:
+    def __init__(self, api_keys, clock=time):
+        if isinstance(api_keys, str):
+            api_keys = [api_keys]
+        self.clients = {}
         self.using_sdk = False
+        self.ledger = QuotaLedger(VT_STATE_DB)
+        self.key_pool = KeyPool(api_keys, self.ledger, clock)
+        # One kept-alive connection per lookup that can be in flight at once
+        self.transport = shared_transport(RATE_LIMIT_CONFIG["max_in_flight"] * len(self.key_pool.keys))
+        self.stats_lock = threading.Lock()
+        self.verdict_cache = VerdictCache(VT_STATE_DB, on_error=lambda message: logger and logger.log(message, "ERROR"))
         self.usage_stats = {
             "sdk": 0, 
             "requests": 0, 
             "sandbox": 0, 
             "errors": 0, 
             "rate_limits": 0,
-            "requests_per_minute": [],
-            "daily_usage": 0,
-            "monthly_usage": 0,
+            "cache_hits": 0,
             "last_request_time": None
         }
         
     def initialize(self):
         try:
             import vt
-            self.client = vt.Client(self.api_key)
+            self.clients = {key.key_id: vt.Client(key.api_key) for key in self.key_pool.keys}
             self.using_sdk = True
             return True
         except ImportError:
@@ -276,208 +492,201 @@ class VTAPIClient:
             return False
     
     def close(self):
-        if self.client:
-            self.client.close()
-    
-    def track_request(self):
-        """Track request timing for rate limit management"""
-        now = datetime.now()
-        if self.usage_stats["last_request_time"]:
-            time_diff = (now - self.usage_stats["last_request_time"]).total_seconds()
-        
-        # Track requests per minute
-        self.usage_stats["requests_per_minute"].append(now)
-        # Clean old entries (older than 1 minute)
-        one_min_ago = now - timedelta(minutes=1)
-        self.usage_stats["requests_per_minute"] = [
-            t for t in self.usage_stats["requests_per_minute"] 
-            if t > one_min_ago
-        ]
-        
-        self.usage_stats["last_request_time"] = now
-        self.usage_stats["daily_usage"] += 1
+        for client in self.clients.values():
+            client.close()
+        self.verdict_cache.close()
+        self.ledger.close()
+    
+    def track_request(self, key):
+        """Count a request for this session's stats (the ledger already counted it)"""
+        with self.stats_lock:
+            self.key_pool.record(key)
+            self.usage_stats["last_request_time"] = datetime.now()
+    
+    def count_stat(self, name):
+        """Bump a usage counter; lookups run on several worker threads"""
+        with self.stats_lock:
+            self.usage_stats[name] += 1
     
     def get_current_rpm(self):
-        """Get current requests per minute"""
-        return len(self.usage_stats["requests_per_minute"])
-    
-    def calculate_dynamic_delay(self):
-        """Calculate dynamic delay based on current usage"""
-        current_rpm = self.get_current_rpm()
-        if current_rpm >= RATE_LIMIT_CONFIG["requests_per_minute"]:
-            return 60  # Wait a full minute if at limit
-        
-        # Dynamic delay based on how close we are to the limit
-        base_delay = 15
-        if current_rpm > RATE_LIMIT_CONFIG["requests_per_minute"] * 0.75:
-            base_delay = 30
-        elif current_rpm > RATE_LIMIT_CONFIG["requests_per_minute"] * 0.5:
-            base_delay = 20
-        
-        return base_delay
+        """Requests sent this minute across every scanner process, per the ledger"""
+        return sum(self.ledger.usage(key.key_id)["minute"] for key in self.key_pool.keys)
     
     def make_api_request_with_retry(self, file_hash, max_retries=None, base_delay=None):
-        """Enhanced API request with exponential backoff retry logic"""
+        """Token-paced API request with exponential backoff on rate limits"""
         if max_retries is None:
             max_retries = RATE_LIMIT_CONFIG["max_retries"]
         if base_delay is None:
             base_delay = RATE_LIMIT_CONFIG["backoff_factor"] * 15
         
+        # Known hashes never touch the network or the quota
+        cached_report = self.verdict_cache.get(file_hash)
+        if cached_report:
+            self.count_stat("cache_hits")
+            return found_result_from_report(cached_report, cached=True)
+        
         for attempt in range(max_retries):
-            result = self.get_file_analysis(file_hash)
+            key = self.key_pool.acquire()
+            if key is None:
+                if logger:
+                    logger.log(f"All API keys exhausted, skipping {file_hash[:16]}...", "WARNING")
+                return {"status": "quota_exhausted"}
+            
+            result = self.get_file_analysis(file_hash, key)
             
+            if result["status"] == "found":
+                self.verdict_cache.put(file_hash, report_to_json(result["full_data"]))
             if result["status"] != "rate_limited":
                 return result
             
-            # Exponential backoff
-            delay = base_delay * (2 ** attempt)
-            print(f"      ⏳ Rate limited, waiting {delay} seconds (attempt {attempt + 1}/{max_retries})")
+            # Honour Retry-After, else back off exponentially; the other keys keep going
+            delay = result.get("retry_after") or base_delay * (2 ** attempt)
+            console.line(f"      ⏳ Rate limited on key {key.label}, holding it for {delay} seconds (attempt {attempt + 1}/{max_retries})")
+            console.flush()
             if logger:
-                logger.log(f"Rate limited, waiting {delay} seconds (attempt {attempt + 1})", "WARNING")
-            time.sleep(delay)
+                logger.log(f"Rate limited on key {key.label}, waiting {delay} seconds (attempt {attempt + 1})", "WARNING")
+            self.key_pool.mark_rate_limited(key, delay)
         
         return {"status": "rate_limited_after_retries"}
     
-    def get_file_analysis(self, file_hash):
-        if self.using_sdk and self.client:
-            self.usage_stats["sdk"] += 1
-            self.track_request()
-            return self._get_file_analysis_sdk(file_hash)
+    def get_file_analysis(self, file_hash, key):
+        if self.using_sdk and self.clients:
+            self.count_stat("sdk")
+            self.track_request(key)
+            return self._get_file_analysis_sdk(file_hash, key)
         else:
-            self.usage_stats["requests"] += 1
-            self.track_request()
-            return self._get_file_analysis_requests(file_hash)
+            self.count_stat("requests")
+            self.track_request(key)
+            return self._get_file_analysis_requests(file_hash, key)
     
-    def _get_file_analysis_sdk(self, file_hash):
+    def _get_file_analysis_sdk(self, file_hash, key):
         try:
-            file_object = self.client.get_object(f"/files/{file_hash}")
-            return {
-                "status": "found",
-                "file_object": file_object,
-                "stats": file_object.last_analysis_stats,
-                "full_data": file_object
-            }
+            file_object = self.clients[key.key_id].get_object(f"/files/{file_hash}")
+            return found_result_from_report(report_to_json(file_object))
         except Exception as e:
-            self.usage_stats["errors"] += 1
+            self.count_stat("errors")
             error_msg = str(e)
             if "NotFoundError" in error_msg:
                 return {"status": "not_found"}
             elif "QuotaExceededError" in error_msg:
-                self.usage_stats["rate_limits"] += 1
+                self.count_stat("rate_limits")
                 return {"status": "rate_limited"}
             else:
                 return {"status": "error", "error": error_msg}
     
-    def _get_file_analysis_requests(self, file_hash):
+    def _get_file_analysis_requests(self, file_hash, key):
         try:
             url = f"{BASE_URL}/files/{file_hash}"
-            response = requests.get(url, headers=HEADERS, timeout=30)
+            response = self.transport.get(url, key.api_key, timeout=30)
             
             if response.status_code == 429:
-                self.usage_stats["rate_limits"] += 1
-                return {"status": "rate_limited"}
+                self.count_stat("rate_limits")
+                return {"status": "rate_limited", "retry_after": retry_after_seconds(response)}
                 
             if response.status_code == 200:
-                data = response.json()
-                stats = data["data"]["attributes"]["last_analysis_stats"]
-                return {
-                    "status": "found", 
-                    "malicious": stats["malicious"],
-                    "suspicious": stats["suspicious"],
-                    "undetected": stats["undetected"],
-                    "harmless": stats["harmless"],
-                    "total": sum(stats.values()),
-                    "full_data": data
-                }
+                return found_result_from_report(response.json())
             elif response.status_code == 404:
                 return {"status": "not_found"}
             else:
-                self.usage_stats["errors"] += 1
+                self.count_stat("errors")
                 return {"status": "api_error", "code": response.status_code}
                 
         except requests.exceptions.Timeout:
-            self.usage_stats["errors"] += 1
+            self.count_stat("errors")
             return {"status": "timeout"}
         except Exception as e:
-            self.usage_stats["errors"] += 1
+            self.count_stat("errors")
             return {"status": "error", "error": str(e)}
     
     def print_usage_stats(self):
+        console.event("usage", **self.usage_stats)
         total_api_calls = self.usage_stats["sdk"] + self.usage_stats["requests"]
         if total_api_calls > 0:
             current_rpm = self.get_current_rpm()
             rpm_color = NEON_GREEN if current_rpm < RATE_LIMIT_CONFIG["requests_per_minute"] * 0.75 else NEON_YELLOW
             rpm_color = NEON_RED if current_rpm >= RATE_LIMIT_CONFIG["requests_per_minute"] else rpm_color
             
-            print(f"{BOLD}📊 API Usage Statistics:{RESET}")
-            print(f"      🔬 SDK Requests: {self.usage_stats['sdk']} ({self.usage_stats['sdk']/total_api_calls*100:.1f}%)")
-            print(f"      🌐 Requests Fallback: {self.usage_stats['requests']} ({self.usage_stats['requests']/total_api_calls*100:.1f}%)")
-            print(f"      🔍 Sandbox Analyses: {self.usage_stats['sandbox']}")
-            print(f"      📈 Current RPM: {rpm_color}{current_rpm}/{RATE_LIMIT_CONFIG['requests_per_minute']}{RESET}")
-            print(f"      📅 Daily Usage: {self.usage_stats['daily_usage']}")
+            console.line(f"{BOLD}📊 API Usage Statistics:{RESET}")
+            console.line(f"      🔬 SDK Requests: {self.usage_stats['sdk']} ({self.usage_stats['sdk']/total_api_calls*100:.1f}%)")
+            console.line(f"      🌐 Requests Fallback: {self.usage_stats['requests']} ({self.usage_stats['requests']/total_api_calls*100:.1f}%)")
+            console.line(f"      🔍 Sandbox Analyses: {self.usage_stats['sandbox']}")
+            console.line(f"      ⚡ Cache Hits: {self.usage_stats['cache_hits']}")
+            console.line(f"      📈 Current RPM: {rpm_color}{current_rpm}/{RATE_LIMIT_CONFIG['requests_per_minute'] * len(self.key_pool.keys)}{RESET}")
             
             # Colorize errors and rate limits
             errors_color = NEON_YELLOW if self.usage_stats['errors'] == 0 else NEON_RED
             limits_color = NEON_YELLOW if self.usage_stats['rate_limits'] == 0 else NEON_RED
             
-            print(f"      ⚠️  Errors: {errors_color}{self.usage_stats['errors']}{RESET}")
-            print(f"      🚦 Rate Limits: {limits_color}{self.usage_stats['rate_limits']}{RESET}")
+            console.line(f"      ⚠️  Errors: {errors_color}{self.usage_stats['errors']}{RESET}")
+            console.line(f"      🚦 Rate Limits: {limits_color}{self.usage_stats['rate_limits']}{RESET}")
+        
+        self.print_key_headroom()
+    
+    def print_key_headroom(self):
+        """Show per-key usage and remaining daily/monthly quota from the ledger"""
+        console.line(f"{BOLD}🔑 API Key Headroom:{RESET}")
+        for key in self.key_pool.keys:
+            usage = self.ledger.usage(key.key_id)
+            day_left = max(0, QUOTA_CONFIG["daily_limit"] - usage["day"])
+            month_left = max(0, QUOTA_CONFIG["monthly_limit"] - usage["month"])
+            day_color = NEON_GREEN if day_left > QUOTA_CONFIG["daily_limit"] * 0.25 else NEON_YELLOW
+            day_color = NEON_RED if day_left == 0 else day_color
+            blocked = usage["blocked_until"] - time.time()
+            status = f" {NEON_RED}(rate limited {blocked:.0f}s){RESET}" if blocked > 0 else ""
+            console.line(f"      🔐 {key.label}: {key.requests} this run, "
+                  f"RPM {usage['minute']}/{RATE_LIMIT_CONFIG['requests_per_minute']}, "
+                  f"today {day_color}{day_left}/{QUOTA_CONFIG['daily_limit']} left{RESET}, "
+                  f"month {month_left}/{QUOTA_CONFIG['monthly_limit']} left{status}")
 
 # =============================================
-# BATCH PROCESSING SYSTEM
+# PIPELINED SCAN: HASH -> LOOKUP -> ORGANIZE
 # =============================================
 
-def collect_hashes_batch(apk_files):
-    """Collect all hashes first for batch processing"""
-    print(f"{BOLD}🔐 Precomputing hashes for batch processing...{RESET}")
-    hash_map = {}
-    
-    for i, apk_file in enumerate(apk_files, 1):
-        apk_name = apk_file.name
-        print(f"      [{i}/{len(apk_files)}] Hashing: {colorize_apk_name(apk_name)}")
-        
-        file_hash = calculate_sha256(apk_file)
-        if file_hash:
-            hash_map[file_hash] = {
-                'apk_file': apk_file,
-                'apk_name': apk_name
-            }
-        else:
-            print(f"      ❌ {NEON_RED}Failed to hash: {apk_name}{RESET}")
-    
-    print(f"      ✅ {NEON_GREEN}Successfully hashed {len(hash_map)}/{len(apk_files)} files{RESET}")
-    print()  # Empty line after hashing completion
-    return hash_map
+class ScanPipeline(ScanEngine):
+    """The shared scan engine, lookup-only, with this scanner's journal and logging.
 
-def process_hash_batch(hash_batch, vt_client, batch_num, total_batches):
-    """Process a batch of hashes"""
-    batch_results = {}
+    Uploads stay with large_apk_scanner, so a 404 comes back as not_found with
+    the upload lane its size would take.
+    """
+    def __init__(self, vt_client, batches, journal=None):
+        # The vt SDK client is bound to one event loop, so SDK lookups stay on one thread
+        if vt_client.using_sdk:
+            workers = 1
+        else:
+            workers = RATE_LIMIT_CONFIG["max_in_flight"] * len(vt_client.key_pool.keys)
+        super().__init__(vt_client.make_api_request_with_retry, batches, VT_STATE_DB,
+                         workers=workers, queue_size=PIPELINE_CONFIG["queue_size"],
+                         clean_dirs=[CLEAN_APKS_DIR])
+        self.vt_client = vt_client
+        self.journal = journal
+        self.resumed = 0
+    
+    def on_hash_failed(self, apk_file, error):
+        console.summary(f"      ❌ {NEON_RED}Failed to hash: {apk_file.name}{RESET}")
+        console.event("hash_failed", file=apk_file.name, path=str(apk_file), error=str(error))
+        if logger:
+            logger.log_error(apk_file.name, f"Error calculating hash: {error}")
     
-    print(f"{BOLD}🔄 Processing Batch {batch_num}/{total_batches} ({len(hash_batch)} files){RESET}")
+    def on_hashed(self, file_hash, apk_file):
+        if logger:
+            logger.log(f"Hashed {apk_file.name}: {file_hash}")
+        if self.journal:
+            if file_hash in self.journal.carried_over:
+                # Finished by an interrupted earlier run; this session's reports never land here
+                self.resumed += 1
+                return False
+            self.journal.record_hashed(file_hash, apk_file)
+        return True
     
-    for i, (file_hash, file_info) in enumerate(hash_batch.items(), 1):
-        apk_file = file_info['apk_file']
-        apk_name = file_info['apk_name']
-        
-        print(f"      📁 [{i}/{len(hash_batch)}] Scanning: {colorize_apk_name(apk_name)}")
-        
-        # Use enhanced retry logic
-        hash_result = vt_client.make_api_request_with_retry(file_hash)
-        batch_results[file_hash] = {
-            'apk_file': apk_file,
-            'apk_name': apk_name,
-            'scan_result': hash_result
-        }
-        
-        # Dynamic delay between requests in same batch
-        if i < len(hash_batch):
-            dynamic_delay = vt_client.calculate_dynamic_delay()
-            if dynamic_delay > 0:
-                print(f"      ⏳ Waiting {dynamic_delay}s before next request...")
-                time.sleep(dynamic_delay)
+    def known_result(self, file_hash):
+        if self.journal and file_hash in self.journal.carried_not_found:
+            # Answered before the interruption; this session's 404s and found reports go back to the cache and API
+            return {"status": "not_found"}
+        return None
     
-    print()  # Empty line after batch processing
-    return batch_results
+    def on_lookup(self, file_hash, result):
+        if self.journal:
+            self.journal.record_lookup(file_hash, result["status"])
 
 # =============================================
 # ENHANCED COMPREHENSIVE ANALYSIS
@@ -486,10 +695,7 @@ def process_hash_batch(hash_batch, vt_client, batch_num, total_batches):
 def extract_comprehensive_analysis(file_hash, full_data, vt_client):
     """Extract comprehensive analysis data from VT response"""
     try:
-        if hasattr(full_data, 'attributes'):
-            attributes = full_data.attributes
-        else:
-            attributes = full_data.get("data", {}).get("attributes", {})
+        attributes = full_data.get("data", {}).get("attributes", {})
         
         comprehensive_data = {
             'file_hash': file_hash,
@@ -523,7 +729,7 @@ def print_comprehensive_analysis(comprehensive_data, apk_name):
     if not comprehensive_data:
         return
     
-    print("📈 Comprehensive Analysis:")
+    console.line("📈 Comprehensive Analysis:")
     
     # Reputation score
     reputation = comprehensive_data.get('reputation', 0)
@@ -533,33 +739,33 @@ def print_comprehensive_analysis(comprehensive_data, apk_name):
         rep_color = NEON_RED
     else:
         rep_color = NEON_YELLOW
-    print(f"      🏷️  Reputation Score: {rep_color}{reputation}{RESET}")
+    console.line(f"      🏷️  Reputation Score: {rep_color}{reputation}{RESET}")
     
     # Submission history
     times_submitted = comprehensive_data.get('times_submitted', 0)
-    print(f"      📤 Times Submitted: {times_submitted}")
+    console.line(f"      📤 Times Submitted: {times_submitted}")
     
     # Dates
     first_submission = comprehensive_data.get('first_submission_date')
     if first_submission:
-        print(f"      📅 First Submission: {first_submission}")
+        console.line(f"      📅 First Submission: {first_submission}")
     
     last_analysis = comprehensive_data.get('last_analysis_date')
     if last_analysis:
-        print(f"      🔍 Last Analysis: {last_analysis}")
+        console.line(f"      🔍 Last Analysis: {last_analysis}")
     
     # Meaningful name (if different from filename)
     meaningful_name = comprehensive_data.get('meaningful_name')
     if meaningful_name and meaningful_name != apk_name:
-        print(f"      📛 Meaningful Name: {meaningful_name}")
+        console.line(f"      📛 Meaningful Name: {meaningful_name}")
     
     # Popular threat classification
     threat_classification = comprehensive_data.get('popular_threat_classification', {})
     if threat_classification:
-        print(f"      🎯 Popular Threat Classification:")
+        console.line(f"      🎯 Popular Threat Classification:")
         for category, values in threat_classification.items():
             if values:  # Only print if there are values
-                print(f"            • {category}: {', '.join(values)}")
+                console.line(f"            • {category}: {', '.join(values)}")
 
 # =============================================
 # ENHANCED SANDBOX ANALYSIS
@@ -567,13 +773,10 @@ def print_comprehensive_analysis(comprehensive_data, apk_name):
 
 def extract_sandbox_verdicts(full_data, vt_client):
     try:
-        if hasattr(full_data, 'sandbox_verdicts'):
-            sandbox_verdicts = full_data.sandbox_verdicts
-        else:
-            sandbox_verdicts = full_data.get("data", {}).get("attributes", {}).get("sandbox_verdicts", {})
+        sandbox_verdicts = full_data.get("data", {}).get("attributes", {}).get("sandbox_verdicts", {})
         
         if sandbox_verdicts:
-            vt_client.usage_stats["sandbox"] += 1
+            vt_client.count_stat("sandbox")
         
         verdict_data = {}
         for sandbox, verdict in sandbox_verdicts.items():
@@ -618,162 +821,103 @@ def print_sandbox_analysis(sandbox_verdicts, apk_name):
     if not sandbox_verdicts:
         return
         
-    print(f"🔬 Sandbox Analysis:")
+    console.line(f"🔬 Sandbox Analysis:")
     
     for sandbox, verdict in sandbox_verdicts.items():
-        print(f"      🧪 {sandbox}:")
+        console.line(f"      🧪 {sandbox}:")
         category_color = get_category_color(verdict['category'])
-        print(f"      📊 Category: {category_color}{verdict['category']}{RESET}")
+        console.line(f"      📊 Category: {category_color}{verdict['category']}{RESET}")
         
         confidence_color = get_confidence_color(verdict['confidence'])
-        print(f"      🎯 Confidence: {confidence_color}{verdict['confidence']}%{RESET}")
+        console.line(f"      🎯 Confidence: {confidence_color}{verdict['confidence']}%{RESET}")
         
         # Only print classification if it's not "CLEAN"
         if (verdict['malware_classification'] and 
             ', '.join(verdict['malware_classification']).upper() != 'CLEAN'):
-            print(f"      🏷️  Classification: {', '.join(verdict['malware_classification'])}")
+            console.line(f"      🏷️  Classification: {', '.join(verdict['malware_classification'])}")
 
 # =============================================
 # ENHANCED DETECTION ANALYSIS WITH WHITELIST/BLACKLIST
 # =============================================
 
-def is_safe_detection_type(result_string):
-    if not result_string:
-        return False
-    result_lower = result_string.lower()
-    safe_indicators = ['pup', 'pua', 'riskware', 'potentially unwanted', 'unwanted', 'adware']
-    for indicator in safe_indicators:
-        if indicator in result_lower:
-            return True
-    return False
+# Display text for detections that came back without a result name
+DETECTION_FALLBACK_RESULT = {
+    "malicious": "Generic detection",
+    "suspicious": "Suspicious behavior"
+}
 
-def is_malicious_detection_type(result_string):
-    if not result_string:
-        return False
-    result_lower = result_string.lower()
-    malicious_indicators = ['trojan', 'virus', 'malware', 'worm', 'backdoor', 'exploit', 'ransomware']
-    for indicator in malicious_indicators:
-        if indicator in result_lower:
-            return True
-    return False
+# Console colour and icon for each detection status
+DETECTION_STATUS_STYLE = {
+    "WHITELISTED": (WHITE_BOLD, "✅"),
+    "BLACKLISTED": (NEON_RED, "❌"),
+    "SAFE": (NEON_GREEN, "✅"),
+    "MALICIOUS": (NEON_RED, "❌")
+}
 
-def categorize_apk(malicious_count, suspicious_count, detailed_analysis):
+@functools.lru_cache(maxsize=4096)
+def _classify_detection(vendor, result, list_version):
+    """Memoized (status, flags_infected) for one detection under one list version"""
+    labels = detection_manager.classify(vendor, result)
+    if "whitelisted" in labels:
+        return "WHITELISTED", False
+    if "blacklisted" in labels:
+        return "BLACKLISTED", True
+    # Indicator words like "Trojan.Adware" read SAFE but still keep the APK out of Clean
+    flags_infected = "malicious" in labels or "safe" not in labels
+    return ("SAFE" if "safe" in labels else "MALICIOUS"), flags_infected
+
+def build_detection_records(detailed_analysis):
+    """One verdict record per vendor detection, shared by categorization, console and reports"""
+    records = []
+    if not detailed_analysis:
+        return records
+    for kind in ("malicious", "suspicious"):
+        for vendor, details in detailed_analysis.get(kind, {}).items():
+            raw_result = details.get("result") or ""
+            display_result = raw_result or DETECTION_FALLBACK_RESULT[kind]
+            status, flags_infected = _classify_detection(vendor, display_result, detection_manager.version)
+            records.append({
+                "vendor": vendor,
+                "kind": kind,
+                "result": display_result,
+                "method": details.get("method") or "",
+                "status": status,
+                "safe": status in ("WHITELISTED", "SAFE"),
+                # Detections without a result name never decide the category
+                "flags_infected": bool(raw_result) and flags_infected
+            })
+    return records
+
+def categorize_apk(malicious_count, suspicious_count, detailed_analysis, records=None):
     if malicious_count == 0 and suspicious_count == 0:
         return "clean"
     
-    has_malicious_detections = False
-    has_only_safe_detections = True
-    
-    # Check malicious detections
-    for vendor, details in detailed_analysis.get("malicious", {}).items():
-        result = details.get("result", "")
-        if result:
-            # Check if whitelisted
-            if detection_manager.is_whitelisted(vendor, result):
-                continue  # Skip whitelisted detections
-            # Check if blacklisted
-            if detection_manager.is_blacklisted(vendor, result):
-                has_malicious_detections = True
-                has_only_safe_detections = False
-                break
-            elif is_malicious_detection_type(result):
-                has_malicious_detections = True
-                has_only_safe_detections = False
-            elif not is_safe_detection_type(result):
-                has_malicious_detections = True
-                has_only_safe_detections = False
-    
-    # Check suspicious detections
-    for vendor, details in detailed_analysis.get("suspicious", {}).items():
-        result = details.get("result", "")
-        if result:
-            # Check if whitelisted
-            if detection_manager.is_whitelisted(vendor, result):
-                continue  # Skip whitelisted detections
-            # Check if blacklisted
-            if detection_manager.is_blacklisted(vendor, result):
-                has_malicious_detections = True
-                has_only_safe_detections = False
-                break
-            elif is_malicious_detection_type(result):
-                has_malicious_detections = True
-                has_only_safe_detections = False
-            elif not is_safe_detection_type(result):
-                has_malicious_detections = True
-                has_only_safe_detections = False
-    
-    if has_malicious_detections:
-        return "infected"
-    elif has_only_safe_detections:
-        return "clean"
-    else:
+    if records is None:
+        records = build_detection_records(detailed_analysis)
+    
+    if any(record["flags_infected"] for record in records):
         return "infected"
+    return "clean"
 
-def print_detection_analysis(detailed_analysis, apk_name):
+def print_detection_analysis(detailed_analysis, apk_name, records=None):
     """Enhanced detection analysis with whitelist/blacklist status"""
-    if not detailed_analysis or (not detailed_analysis.get("malicious") and not detailed_analysis.get("suspicious")):
+    if records is None:
+        records = build_detection_records(detailed_analysis)
+    if not records:
         return 0, 0
     
     safe_detections = 0
     malicious_detections = 0
     
-    print("🔍 Detection Analysis:")
+    console.line("🔍 Detection Analysis:")
     
-    # Process malicious detections
-    for vendor, details in detailed_analysis.get("malicious", {}).items():
-        result = details["result"] if details["result"] else "Generic detection"
-        
-        # Check list status and detection type
-        if detection_manager.is_whitelisted(vendor, result):
+    for record in records:
+        if record["safe"]:
             safe_detections += 1
-            safety_type = "WHITELISTED"
-            safety_color = WHITE_BOLD
-            list_icon = "✅"
-        elif detection_manager.is_blacklisted(vendor, result):
-            malicious_detections += 1
-            safety_type = "BLACKLISTED"
-            safety_color = NEON_RED
-            list_icon = "❌"
-        elif is_safe_detection_type(result):
-            safe_detections += 1
-            safety_type = "SAFE"
-            safety_color = NEON_GREEN
-            list_icon = "✅"
         else:
             malicious_detections += 1
-            safety_type = "MALICIOUS"
-            safety_color = NEON_RED
-            list_icon = "❌"
-        
-        print(f"      {list_icon} {safety_color}{BOLD}{vendor}:{RESET}{safety_color} {result} - {safety_type}{RESET}")
-    
-    # Process suspicious detections
-    for vendor, details in detailed_analysis.get("suspicious", {}).items():
-        result = details["result"] if details["result"] else "Suspicious behavior"
-        
-        # Check list status and detection type
-        if detection_manager.is_whitelisted(vendor, result):
-            safe_detections += 1
-            safety_type = "WHITELISTED"
-            safety_color = WHITE_BOLD
-            list_icon = "✅"
-        elif detection_manager.is_blacklisted(vendor, result):
-            malicious_detections += 1
-            safety_type = "BLACKLISTED"
-            safety_color = NEON_RED
-            list_icon = "❌"
-        elif is_safe_detection_type(result):
-            safe_detections += 1
-            safety_type = "SAFE"
-            safety_color = NEON_GREEN
-            list_icon = "✅"
-        else:
-            malicious_detections += 1
-            safety_type = "MALICIOUS"
-            safety_color = NEON_RED
-            list_icon = "❌"
-        
-        print(f"      {list_icon} {safety_color}{BOLD}{vendor}:{RESET}{safety_color} {result} - {safety_type}{RESET}")
+        safety_color, list_icon = DETECTION_STATUS_STYLE[record["status"]]
+        console.line(f"      {list_icon} {safety_color}{BOLD}{record['vendor']}:{RESET}{safety_color} {record['result']} - {record['status']}{RESET}")
     
     return safe_detections, malicious_detections
 
@@ -782,24 +926,140 @@ def print_detection_analysis(detailed_analysis, apk_name):
 # =============================================
 
 class ScanLogger:
+    """Session logger whose writes happen on a background thread.
+
+    log() only enqueues; the writer batches lines into an open file, flushes on an
+    interval and at exit, and rotates/prunes segments tracked in an index file.
+    """
+    _STOP = object()
+    
     def __init__(self):
         self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.log_file = os.path.join(SCAN_LOGS_DIR, f"scan_session_{self.session_id}.log")
+        self.segment = 0
+        self.log_file = self._segment_path()
         self.ensure_log_directory()
-        
+        self.queue = queue.SimpleQueue()
+        self.handle = None
+        self.closed = False
+        self.writer = threading.Thread(target=self._writer, name="scan-logger", daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+    
     def ensure_log_directory(self):
         if not os.path.exists(SCAN_LOGS_DIR):
             os.makedirs(SCAN_LOGS_DIR)
     
+    def _segment_path(self):
+        suffix = f"_{self.segment}" if self.segment else ""
+        return os.path.join(SCAN_LOGS_DIR, f"scan_session_{self.session_id}{suffix}.log")
+    
     def log(self, message, level="INFO"):
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"[{timestamp}] [{level}] {message}\n"
+        self.queue.put(f"[{timestamp}] [{level}] {message}\n")
+    
+    def close(self):
+        """Flush everything queued so far and stop the writer"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(self._STOP)
+        self.writer.join(timeout=10)
+    
+    def _writer(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            
+            stop = item is self._STOP
+            if isinstance(item, str):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + LOG_CONFIG["flush_interval"]
+            
+            if batch and (stop or item is None or len(batch) >= LOG_CONFIG["batch_size"]):
+                self._write_batch(batch)
+                batch = []
+                deadline = None
+            if stop:
+                if self.handle:
+                    self.handle.close()
+                    self.handle = None
+                return
+    
+    def _write_batch(self, batch):
+        try:
+            if self.handle is None:
+                self._open_segment()
+            self.handle.write("".join(batch))
+            self.handle.flush()
+            if self.handle.tell() >= LOG_CONFIG["max_bytes"]:
+                self.handle.close()
+                self.handle = None
+                self.segment += 1
+                self.log_file = self._segment_path()
+        except Exception:
+            pass
+    
+    def _open_segment(self):
+        self.handle = open(self.log_file, "a", encoding="utf-8")
         try:
-            with open(self.log_file, "a", encoding="utf-8") as f:
-                f.write(log_entry)
+            self._prune_segments(self.log_file)
         except Exception:
             pass
     
+    def _prune_segments(self, new_file):
+        """Register a new segment, drop the ones past max age or count, and age out untracked logs"""
+        index_path = os.path.join(SCAN_LOGS_DIR, LOG_CONFIG["index_file"])
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            # First run with an index: adopt logs written by older versions once
+            index = []
+            with os.scandir(SCAN_LOGS_DIR) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".log") and entry.is_file():
+                        index.append({"file": entry.name, "created": entry.stat().st_mtime})
+        except (OSError, ValueError):
+            index = []
+        
+        index = [e for e in index if e["file"] != os.path.basename(new_file)]
+        index.append({"file": os.path.basename(new_file), "created": time.time()})
+        
+        cutoff = time.time() - LOG_CONFIG["max_age_days"] * 86400
+        index.sort(key=lambda e: e["created"])
+        keep = [e for e in index if e["created"] >= cutoff][-LOG_CONFIG["max_files"]:]
+        kept_files = {e["file"] for e in keep}
+        for entry in index:
+            if entry["file"] not in kept_files:
+                try:
+                    os.remove(os.path.join(SCAN_LOGS_DIR, entry["file"]))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    keep.append(entry)
+        
+        # large_apk_scanner writes its own logs here; age those out too
+        tracked = {e["file"] for e in index}
+        with os.scandir(SCAN_LOGS_DIR) as entries:
+            for entry in entries:
+                if entry.name.endswith(".log") and entry.name not in tracked and entry.is_file():
+                    try:
+                        if entry.stat().st_mtime < cutoff:
+                            os.remove(entry.path)
+                    except OSError:
+                        pass
+        
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(keep, f)
+        os.replace(tmp_path, index_path)
+    
     def log_scan_start(self, total_files, method):
         self.log(f"VirusTotal PowerScanner v{VERSION} started")
         self.log(f"Scan directories: {SCAN_DIRECTORIES}")
@@ -824,7 +1084,7 @@ class ScanLogger:
     
     def log_scan_complete(self, clean_count, infected_count, unknown_count):
         self.log(f"Scan completed: {clean_count} clean, {infected_count} infected, {unknown_count} unknown")
-        self.log(f"Scan results saved to: {SCAN_RESULTS_DIR}")
+        self.log(f"Scan results recorded in: {VT_STATE_DB}")
         self.log(f"Session log saved to: {self.log_file}")
     
     def log_error(self, apk_name, error_message):
@@ -835,6 +1095,237 @@ class ScanLogger:
 
 logger = None
 
+# =============================================
+# SCAN HISTORY STORE
+# =============================================
+
+HEX_HASH_PATTERN = re.compile(r"^[0-9a-fA-F]{8,64}$")
+
+class ScanHistory:
+    """Append-only SQLite scan history, indexed by hash and APK name.
+    
+    An attached organizer places its queued moves before each batch is written,
+    so a record is only marked reported once its file has landed.
+    """
+    def __init__(self, db_path=None, journal=None, organizer=None):
+        self.db_path = db_path or VT_STATE_DB
+        self.conn = None
+        self.pending = []
+        self.journal = journal
+        self.organizer = organizer
+    
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS scan_history ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, sha256 TEXT, name TEXT, path TEXT, "
+                "category TEXT, malicious INTEGER, suspicious INTEGER, total INTEGER, "
+                "scanned_at REAL, record TEXT)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_sha256 ON scan_history (sha256)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_name ON scan_history (name)")
+        return self.conn
+    
+    def add(self, record):
+        """Buffer one scan result; records are written in batches by flush()"""
+        record.setdefault("scanned_at", time.time())
+        self.pending.append(record)
+        if len(self.pending) >= HISTORY_CONFIG["flush_every"]:
+            self.flush()
+    
+    def flush(self):
+        """Write every buffered record in a single transaction"""
+        if self.organizer:
+            self.organizer.flush()
+        if not self.pending:
+            return
+        rows = [
+            (r.get("file_hash"), r.get("file"), r.get("path"), r.get("category"),
+             r.get("malicious"), r.get("suspicious"), r.get("total"), r["scanned_at"],
+             json.dumps(r, default=str))
+            for r in self.pending
+        ]
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT INTO scan_history (sha256, name, path, category, malicious, suspicious, "
+                    "total, scanned_at, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                # Journal entries close in the same transaction that records them
+                if self.journal:
+                    self.journal.mark_reported(conn, self.pending)
+            self.pending = []
+        except sqlite3.Error as e:
+            if logger:
+                logger.log(f"Scan history write failed: {e}", "ERROR")
+    
+    def query(self, term, limit=20):
+        """Records matching a full or prefix hash, or part of an APK name, newest first"""
+        self.flush()
+        if HEX_HASH_PATTERN.match(term):
+            where, arg = "sha256 LIKE ?", f"{term.lower()}%"
+        else:
+            where, arg = "name LIKE ?", f"%{term}%"
+        rows = self._connect().execute(
+            f"SELECT record FROM scan_history WHERE {where} ORDER BY scanned_at DESC, id DESC LIMIT ?",
+            (arg, limit)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+    
+    def latest_verdicts(self):
+        """The newest clean/infected record for every scanned hash"""
+        self.flush()
+        rows = self._connect().execute(
+            "SELECT record FROM scan_history WHERE id IN ("
+            "SELECT MAX(id) FROM scan_history WHERE category IN ('clean', 'infected') GROUP BY sha256)"
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+    
+    def close(self):
+        self.flush()
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+scan_history = None
+
+# =============================================
+# CRASH-SAFE RESUME JOURNAL
+# =============================================
+
+JOURNAL_STATES = ("hashed", "looked_up", "categorized", "moved", "reported")
+
+class ScanJournal:
+    """Write-ahead record of how far each hash got in the current session.
+    
+    Entries survive a killed process and are cleared once a session ends cleanly,
+    so the next run resumes without repeating lookups, moves or history writes.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path or VT_STATE_DB
+        self.conn = None
+        self.lock = threading.Lock()
+        # What the interrupted run had already reported or seen 404, snapshotted by recover()
+        self.carried_over = frozenset()
+        self.carried_not_found = frozenset()
+    
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS scan_journal ("
+                "sha256 TEXT PRIMARY KEY, path TEXT, state TEXT, lookup_status TEXT, "
+                "destination TEXT, record TEXT, updated_at REAL)"
+            )
+        return self.conn
+    
+    def _execute(self, sql, args):
+        try:
+            with self.lock:
+                with self._connect() as conn:
+                    conn.execute(sql, args)
+        except sqlite3.Error as e:
+            if logger:
+                logger.log(f"Scan journal write failed: {e}", "ERROR")
+    
+    def record_hashed(self, file_hash, path):
+        # Never moves an entry backwards; a resumed hash keeps its later state
+        self._execute(
+            "INSERT INTO scan_journal (sha256, path, state, updated_at) VALUES (?, ?, 'hashed', ?) "
+            "ON CONFLICT(sha256) DO UPDATE SET path = excluded.path, updated_at = excluded.updated_at",
+            (file_hash, str(path), time.time())
+        )
+    
+    def record_lookup(self, file_hash, status):
+        self._execute(
+            "UPDATE scan_journal SET state = 'looked_up', lookup_status = ?, updated_at = ? "
+            "WHERE sha256 = ? AND state = 'hashed'",
+            (status, time.time(), file_hash)
+        )
+    
+    def record_categorized(self, file_hash, record, destination):
+        """Persist the finished result before the file is moved"""
+        self._execute(
+            "UPDATE scan_journal SET state = 'categorized', destination = ?, record = ?, updated_at = ? "
+            "WHERE sha256 = ?",
+            (destination, json.dumps(record, default=str), time.time(), file_hash)
+        )
+    
+    def record_moved(self, file_hash):
+        self._execute(
+            "UPDATE scan_journal SET state = 'moved', updated_at = ? WHERE sha256 = ?",
+            (time.time(), file_hash)
+        )
+    
+    def mark_reported(self, conn, records):
+        """Called by ScanHistory.flush inside its own transaction.
+        
+        Only final verdicts close an entry; errors and spent quota stay open so
+        a resumed run looks them up again.
+        """
+        conn.executemany(
+            "UPDATE scan_journal SET state = 'reported', updated_at = ? WHERE sha256 = ?",
+            [(time.time(), r["file_hash"]) for r in records
+             if r.get("file_hash") and (r.get("category") in ("clean", "infected") or r.get("reason") == "hash_not_found")]
+        )
+    
+    def recover(self, history):
+        """Report results whose file already left the scan directories before the crash.
+        
+        Returns the recovered records; everything else resumes through the pipeline.
+        """
+        try:
+            with self.lock:
+                rows = self._connect().execute(
+                    "SELECT sha256, path, state, destination, record FROM scan_journal "
+                    "WHERE state IN ('categorized', 'moved')"
+                ).fetchall()
+        except sqlite3.Error:
+            return []
+        
+        recovered = []
+        for file_hash, path, state, destination, record in rows:
+            if state == "categorized":
+                # Killed between deciding and moving: finish only if the move itself landed
+                if os.path.exists(path) or not (destination and os.path.exists(destination)):
+                    continue
+                self.record_moved(file_hash)
+            record = json.loads(record)
+            history.add(record)
+            recovered.append(record)
+        history.flush()
+        try:
+            with self.lock:
+                rows = self._connect().execute("SELECT sha256, state, lookup_status FROM scan_journal").fetchall()
+        except sqlite3.Error:
+            rows = []
+        self.carried_over = frozenset(h for h, state, _ in rows if state == "reported")
+        self.carried_not_found = frozenset(h for h, _, status in rows if status == "not_found")
+        return recovered
+    
+    def pending_count(self):
+        try:
+            with self.lock:
+                return self._connect().execute("SELECT COUNT(*) FROM scan_journal").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+    
+    def finish(self):
+        """Session ended cleanly: nothing left to resume"""
+        self._execute("DELETE FROM scan_journal", ())
+    
+    def close(self):
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+scan_journal = None
+
 # =============================================
 # INITIALIZATION FUNCTIONS
 # =============================================
@@ -848,107 +1339,187 @@ def initialize_directories():
             if logger:
                 logger.log(f"Created directory: {directory}")
 
-def cleanup_old_logs():
-    """Only show cleanup when actually cleaning"""
-    cutoff_date = datetime.now() - timedelta(days=3)
-    deleted_count = 0
-    
-    for log_file in Path(SCAN_LOGS_DIR).glob("*.log"):
-        file_time = datetime.fromtimestamp(log_file.stat().st_mtime)
-        if file_time < cutoff_date:
-            try:
-                os.remove(log_file)
-                deleted_count += 1
-                if logger:
-                    logger.log(f"Deleted old log: {log_file.name}")
-            except Exception as e:
-                if logger:
-                    logger.log(f"Failed to delete {log_file.name}: {e}", "ERROR")
-    
-    if deleted_count > 0:
-        print(f"🧹 Cleaned up {deleted_count} old log files")
-
 # =============================================
 # CORE SCANNING FUNCTIONS
 # =============================================
 
-def calculate_sha256(file_path):
-    sha256_hash = hashlib.sha256()
+def extract_detailed_analysis(full_data):
+    """Split last_analysis_results into malicious and suspicious vendor maps"""
     try:
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(chunk)
-        return sha256_hash.hexdigest()
-    except Exception as e:
-        if logger:
-            logger.log_error(os.path.basename(file_path), f"Error calculating hash: {e}")
-        return None
-
-def get_detailed_analysis(file_hash):
-    try:
-        url = f"{BASE_URL}/files/{file_hash}"
-        response = requests.get(url, headers=HEADERS, timeout=30)
+        analysis_results = full_data["data"]["attributes"]["last_analysis_results"]
         
-        if response.status_code == 200:
-            data = response.json()
-            analysis_results = data["data"]["attributes"]["last_analysis_results"]
-            
-            malicious_vendors = {}
-            suspicious_vendors = {}
-            
-            for vendor, result in analysis_results.items():
-                category = result.get("category", "")
-                method = result.get("method", "")
-                result_name = result.get("result", "Unknown")
-                
-                if category == "malicious":
-                    malicious_vendors[vendor] = {
-                        "result": result_name,
-                        "method": method
-                    }
-                elif category == "suspicious":
-                    suspicious_vendors[vendor] = {
-                        "result": result_name,
-                        "method": method
-                    }
+        malicious_vendors = {}
+        suspicious_vendors = {}
+        
+        for vendor, result in analysis_results.items():
+            category = result.get("category", "")
+            method = result.get("method", "")
+            result_name = result.get("result", "Unknown")
             
-            return {
-                "malicious": malicious_vendors,
-                "suspicious": suspicious_vendors
-            }
-        else:
-            return None
+            if category == "malicious":
+                malicious_vendors[vendor] = {
+                    "result": result_name,
+                    "method": method
+                }
+            elif category == "suspicious":
+                suspicious_vendors[vendor] = {
+                    "result": result_name,
+                    "method": method
+                }
+        
+        return {
+            "malicious": malicious_vendors,
+            "suspicious": suspicious_vendors
+        }
     except Exception as e:
         return None
 
+def parse_file_report(file_hash, full_data, vt_client):
+    """Build stats, comprehensive data, sandbox verdicts and vendor maps from one report"""
+    stats = full_data.get("data", {}).get("attributes", {}).get("last_analysis_stats", {})
+    comprehensive_data = extract_comprehensive_analysis(file_hash, full_data, vt_client)
+    return {
+        "malicious": stats.get("malicious", 0),
+        "suspicious": stats.get("suspicious", 0),
+        "total": sum(stats.values()),
+        "comprehensive_data": comprehensive_data,
+        "sandbox_verdicts": comprehensive_data.get("sandbox_verdicts") or {},
+        "detailed_analysis": extract_detailed_analysis(full_data)
+    }
+
 # =============================================
 # FILE MANAGEMENT FUNCTIONS
 # =============================================
 
+def organize_destination(apk_path, category):
+    """Where organize_apk_file will put an APK of the given category"""
+    folder = CLEAN_APKS_DIR if category == "clean" else INFECTED_APKS_DIR
+    return os.path.join(folder, os.path.basename(apk_path))
+
 def organize_apk_file(apk_path, scan_result):
+    """Move an APK into its category folder right away"""
+    folder = os.path.dirname(organize_destination(apk_path, scan_result["category"]))
     try:
-        filename = os.path.basename(apk_path)
-        category = scan_result["category"]
-        
-        if category == "clean":
-            destination = os.path.join(CLEAN_APKS_DIR, filename)
-            shutil.move(apk_path, destination)
-            if logger:
-                logger.log_file_move(filename, "Clean_and_Safe_APKs")
-            return "clean"
-        else:
-            destination = os.path.join(INFECTED_APKS_DIR, filename)
-            shutil.move(apk_path, destination)
-            if logger:
-                logger.log_file_move(filename, "Infected_and_High_Risk_APKs")
-            return "infected"
-            
+        destination, action = place_file(apk_path, folder, scan_result.get("file_hash"))
     except Exception as e:
+        destination, action = None, str(e)
+    return log_organized(apk_path, scan_result, destination, action)
+
+def log_organized(apk_path, scan_result, destination, action):
+    """Record where place_file put an APK; returns its category, or "failed" """
+    filename = os.path.basename(apk_path)
+    if destination is None:
         if logger:
-            logger.log_error(os.path.basename(apk_path), f"Failed to move file: {e}")
+            logger.log_error(filename, f"Failed to move file: {action}")
         return "failed"
+    
+    scan_result["organized_path"] = destination
+    folder = os.path.basename(os.path.dirname(destination))
+    if action == "duplicate":
+        console.line(f"🧬 {NEON_YELLOW}Identical {filename} already in {folder}{RESET} - dropped this copy")
+    elif os.path.basename(destination) != filename:
+        console.line(f"📝 {NEON_YELLOW}A different {filename} is already in {folder}{RESET} - kept as {os.path.basename(destination)}")
+    if logger:
+        logger.log_file_move(filename, folder if action != "copied" else f"{folder} (copied across filesystems)")
+    return scan_result["category"]
+
+def queue_organize(apk_file, result_data, copies):
+    """Queue the move for the current pipeline stage; duplicates and the journal follow it"""
+    def placed(destination, action):
+        if log_organized(apk_file, result_data, destination, action) == "failed":
+            return
+        fold_duplicate_copies(copies, destination, result_data["file_hash"])
+        if scan_journal:
+            scan_journal.record_moved(result_data["file_hash"])
+    folder = os.path.dirname(organize_destination(apk_file, result_data["category"]))
+    scan_history.organizer.add(apk_file, folder, result_data["file_hash"], on_placed=placed)
+
+def fold_duplicate_copies(copies, primary_destination, file_hash):
+    """Apply the primary's verdict to byte-identical copies without scanning them again"""
+    if not copies:
+        return
+    actions = {"linked": 0, "removed": 0, "kept": 0}
+    for copy in copies:
+        action = dedupe_copy(str(copy), primary_destination, file_hash)
+        actions[action] += 1
+        if logger:
+            logger.log(f"Duplicate {copy} of {os.path.basename(primary_destination)}: {action}")
+    folder = os.path.basename(os.path.dirname(primary_destination))
+    console.line(f"🧬 Copies Deduplicated: {actions['linked']} hardlinked, {actions['removed']} removed into {folder}"
+          + (f", {NEON_YELLOW}{actions['kept']} changed since hashing (left in place){RESET}" if actions["kept"] else ""))
+
+def render_scan_report(record):
+    """Render a scan-history record as the classic plain-text scan report"""
+    scanned_at = datetime.fromtimestamp(record.get("scanned_at") or time.time())
+    lines = []
+    lines.append(f"VirusTotal Scan Result - Version {VERSION}\n")
+    lines.append("=" * 50 + "\n")
+    lines.append(f"File: {record.get('file', 'N/A')}\n")
+    lines.append(f"Scan Date: {scanned_at.strftime('%Y-%m-%d %H:%M:%S')}\n")
+    lines.append(f"File Hash: {record.get('file_hash', 'N/A')}\n")
+    lines.append(f"Category: {record['category'].upper()}\n")
+    if "total" in record:
+        lines.append(f"Detection: {record['malicious']} malicious, {record['suspicious']} suspicious out of {record['total']} vendors\n")
+    else:
+        lines.append(f"Reason: {record.get('reason', 'N/A')}\n")
+    lines.append(f"VirusTotal Report: https://www.virustotal.com/gui/file/{record.get('file_hash', '')}\n\n")
+    
+    # Enhanced comprehensive data section
+    comprehensive_data = record.get("comprehensive_data", {})
+    if comprehensive_data:
+        lines.append("\nCOMPREHENSIVE ANALYSIS:\n")
+        lines.append("-" * 40 + "\n")
+        lines.append(f"Reputation Score: {comprehensive_data.get('reputation', 'N/A')}\n")
+        lines.append(f"Times Submitted: {comprehensive_data.get('times_submitted', 'N/A')}\n")
+        lines.append(f"First Submission: {comprehensive_data.get('first_submission_date', 'N/A')}\n")
+        lines.append(f"Last Analysis: {comprehensive_data.get('last_analysis_date', 'N/A')}\n")
+        lines.append(f"Meaningful Name: {comprehensive_data.get('meaningful_name', 'N/A')}\n")
+        
+        threat_class = comprehensive_data.get('popular_threat_classification', {})
+        if threat_class:
+            lines.append("Popular Threat Classification:\n")
+            for category, values in threat_class.items():
+                if values:
+                    lines.append(f"  {category}: {', '.join(values)}\n")
+        lines.append("\n")
+    
+    if comprehensive_data.get("sandbox_verdicts"):
+        lines.append("\nSANDBOX BEHAVIORAL ANALYSIS:\n")
+        lines.append("-" * 40 + "\n")
+        for sandbox, verdict in comprehensive_data["sandbox_verdicts"].items():
+            lines.append(f"{sandbox}:\n")
+            lines.append(f"  Category: {verdict['category']}\n")
+            lines.append(f"  Confidence: {verdict['confidence']}%\n")
+            if verdict['malware_names']:
+                lines.append(f"  Malware Names: {', '.join(verdict['malware_names'])}\n")
+            if verdict['malware_classification']:
+                lines.append(f"  Classification: {', '.join(verdict['malware_classification'])}\n")
+            lines.append("\n")
+    
+    detections = record.get("detections")
+    if detections is None:
+        detections = build_detection_records(record.get("detailed_analysis", {}))
+    
+    malicious = [d for d in detections if d["kind"] == "malicious"]
+    if malicious:
+        lines.append("MALICIOUS DETECTIONS:\n")
+        lines.append("-" * 30 + "\n")
+        for det in malicious:
+            method = det["method"] or "Static analysis"
+            lines.append(f"{det['vendor']}: {det['result']} ({method}) - {det['status']}\n")
+    
+    suspicious = [d for d in detections if d["kind"] == "suspicious"]
+    if suspicious:
+        lines.append("\nSUSPICIOUS DETECTIONS:\n")
+        lines.append("-" * 30 + "\n")
+        for det in suspicious:
+            lines.append(f"{det['vendor']}: {det['result']} - {det['status']}\n")
+    return "".join(lines)
 
 def save_scan_result(apk_path, scan_result):
+    """Optionally write the text rendering of a result, returning the report filename"""
+    if not HISTORY_CONFIG["write_text_reports"]:
+        return None
     try:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = os.path.basename(apk_path)
@@ -956,90 +1527,50 @@ def save_scan_result(apk_path, scan_result):
         result_path = os.path.join(SCAN_RESULTS_DIR, result_filename)
         
         with open(result_path, "w", encoding="utf-8") as f:
-            f.write(f"VirusTotal Scan Result - Version {VERSION}\n")
-            f.write("=" * 50 + "\n")
-            f.write(f"File: {filename}\n")
-            f.write(f"Scan Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"File Hash: {scan_result.get('file_hash', 'N/A')}\n")
-            f.write(f"Category: {scan_result['category'].upper()}\n")
-            f.write(f"Detection: {scan_result['malicious']} malicious, {scan_result['suspicious']} suspicious out of {scan_result['total']} vendors\n")
-            f.write(f"VirusTotal Report: https://www.virustotal.com/gui/file/{scan_result.get('file_hash', '')}\n\n")
-            
-            # Enhanced comprehensive data section
-            comprehensive_data = scan_result.get("comprehensive_data", {})
-            if comprehensive_data:
-                f.write("\nCOMPREHENSIVE ANALYSIS:\n")
-                f.write("-" * 40 + "\n")
-                f.write(f"Reputation Score: {comprehensive_data.get('reputation', 'N/A')}\n")
-                f.write(f"Times Submitted: {comprehensive_data.get('times_submitted', 'N/A')}\n")
-                f.write(f"First Submission: {comprehensive_data.get('first_submission_date', 'N/A')}\n")
-                f.write(f"Last Analysis: {comprehensive_data.get('last_analysis_date', 'N/A')}\n")
-                f.write(f"Meaningful Name: {comprehensive_data.get('meaningful_name', 'N/A')}\n")
-                
-                threat_class = comprehensive_data.get('popular_threat_classification', {})
-                if threat_class:
-                    f.write("Popular Threat Classification:\n")
-                    for category, values in threat_class.items():
-                        if values:
-                            f.write(f"  {category}: {', '.join(values)}\n")
-                f.write("\n")
-            
-            if comprehensive_data.get("sandbox_verdicts"):
-                f.write("\nSANDBOX BEHAVIORAL ANALYSIS:\n")
-                f.write("-" * 40 + "\n")
-                for sandbox, verdict in comprehensive_data["sandbox_verdicts"].items():
-                    f.write(f"{sandbox}:\n")
-                    f.write(f"  Category: {verdict['category']}\n")
-                    f.write(f"  Confidence: {verdict['confidence']}%\n")
-                    if verdict['malware_names']:
-                        f.write(f"  Malware Names: {', '.join(verdict['malware_names'])}\n")
-                    if verdict['malware_classification']:
-                        f.write(f"  Classification: {', '.join(verdict['malware_classification'])}\n")
-                    f.write("\n")
-            
-            if scan_result["detailed_analysis"]:
-                malicious = scan_result["detailed_analysis"].get("malicious", {})
-                if malicious:
-                    f.write("MALICIOUS DETECTIONS:\n")
-                    f.write("-" * 30 + "\n")
-                    for vendor, details in malicious.items():
-                        result = details["result"] if details["result"] else "Generic detection"
-                        method = details["method"] if details["method"] else "Static analysis"
-                        safe_type = "SAFE" if is_safe_detection_type(result) else "MALICIOUS"
-                        f.write(f"{vendor}: {result} ({method}) - {safe_type}\n")
-                
-                suspicious = scan_result["detailed_analysis"].get("suspicious", {})
-                if suspicious:
-                    f.write("\nSUSPICIOUS DETECTIONS:\n")
-                    f.write("-" * 30 + "\n")
-                    for vendor, details in suspicious.items():
-                        result = details["result"] if details["result"] else "Suspicious behavior"
-                        safe_type = "SAFE" if is_safe_detection_type(result) else "MALICIOUS"
-                        f.write(f"{vendor}: {result} - {safe_type}\n")
+            f.write(render_scan_report(scan_result))
         
         if logger:
             logger.log(f"Scan result saved: {result_filename}")
-        return True
+        return result_filename
         
     except Exception as e:
         if logger:
             logger.log_error(os.path.basename(apk_path), f"Failed to save scan result: {e}")
-        return False
+        return None
 
 # =============================================
 # ENHANCED POWER SCANNING LOGIC
 # =============================================
 
-def power_scan_apk(apk_file, file_hash, scan_result, file_number, total_files):
-    """Enhanced scanning function for batch processing"""
+# How a file VT has never seen would reach it, by upload_route() lane
+UPLOAD_LANES = {
+    "direct": "direct upload (large_apk_scanner)",
+    "upload_url": "upload URL flow (large_apk_scanner)",
+    "too_large": "too large for VirusTotal"
+}
+
+def power_scan_apk(apk_file, file_hash, scan_result, file_number, total_files, copies=(), route=None,
+                   identity=None, trusted=None):
+    """Enhanced scanning function for batch processing; copies share apk_file's content"""
     separator = "=" * 60
     apk_name = apk_file.name
     
-    print(separator)
-    print()
-    print(f"{BOLD}🔍 Processing File {file_number} of {total_files}:{RESET} {colorize_apk_name(apk_name)}")
-    print(f"📍 Path: {display_path(str(apk_file.parent))}")
-    print(f"✅ Hash: {file_hash[:16]}...")
+    console.line(separator)
+    console.line()
+    console.line(f"{BOLD}🔍 Processing File {file_number} of {total_files}:{RESET} {colorize_apk_name(apk_name)}")
+    console.line(f"📍 Path: {display_path(str(apk_file.parent))}")
+    console.line(f"✅ Hash: {file_hash[:16]}...")
+    if identity and identity.package:
+        version = f" {identity.version_name}" if identity.version_name else ""
+        build = f" (build {identity.version_code})" if identity.version_code is not None else ""
+        console.line(f"📦 Package: {identity.package}{version}{build}")
+    if trusted:
+        last = f", last {trusted['version_name']}" if trusted.get("version_name") else ""
+        console.line(f"🛡️  Known signer: {trusted['clean']} clean build(s){last} - looked up after unknown publishers")
+    if copies:
+        console.line(f"🧬 Identical Copies: {len(copies)}")
+        for copy in copies:
+            console.line(f"      • {display_path(str(copy))}")
     
     if logger:
         logger.log_apk_processing(apk_name, str(apk_file.parent))
@@ -1047,47 +1578,45 @@ def power_scan_apk(apk_file, file_hash, scan_result, file_number, total_files):
     hash_result = scan_result
     
     if hash_result["status"] == "found":
-        if vt_client.using_sdk:
-            stats = hash_result["stats"]
-            malicious_count = stats["malicious"]
-            suspicious_count = stats["suspicious"]
-            total_vendors = sum(stats.values())
-            full_data = hash_result["file_object"]
-        else:
-            malicious_count = hash_result["malicious"]
-            suspicious_count = hash_result["suspicious"]
-            total_vendors = hash_result["total"]
-            full_data = hash_result["full_data"]
+        # Every view of the file comes from the single lookup response
+        report = parse_file_report(file_hash, hash_result["full_data"], vt_client)
+        malicious_count = report["malicious"]
+        suspicious_count = report["suspicious"]
+        total_vendors = report["total"]
         
         # Colorize detection counts
         malicious_color = NEON_RED if malicious_count > 0 else NEON_GREEN
         suspicious_color = NEON_YELLOW if suspicious_count > 0 else NEON_GREEN
         
-        print(f"📊 Detection Summary: {malicious_color}{malicious_count} malicious{RESET}, {suspicious_color}{suspicious_count} suspicious{RESET} out of {total_vendors}")
+        console.line(f"📊 Detection Summary: {malicious_color}{malicious_count} malicious{RESET}, {suspicious_color}{suspicious_count} suspicious{RESET} out of {total_vendors}")
+        if hash_result.get("cached"):
+            console.line("⚡ Cached verdict (no API quota used)")
         
         if logger:
             logger.log_hash_result(apk_name, malicious_count, suspicious_count, total_vendors)
         
         # Enhanced comprehensive analysis
-        comprehensive_data = extract_comprehensive_analysis(file_hash, full_data, vt_client)
+        comprehensive_data = report["comprehensive_data"]
         print_comprehensive_analysis(comprehensive_data, apk_name)
         
-        sandbox_verdicts = comprehensive_data.get('sandbox_verdicts', {})
+        sandbox_verdicts = report["sandbox_verdicts"]
         if sandbox_verdicts:
             print_sandbox_analysis(sandbox_verdicts, apk_name)
             if logger:
                 logger.log_sandbox_analysis(apk_name, sandbox_verdicts)
         
-        detailed_analysis = get_detailed_analysis(file_hash)
-        safe_detections, malicious_detections = print_detection_analysis(detailed_analysis, apk_name)
+        detailed_analysis = report["detailed_analysis"]
+        # Classify each detection once; console, category and report all read these records
+        detections = build_detection_records(detailed_analysis)
+        safe_detections, malicious_detections = print_detection_analysis(detailed_analysis, apk_name, detections)
         
         # Use enhanced categorization that considers whitelist/blacklist
-        category = categorize_apk(malicious_count, suspicious_count, detailed_analysis)
+        category = categorize_apk(malicious_count, suspicious_count, detailed_analysis, detections)
         
         # Colorize categorization
         category_color = NEON_GREEN if category == "clean" else NEON_RED
-        print(f"🏷️  Categorization: {category_color}{category.upper()}{RESET}")
-        print(f"🔗 VirusTotal Report: {NEON_BLUE}https://www.virustotal.com/gui/file/{file_hash}{RESET}")
+        console.line(f"🏷️  Categorization: {category_color}{category.upper()}{RESET}")
+        console.line(f"🔗 VirusTotal Report: {NEON_BLUE}https://www.virustotal.com/gui/file/{file_hash}{RESET}")
         
         result_data = {
             "file": apk_name,
@@ -1099,18 +1628,21 @@ def power_scan_apk(apk_file, file_hash, scan_result, file_number, total_files):
             "method": "hash_lookup",
             "file_hash": file_hash,
             "detailed_analysis": detailed_analysis,
+            "detections": detections,
             "sandbox_verdicts": sandbox_verdicts,
-            "comprehensive_data": comprehensive_data
+            "comprehensive_data": comprehensive_data,
+            "duplicates": [str(copy) for copy in copies],
+            "apk_identity": identity._asdict() if identity else None
         }
         
-        move_result = organize_apk_file(apk_file, result_data)
-        save_result = save_scan_result(apk_file, result_data)
+        if scan_journal:
+            scan_journal.record_categorized(file_hash, result_data, organize_destination(apk_file, category))
+        queue_organize(apk_file, result_data, copies)
+        result_filename = save_scan_result(apk_file, result_data)
         
-        if save_result:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            result_filename = f"{apk_name}_{timestamp}.txt"
-            print(f"💾 Scan Result: {result_filename}")
-        print()
+        if result_filename:
+            console.line(f"💾 Scan Result: {result_filename}")
+        console.line()
         
         if logger:
             logger.log_categorization(apk_name, category, safe_detections, malicious_detections)
@@ -1124,22 +1656,41 @@ def power_scan_apk(apk_file, file_hash, scan_result, file_number, total_files):
         return {
             "file": apk_name,
             "path": str(apk_file),
+            "file_hash": file_hash,
             "category": "unknown",
             "reason": "rate_limit_exceeded",
             "method": "hash_lookup"
         }
         
     elif hash_result["status"] == "not_found":
+        lane = UPLOAD_LANES.get(route, UPLOAD_LANES["direct"])
+        console.line(f"❓ {NEON_YELLOW}Not in VirusTotal yet{RESET} - upload lane: {lane}")
         if logger:
-            logger.log_error(apk_name, "Hash not found in VirusTotal database")
+            logger.log_error(apk_name, f"Hash not found in VirusTotal database (upload lane: {route})")
         
         return {
             "file": apk_name,
             "path": str(apk_file),
+            "file_hash": file_hash,
             "category": "unknown",
             "reason": "hash_not_found",
+            "upload_route": route,
             "method": "hash_lookup"
         }
+    
+    elif hash_result["status"] == "pending":
+        console.line(f"⏳ {NEON_BLUE}Uploaded earlier, VirusTotal analysis still pending{RESET}")
+        if logger:
+            logger.log(f"{apk_name}: upload already pending analysis, lookup skipped")
+        
+        return {
+            "file": apk_name,
+            "path": str(apk_file),
+            "file_hash": file_hash,
+            "category": "unknown",
+            "reason": "analysis_pending",
+            "method": "pending_upload"
+        }
     else:
         error_msg = f"Hash check failed for {colorize_apk_name(apk_name)}: {hash_result['status']}"
         if logger:
@@ -1148,6 +1699,7 @@ def power_scan_apk(apk_file, file_hash, scan_result, file_number, total_files):
         return {
             "file": apk_name,
             "path": str(apk_file),
+            "file_hash": file_hash,
             "category": "unknown",
             "reason": hash_result["status"],
             "method": "hash_lookup"
@@ -1158,25 +1710,151 @@ def power_scan_apk(apk_file, file_hash, scan_result, file_number, total_files):
 # =============================================
 
 def get_apk_files_from_directories(directories):
-    all_apk_files = []
+    """DiscoveredFile entries (path, root, stat) for every APK, each file listed once"""
+    # Never rescan our own output folders when recursion reaches them
+    exclude = DISCOVERY_CONFIG["exclude"] + [APKS_BASE_DIR]
+    all_apk_files = discover_apks(directories, exclude=exclude)
     
     for directory in directories:
-        apk_files = [f for f in Path(directory).glob("*.apk") if f.is_file()]
+        apk_files = [f for f in all_apk_files if f.root == directory]
         
         if apk_files:
-            print(f"{BOLD}📂 Scanning Directory: {display_path(directory)}{RESET}")
-            print(f"{BOLD}      📁 Found {len(apk_files)} APK Files{RESET}")
+            console.line(f"{BOLD}📂 Scanning Directory: {display_path(directory)}{RESET}")
+            console.line(f"{BOLD}      📁 Found {len(apk_files)} APK Files{RESET}")
             for apk_file in apk_files:
-                print(f"            • {colorize_apk_name(apk_file.name)}")
-        
-        all_apk_files.extend(apk_files)
+                console.line(f"            • {colorize_apk_name(apk_file.path.name)}")
     
     return all_apk_files
 
+# =============================================
+# WATCH MODE: DIRECTORY CHANGE DETECTION
+# =============================================
+
+class ApkDirectoryWatcher:
+    """Reports new or rewritten .apk files via inotify, or a scandir snapshot diff"""
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    EVENT_HEADER = struct.Struct("iIII")
+    
+    def __init__(self, directories):
+        self.directories = [d for d in directories if os.path.isdir(d)]
+        self.snapshot = self._scan()
+        self.inotify_fd = None
+        self.watch_dirs = {}
+        try:
+            self._init_inotify()
+        except (OSError, AttributeError):
+            self.inotify_fd = None
+        self.backend = "inotify" if self.inotify_fd is not None else "poll"
+    
+    def _init_inotify(self):
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        for directory in self.directories:
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), mask)
+            if wd >= 0:
+                self.watch_dirs[wd] = directory
+        if not self.watch_dirs:
+            os.close(fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        self.inotify_fd = fd
+    
+    def _scan(self):
+        """path -> (size, mtime_ns) for every APK directly inside the watched directories"""
+        return {
+            str(f.path): (f.stat.st_size, f.stat.st_mtime_ns)
+            for f in discover_apks(self.directories, recursive=False)
+        }
+    
+    def existing(self):
+        return list(self.snapshot)
+    
+    def changes(self, timeout):
+        """Block up to timeout seconds, return paths of APKs that appeared or changed"""
+        if self.inotify_fd is None:
+            time.sleep(timeout)
+            current = self._scan()
+            changed = {p for p, sig in current.items() if self.snapshot.get(p) != sig}
+            self.snapshot = current
+            return changed
+        
+        changed = set()
+        ready, _, _ = select.select([self.inotify_fd], [], [], timeout)
+        if not ready:
+            return changed
+        try:
+            data = os.read(self.inotify_fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0").decode("utf-8", "replace")
+            offset += name_len
+            if wd in self.watch_dirs:
+                path = os.path.join(self.watch_dirs[wd], name)
+                if matches_discovery_rules(name, path):
+                    changed.add(path)
+        return changed
+    
+    def close(self):
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+def watch_batches(watcher):
+    """Endless stream of APK batches whose size has settled (finished downloads)"""
+    pending = {path: None for path in watcher.existing()}
+    while True:
+        for path in watcher.changes(WATCH_CONFIG["poll_interval"]):
+            pending[path] = None
+        
+        now = time.monotonic()
+        ready = []
+        for path, state in list(pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del pending[path]  # Moved away or deleted before it settled
+                continue
+            signature = (st.st_size, st.st_mtime_ns)
+            if state is None or state[0] != signature:
+                pending[path] = (signature, now)
+            elif st.st_size > 0 and now - state[1] >= WATCH_CONFIG["stable_seconds"]:
+                ready.append(Path(path))
+                del pending[path]
+        
+        if ready:
+            if logger:
+                logger.log(f"Watch queued {len(ready)} settled APK(s): {[p.name for p in ready]}")
+            yield ready
+
 # =============================================
 # FINAL SUMMARY FORMATTING
 # =============================================
 
+def tally_result(results, result):
+    """File a power_scan_apk result under clean, infected or unknown"""
+    category = result.get("category", "unknown")
+    if category == "clean":
+        results["clean"].append(result)
+    elif category == "infected":
+        results["infected"].append(result)
+    else:
+        results["unknown"].append(result)
+
+def record_history(result, pipeline):
+    """Buffer a result in the scan history and on the console, flushing both whenever the pipeline goes idle"""
+    scan_history.add(result)
+    if pipeline.result_queue.empty():
+        scan_history.flush()
+        console.flush()
+
 def print_final_summary(results):
     separator = "=" * 60
     
@@ -1184,142 +1862,364 @@ def print_final_summary(results):
     infected_count = len(results['infected'])
     unknown_count = len(results['unknown'])
     
-    print("\n" + separator)
-    print()
-    print(f"{BOLD}📊 Final Scan Summary:{RESET}")
-    print(f"      ✅ {NEON_GREEN}Clean & Safe: {clean_count}{RESET}")
-    print(f"      🚨 {NEON_RED}Infected & High Risk: {infected_count}{RESET}")
-    print(f"      ❓ {NEON_YELLOW}Unknown: {unknown_count}{RESET}")
-    print()
-    print(separator)
+    console.summary("\n" + separator)
+    console.summary()
+    console.summary(f"{BOLD}📊 Final Scan Summary:{RESET}")
+    console.summary(f"      ✅ {NEON_GREEN}Clean & Safe: {clean_count}{RESET}")
+    console.summary(f"      🚨 {NEON_RED}Infected & High Risk: {infected_count}{RESET}")
+    console.summary(f"      ❓ {NEON_YELLOW}Unknown: {unknown_count}{RESET}")
+    console.summary()
+    console.summary(separator)
+    console.event("summary", clean=clean_count, infected=infected_count, unknown=unknown_count)
 
 # =============================================
 # ENHANCED MAIN SCANNING LOGIC
 # =============================================
 
+def resume_interrupted_session():
+    """Open the journal and finish any results an interrupted run left unreported"""
+    journal = ScanJournal()
+    history = ScanHistory(journal=journal, organizer=ApkOrganizer())
+    pending = journal.pending_count()
+    recovered = journal.recover(history) if pending else []
+    if pending:
+        console.summary(f"{BOLD}♻️  Resuming interrupted session: {pending} journaled files, {len(recovered)} results recovered{RESET}")
+        console.event("resumed", journaled=pending, recovered=len(recovered))
+        if logger:
+            logger.log(f"Resuming interrupted session: {pending} journaled files, {len(recovered)} recovered")
+    return journal, history, recovered
+
 def power_scan_all():
-    global logger, vt_client
+    global logger, vt_client, scan_history, scan_journal
     logger = ScanLogger()
     
-    print(f"{NEON_BLUE}🔍 VirusTotal PowerScanner v{VERSION} - Enhanced Batch Processing{RESET}")
-    print()
-    print(f"{BOLD}🔬 New Enhanced Features:{RESET}")
-    print(f"{BOLD}      📦 Batch Hash Processing{RESET}")
-    print(f"{BOLD}      🔄 Exponential Backoff Retry{RESET}")
-    print(f"{BOLD}      📈 Comprehensive VT Analysis{RESET}")
-    print(f"{BOLD}      🎯 Dynamic Rate Limiting{RESET}")
+    console.line(f"{NEON_BLUE}🔍 VirusTotal PowerScanner v{VERSION} - Enhanced Batch Processing{RESET}")
+    console.line()
+    console.line(f"{BOLD}🔬 New Enhanced Features:{RESET}")
+    console.line(f"{BOLD}      📦 Pipelined Hash/Lookup/Organize{RESET}")
+    console.line(f"{BOLD}      🔄 Exponential Backoff Retry{RESET}")
+    console.line(f"{BOLD}      📈 Comprehensive VT Analysis{RESET}")
+    console.line(f"{BOLD}      🎯 Token-Bucket Rate Limiting{RESET}")
     
     initialize_directories()
     
-    vt_client = VTAPIClient(API_KEY)
+    vt_client = VTAPIClient(API_KEYS)
     sdk_available = vt_client.initialize()
     
     method = "SDK" if sdk_available else "Requests"
-    print(f"{BOLD}🔧 Using {method} for API Calls{RESET}")
-    print(f"{BOLD}📊 Rate Limit: {RATE_LIMIT_CONFIG['requests_per_minute']} requests/minute{RESET}")
+    console.line(f"{BOLD}🔧 Using {method} for API Calls{RESET}")
+    console.line(f"{BOLD}📊 Rate Limit: {RATE_LIMIT_CONFIG['requests_per_minute']} requests/minute x {len(vt_client.key_pool.keys)} key(s){RESET}")
+    scan_journal, scan_history, recovered = resume_interrupted_session()
     
-    # Moved cleanup here as requested
-    cleanup_old_logs()
-    print()
+    console.line()
     
     apk_files = get_apk_files_from_directories(SCAN_DIRECTORIES)
     
     if not apk_files:
-        print("❌ No APK files found in any of the specified directories")
+        console.summary("❌ No APK files found in any of the specified directories")
         if logger:
             logger.log("No APK files found in any directory", "WARNING")
+        vt_client.close()
+        scan_history.close()
+        scan_journal.finish()
+        scan_journal.close()
         return
     
-    print(f"{BOLD}📁 Total APK Files Found: {len(apk_files)}{RESET}")
-    print()
+    console.summary(f"{BOLD}📁 Total APK Files Found: {len(apk_files)}{RESET}")
+    console.event("scan_started", files=len(apk_files), keys=len(vt_client.key_pool.keys))
+    console.line()
     
     if logger:
         logger.log_scan_start(len(apk_files), method)
     
-    # Step 1: Batch hash collection
-    hash_map = collect_hashes_batch(apk_files)
-    
-    if not hash_map:
-        print("❌ No valid hashes could be computed")
-        return
-    
-    # Step 2: Batch processing
-    all_hashes = list(hash_map.keys())
-    batch_size = RATE_LIMIT_CONFIG["batch_size"]
-    batches = [all_hashes[i:i + batch_size] for i in range(0, len(all_hashes), batch_size)]
-    
     results = {
         "clean": [],
         "infected": [],
         "unknown": []
     }
+    for result in recovered:
+        tally_result(results, result)
     
     total_processed = 0
     
-    for batch_num, hash_batch in enumerate(batches, 1):
-        batch_dict = {hash_val: hash_map[hash_val] for hash_val in hash_batch}
-        batch_results = process_hash_batch(batch_dict, vt_client, batch_num, len(batches))
-        
-        # Process results for this batch
-        for file_hash, file_info in batch_results.items():
-            total_processed += 1
-            apk_file = file_info['apk_file']
-            scan_result = file_info['scan_result']
-            
-            result = power_scan_apk(apk_file, file_hash, scan_result, total_processed, len(all_hashes))
-            
-            category = result.get("category", "unknown")
-            if category == "clean":
-                results["clean"].append(result)
-            elif category == "infected":
-                results["infected"].append(result)
-            else:
-                results["unknown"].append(result)
-        
-        # Wait between batches (except after the last batch)
-        if batch_num < len(batches):
-            print()  # Empty line before waiting message
-            batch_delay = 60  # Full minute between batches to respect rate limits
-            print(f"🕐 Waiting {batch_delay}s before next batch...")
-            print()  # Empty line after waiting message
-            print("=" * 60)  # Consistent separator style
-            print()  # Empty line after separator
-            time.sleep(batch_delay)
+    # Hashing feeds lookups as digests complete; this thread categorizes, moves and reports
+    console.line(f"{BOLD}🔄 Hashing and looking up {len(apk_files)} files ({RATE_LIMIT_CONFIG['requests_per_minute']} requests/minute per key){RESET}")
+    console.line()
+    pipeline = ScanPipeline(vt_client, [apk_files], scan_journal)
     
-    vt_client.close()
+    for file_hash, file_info in pipeline.run():
+        total_processed += 1
+        apk_file = file_info['apk_file']
+        scan_result = file_info['scan_result']
+        
+        result = power_scan_apk(apk_file, file_hash, scan_result, total_processed, len(apk_files),
+                                file_info['copies'], file_info['route'], file_info['identity'], file_info['trusted'])
+        if result.get("category") in ("clean", "infected"):
+            pipeline.record_verdict(file_info, result["category"] == "clean")
+        tally_result(results, result)
+        console.result(result, total_processed, len(apk_files))
+        record_history(result, pipeline)
+    
+    console.line(f"      ✅ {NEON_GREEN}Successfully hashed {pipeline.hashed}/{len(apk_files)} files{RESET}")
+    if pipeline.duplicates:
+        console.line(f"      🧬 {pipeline.duplicates} identical copies shared a lookup with their original")
+    if pipeline.resumed:
+        console.line(f"      ♻️  Skipped {pipeline.resumed} files already reported before the interruption")
+    if pipeline.seeded:
+        console.line(f"      🛡️  Signer trust seeded from {pipeline.seeded} APKs already in Clean")
+    if pipeline.deprioritized:
+        console.line(f"      🛡️  {pipeline.deprioritized} files from known signers were looked up after unknown publishers")
+    if not pipeline.hashed:
+        console.summary("❌ No valid hashes could be computed")
+    
+    scan_history.close()
+    scan_journal.finish()
+    scan_journal.close()
     
     print_final_summary(results)
-    print()
+    console.line()
+    # The usage report reads the quota ledger, so the client closes after it
     vt_client.print_usage_stats()
+    vt_client.close()
     
     separator = "=" * 60
-    print()
-    print(separator)
-    print()
+    console.line()
+    console.line(separator)
+    console.line()
     
     if logger:
         logger.log_scan_complete(len(results['clean']), len(results['infected']), len(results['unknown']))
     
-    print(f"{BOLD}📁 Organized Files:{RESET}")
+    console.line(f"{BOLD}📁 Organized Files:{RESET}")
     
     # Clean APKs
     if results['clean']:
-        print(f"      ✅ {NEON_GREEN}Clean & Safe APKs:{RESET}")
+        console.line(f"      ✅ {NEON_GREEN}Clean & Safe APKs:{RESET}")
         for file in results['clean']:
-            print(f"            • {NEON_GREEN}{file['file']}{RESET}")
+            console.line(f"            • {NEON_GREEN}{file['file']}{RESET}")
     
     # Infected APKs  
     if results['infected']:
-        print(f"      🚨 {NEON_RED}Infected & High Risk APKs:{RESET}")
+        console.line(f"      🚨 {NEON_RED}Infected & High Risk APKs:{RESET}")
         for file in results['infected']:
-            print(f"            • {NEON_RED}{file['file']}{RESET}")
+            console.line(f"            • {NEON_RED}{file['file']}{RESET}")
+    
+    console.line()
+    console.line(separator)
+    console.line()
+    console.line(f"📄 Current Session: {display_path(logger.log_file)}")
+    console.line()
+    console.line(separator)
+    console.line()
+    console.flush()
+
+def watch_scan():
+    """Long-running mode: scan APKs as soon as they finish landing in SCAN_DIRECTORIES"""
+    global logger, vt_client, scan_history, scan_journal
+    logger = ScanLogger()
+    
+    console.line(f"{NEON_BLUE}🔍 VirusTotal PowerScanner v{VERSION} - Watch Mode{RESET}")
+    console.line()
+    
+    initialize_directories()
+    
+    vt_client = VTAPIClient(API_KEYS)
+    sdk_available = vt_client.initialize()
+    scan_journal, scan_history, recovered = resume_interrupted_session()
+    method = "SDK" if sdk_available else "Requests"
+    
+    watcher = ApkDirectoryWatcher(SCAN_DIRECTORIES)
+    console.line(f"{BOLD}🔧 Using {method} for API Calls{RESET}")
+    console.summary(f"{BOLD}👀 Watching {len(watcher.directories)} directories via {watcher.backend}{RESET}")
+    console.event("watch_started", directories=watcher.directories, backend=watcher.backend)
+    for directory in watcher.directories:
+        console.line(f"      • {display_path(directory)}")
+    console.line(f"{BOLD}⏱️  APKs are queued once their size is stable for {WATCH_CONFIG['stable_seconds']}s (Ctrl+C to stop){RESET}")
+    console.line()
+    
+    if logger:
+        logger.log(f"Watch mode started ({watcher.backend}) on {watcher.directories}")
+    
+    results = {
+        "clean": [],
+        "infected": [],
+        "unknown": []
+    }
+    for result in recovered:
+        tally_result(results, result)
+    pipeline = ScanPipeline(vt_client, watch_batches(watcher), scan_journal)
+    total_processed = 0
+    
+    clean_exit = False
+    try:
+        for file_hash, file_info in pipeline.run():
+            total_processed += 1
+            result = power_scan_apk(file_info['apk_file'], file_hash, file_info['scan_result'],
+                                    total_processed, pipeline.queued, file_info['copies'], file_info['route'],
+                                    file_info['identity'], file_info['trusted'])
+            if result.get("category") in ("clean", "infected"):
+                pipeline.record_verdict(file_info, result["category"] == "clean")
+            tally_result(results, result)
+            console.result(result, total_processed, pipeline.queued)
+            record_history(result, pipeline)
+        clean_exit = True
+    except KeyboardInterrupt:
+        console.line()
+        console.summary(f"{NEON_YELLOW}🛑 Watch mode stopped{RESET}")
+        clean_exit = True
+    finally:
+        watcher.close()
+        scan_history.close()
+        # Anything but a deliberate stop leaves the journal for the next run to resume
+        if clean_exit:
+            scan_journal.finish()
+        else:
+            vt_client.close()
+        scan_journal.close()
+    
+    print_final_summary(results)
+    console.line()
+    vt_client.print_usage_stats()
+    vt_client.close()
+    console.flush()
+    if logger:
+        logger.log_scan_complete(len(results['clean']), len(results['infected']), len(results['unknown']))
+
+# =============================================
+# SCAN HISTORY LOOKUP
+# =============================================
+
+def handle_history_command(args):
+    """Handle vt history command - Look up past scans by hash or APK name"""
+    print()
+    show_report = "--report" in args
+    terms = [a for a in args if a != "--report"]
+    if not terms:
+        print(f"{NEON_YELLOW}Usage:{RESET}")
+        print(f"  {NEON_BLUE}vt history{RESET} {NEON_GREEN}<sha256|prefix|name>{RESET} - Show past scans")
+        print(f"  {NEON_BLUE}vt history{RESET} {NEON_GREEN}<sha256|prefix|name> --report{RESET} - Full report of the latest scan")
+        print()
+        return
+    
+    term = " ".join(terms)
+    history = ScanHistory()
+    try:
+        records = history.query(term)
+    except sqlite3.Error as e:
+        print(f"❌ Could not read scan history: {e}")
+        print()
+        return
+    finally:
+        history.close()
+    
+    if not records:
+        print(f"⚠️  {NEON_YELLOW}No scan history for: {term}{RESET}")
+        print()
+        return
     
+    print(f"{BOLD}📜 Scan History for \"{term}\" ({len(records)} records){RESET}")
+    for record in records:
+        category = record.get("category", "unknown")
+        category_color = NEON_GREEN if category == "clean" else NEON_RED if category == "infected" else NEON_YELLOW
+        scanned_at = datetime.fromtimestamp(record.get("scanned_at", 0)).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"      🕐 {scanned_at}  {category_color}{category.upper()}{RESET}  {colorize_apk_name(record.get('file', ''))}")
+        if "total" in record:
+            print(f"            📊 {record['malicious']} malicious, {record['suspicious']} suspicious out of {record['total']}")
+        elif record.get("reason"):
+            print(f"            ❓ {record['reason']}")
+        print(f"            🔑 {record.get('file_hash') or 'N/A'}")
+    
+    if show_report:
+        print()
+        print(render_scan_report(records[0]).rstrip())
     print()
-    print(separator)
+
+# =============================================
+# OFFLINE RECATEGORIZATION
+# =============================================
+
+def organized_path(record):
+    """Where the record's APK was organized to (older records only know the planned spot)"""
+    return record.get("organized_path") or organize_destination(record.get("path", ""), record["category"])
+
+def locate_organized_copies(record):
+    """Paths the record's APK and folded duplicates currently occupy in the organized folders"""
+    primary = organized_path(record)
+    folder = os.path.dirname(primary)
+    names = [os.path.basename(primary)] + [os.path.basename(copy) for copy in record.get("duplicates") or []]
+    return [os.path.join(folder, name) for name in names if name and os.path.isfile(os.path.join(folder, name))]
+
+def handle_recategorize_command(args):
+    """Handle vt recategorize command - Re-apply the detection lists to stored verdicts without rescanning"""
     print()
-    print(f"📄 Current Session: {display_path(logger.log_file)}")
+    apply_moves = "--move" in args
+    started = time.time()
+    history = ScanHistory()
+    try:
+        records = history.latest_verdicts()
+    except sqlite3.Error as e:
+        print(f"❌ Could not read scan history: {e}")
+        print()
+        history.close()
+        return
+    
+    print(f"{BOLD}🔁 Recategorizing {len(records)} scanned hashes against the current detection lists{RESET}")
+    changes = []
+    skipped = 0
+    for record in records:
+        detailed_analysis = record.get("detailed_analysis")
+        if detailed_analysis is None:
+            skipped += 1
+            continue
+        detections = build_detection_records(detailed_analysis)
+        category = categorize_apk(record.get("malicious", 0), record.get("suspicious", 0), detailed_analysis, detections)
+        if category != record["category"]:
+            changes.append((record, category, detections))
+    
+    moved = missing = 0
+    trust = SignerTrust(VT_STATE_DB) if apply_moves else None
+    for record, category, detections in changes:
+        old_color = NEON_GREEN if record["category"] == "clean" else NEON_RED
+        new_color = NEON_GREEN if category == "clean" else NEON_RED
+        print(f"      {old_color}{record['category'].upper()}{RESET} → {new_color}{category.upper()}{RESET}  "
+              f"{colorize_apk_name(record.get('file', ''))}")
+        flagging = [d for d in detections if d["flags_infected"]]
+        if flagging:
+            print(f"            ❌ {flagging[0]['vendor']}: {flagging[0]['result']}"
+                  + (f" (+{len(flagging) - 1} more)" if len(flagging) > 1 else ""))
+        else:
+            print("            ✅ Every detection is now whitelisted or safe")
+        
+        paths = locate_organized_copies(record)
+        if not paths:
+            missing += 1
+            print(f"            ⚠️  {NEON_YELLOW}Not found in {os.path.basename(os.path.dirname(organized_path(record)))}{RESET}")
+        if not apply_moves:
+            continue
+        updated = dict(record, category=category, detections=detections, method="recategorize",
+                       previous_category=record["category"], scanned_at=time.time())
+        for path in paths:
+            placement = {"category": category, "file_hash": record.get("file_hash")}
+            if organize_apk_file(path, placement) != "failed":
+                moved += 1
+                if path == organized_path(record):
+                    updated["organized_path"] = placement["organized_path"]
+        console.flush()
+        # History stays append-only: the new verdict supersedes the old one
+        history.add(updated)
+        if category == "infected" and record.get("apk_identity"):
+            trust.learn(ApkIdentity(**record["apk_identity"]), False)
+    history.close()
+    if trust:
+        trust.close()
+    
     print()
-    print(separator)
+    outcome = f"{len(changes)} changed category{RESET}, {moved} files moved" if apply_moves else f"{len(changes)} would change category{RESET}"
+    print(f"📊 {len(records) - skipped} verdicts re-evaluated in {time.time() - started:.2f}s, {NEON_YELLOW}{outcome}")
+    if missing:
+        print(f"⚠️  {missing} recategorized APKs are no longer in their organized folder")
+    if changes and not apply_moves:
+        print(f"💡 Run {NEON_BLUE}vt recategorize --move{RESET} to move them and record the new verdicts")
     print()
 
 # =============================================
@@ -1407,12 +2307,12 @@ def handle_backup_command(args):
     else:
         print(f"        ⚠️  {NEON_YELLOW}Blacklist file not found{RESET}")
     
-    # Clean up source directory - remove all scripts except the latest one
+    # Clean up source directory - remove older scanner versions, keep shared modules
     print(f"\n      🧹 Cleaning up source directory")
     if latest_script:
         removed_count = 0
         for script_file in script_files:
-            if script_file != latest_script:
+            if 'detailed_apk_scanner_v' in script_file and script_file != latest_script:
                 try:
                     os.remove(os.path.join(SCRIPT_DIR, script_file))
                     print(f"        🗑️  {NEON_YELLOW}Removed: {script_file}{RESET}")
@@ -1512,9 +2412,15 @@ def main():
     global logger
     
     # Check for command line arguments
-    import sys
     args = sys.argv[1:]  # Skip script name
     
+    # Output mode flags apply to scan and watch runs
+    if "--json" in args:
+        console.mode = "json"
+    elif "--quiet" in args or "-q" in args:
+        console.mode = "quiet"
+    args = [a for a in args if a not in ("--json", "--quiet", "-q")]
+    
     # Handle different command formats
     command = None
     command_args = []
@@ -1522,11 +2428,11 @@ def main():
     if len(args) == 0:
         # No arguments - run normal scan
         pass
-    elif args[0] in ["vt-white", "vt-black", "vt-backup"]:
+    elif args[0] in ["vt-white", "vt-black", "vt-backup", "watch", "history", "recategorize"]:
         # Direct command: python script.py vt-white ...
         command = args[0]
         command_args = args[1:] if len(args) > 1 else []
-    elif len(args) >= 2 and args[0] == "vt" and args[1] in ["vt-white", "vt-black", "vt-backup"]:
+    elif len(args) >= 2 and args[0] == "vt" and args[1] in ["vt-white", "vt-black", "vt-backup", "watch", "history", "recategorize"]:
         # Alias command: vt vt-white ...
         command = args[1]
         command_args = args[2:] if len(args) > 2 else []
@@ -1547,12 +2453,29 @@ def main():
     elif command == "vt-backup":
         handle_backup_command(command_args)
         return
+    elif command == "history":
+        handle_history_command(command_args)
+        return
+    elif command == "recategorize":
+        handle_recategorize_command(command_args)
+        return
+    elif command == "watch":
+        if not API_KEYS:
+            print("❌ Please set VT_API_KEY (or VT_API_KEYS) in your .env file")
+            exit(1)
+        watch_scan()
+        return
     elif command == "help":
         print()  # Empty line before help
         print(f"{BOLD}📖 VirusTotal PowerScanner v{VERSION} - Help{RESET}")
         print()
         print(f"{NEON_BLUE}Usage:{RESET}")
         print(f"  {NEON_GREEN}vt{RESET} - Run normal scan")
+        print(f"  {NEON_GREEN}vt watch{RESET} - Keep running and scan APKs as they land")
+        print(f"  {NEON_GREEN}vt --quiet{RESET} - One line per APK plus the final summary (also for watch)")
+        print(f"  {NEON_GREEN}vt --json{RESET} - Stream NDJSON events for scripts (also for watch)")
+        print(f"  {NEON_GREEN}vt history <hash|name>{RESET} - Show past scans (add --report for the full report)")
+        print(f"  {NEON_GREEN}vt recategorize{RESET} - Re-apply white/blacklists to past verdicts offline (add --move to apply)")
         print(f"  {NEON_GREEN}vt vt-white <pattern>{RESET} - Add to whitelist")
         print(f"  {NEON_GREEN}vt vt-black <pattern>{RESET} - Add to blacklist")
         print(f"  {NEON_GREEN}vt vt-backup{RESET} - Backup scripts and detection lists")
@@ -1568,6 +2491,10 @@ def main():
         print(f"  {NEON_GREEN}python {sys.argv[0]} vt-black <pattern>{RESET}")
         print(f"  {NEON_GREEN}python {sys.argv[0]} vt-backup{RESET}")
         print()
+        print(f"{NEON_BLUE}Environment:{RESET}")
+        print(f"  {NEON_GREEN}VT_API_KEY=<key>{RESET} - Single API key")
+        print(f"  {NEON_GREEN}VT_API_KEYS=<key1>,<key2>{RESET} - Spread lookups across a pool of keys")
+        print()
         print(f"{NEON_BLUE}Examples:{RESET}")
         print(f"  {NEON_YELLOW}vt vt-white \"Microsoft: Trojan:Script/Wacatac.B!ml\"{RESET}")
         print(f"  {NEON_YELLOW}vt vt-black \"SomeVendor: Trojan.Generic\"{RESET}")
@@ -1575,8 +2502,8 @@ def main():
         return
     
     # Normal scan execution
-    if not API_KEY:
-        print("❌ Please set VT_API_KEY in your .env file")
+    if not API_KEYS:
+        print("❌ Please set VT_API_KEY (or VT_API_KEYS) in your .env file")
         exit(1)
     
     power_scan_all()
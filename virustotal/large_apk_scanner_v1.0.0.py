@@ -3,10 +3,13 @@
 # Visual style synchronized with detailed_apk_scanner_v1.5.7
 # Same directories, same .env, but supports uploads up to 650 MB.
 
-import os, sys, json, time, random, shutil, hashlib, requests
-from pathlib import Path
+import os, sys, json, time, random, threading
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from vt_common import (DISCOVERY_CONFIG, PENDING_CONFIG, QUOTA_CONFIG, UPLOAD_LIMITS, DetectionMatcher,
+                       MultipartFileStream, PendingAnalyses, QuotaExhausted, QuotaLedger, ScanEngine,
+                       VerdictCache, dedupe_copy, discover_apks, found_result_from_report, key_fingerprint,
+                       place_file, retry_after_seconds, shared_transport)
 
 VERSION = "1.0.1"
 PROJECT_DIR = "/data/data/com.termux/files/home/kh-scripts/virustotal"
@@ -27,6 +30,7 @@ PENDING_DIR = f"{APK_BASE}/Pending_Manual_Review_APKs"
 RESULTS_DIR = f"{APK_BASE}/Termux–VirusTotal_Scan_Results"
 LOGS_DIR = f"{APK_BASE}/Termux–VirusTotal_Scan_Logs"
 BACKUP_DIR = f"{PROJECT_DIR}/backup"
+STATE_DB = f"{APK_BASE}/vt_state.sqlite3"
 for d in [CLEAN_APKS_DIR, INFECTED_APKS_DIR, TOO_LARGE_DIR,
           PENDING_DIR, RESULTS_DIR, LOGS_DIR, BACKUP_DIR]:
     os.makedirs(d, exist_ok=True)
@@ -84,12 +88,6 @@ def log(msg,level="INFO"):
             f.write(f"[{ts}] [{level}] {msg}\n")
     except: pass
 
-def sha256sum(path):
-    h=hashlib.sha256()
-    with open(path,"rb") as f:
-        for chunk in iter(lambda:f.read(65536),b""): h.update(chunk)
-    return h.hexdigest()
-
 def human(n):
     for u in ["B","KB","MB","GB"]:
         if n<1024.0: return f"{n:3.1f}{u}"
@@ -99,14 +97,13 @@ def human(n):
 # ===== REPLACEMENT PART B: scanning engine, detection logic, file moves, results =====
 # Replace the previous PART B content in large_apk_scanner_v1.0.1.py with this block.
 
-MAX_STD = 32 * 1024 * 1024
-MAX_LARGE = 650 * 1024 * 1024
-WAIT_BETWEEN = 15
-RATE_LIMIT_WAIT = 60
-
-# Simple detection keywords (heuristic)
-SAFE_INDICATORS = ['pup','pua','riskware','potentially unwanted','unwanted','adware']
-MALICIOUS_INDICATORS = ['trojan','virus','malware','worm','backdoor','exploit','ransomware']
+MAX_STD = UPLOAD_LIMITS["max_std"]
+MAX_LARGE = UPLOAD_LIMITS["max_large"]
+RATE_LIMIT_WAIT = 60  # used when a 429 carries no Retry-After
+LOOKUP_ATTEMPTS = 3
+UPLOAD_ATTEMPTS = 3
+UPLOAD_RETRY_WAIT = 15  # doubled after each failed upload attempt
+UPLOAD_RETRY_STATUS = (408, 429, 500, 502, 503, 504)
 
 # Detection list manager (loads JSON arrays, gracefully handles missing files)
 class DetectionListManager:
@@ -115,6 +112,8 @@ class DetectionListManager:
         self.blacklist_file = os.path.join(project_dir, "blacklist.json")
         self.whitelist = self._load(self.whitelist_file)
         self.blacklist = self._load(self.blacklist_file)
+        # lists are read-only here, so the matcher is compiled once
+        self.matcher = DetectionMatcher(self.whitelist, self.blacklist)
 
     def _load(self, path):
         try:
@@ -126,13 +125,14 @@ class DetectionListManager:
             pass
         return set()
 
+    def classify(self, vendor, result):
+        return self.matcher.classify(vendor, result)
+
     def is_whitelisted(self, vendor, result):
-        t = f"{vendor}: {result}".lower()
-        return any(pat.lower() in t for pat in self.whitelist)
+        return "whitelisted" in self.classify(vendor, result)
 
     def is_blacklisted(self, vendor, result):
-        t = f"{vendor}: {result}".lower()
-        return any(pat.lower() in t for pat in self.blacklist)
+        return "blacklisted" in self.classify(vendor, result)
 
 detection_manager = DetectionListManager(PROJECT_DIR)
 
@@ -178,29 +178,127 @@ def save_scan_text_result(scan_result):
     except Exception:
         return False
 
-# Move helper (safe)
-def move_file_to_folder(src_path, dest_dir):
+# Move helper (safe): atomic rename on the same filesystem, fsync'd chunked copy across
+# filesystems; an identical file already there absorbs this one, a different one gets "name (2).apk"
+def move_file_to_folder(src_path, dest_dir, sha=None):
     try:
-        os.makedirs(dest_dir, exist_ok=True)
-        dest = os.path.join(dest_dir, os.path.basename(src_path))
-        if os.path.exists(dest):
-            base, ext = os.path.splitext(os.path.basename(dest))
-            dest = os.path.join(dest_dir, f"{base}_{int(time.time())}{ext}")
-        shutil.move(src_path, dest)
+        dest, action = place_file(src_path, dest_dir, sha)
+        if action == "duplicate": log(f"Identical {os.path.basename(dest)} already in {dest_dir}; dropped {src_path}")
         return dest
-    except Exception:
+    except Exception as e:
+        log(f"Failed to move {src_path} to {dest_dir}: {e}", "ERROR")
         return None
 
-# VT helper class (thin wrapper)
+# VT helper class (binds the API key to the shared keep-alive transport)
+# Every API call first reserves a slot in the quota ledger shared with the detailed
+# scanner, so both scanners running at once still stay under the key's limits.
+# lookup() and upload() are what the shared ScanEngine calls; lookups read the
+# detailed scanner's verdict cache first, so content it already saw costs no quota.
 class VT:
     def __init__(self,key):
-        self.s = requests.Session()
-        if key:
-            self.s.headers.update({"x-apikey": key})
+        self.key = key
+        self.key_id = key_fingerprint(key)
+        self.transport = shared_transport()
+        self.ledger = QuotaLedger(STATE_DB)
+        self.cache = VerdictCache(STATE_DB, on_error=lambda message: log(message, "ERROR"))
+    def _reserve(self):
+        if not self.ledger.acquire(self.key_id, clock=time):
+            raise QuotaExhausted("daily or monthly VirusTotal quota used up")
+    def _note(self, r):
+        if r.status_code == 429:
+            wait = retry_after_seconds(r, RATE_LIMIT_WAIT)
+            self.ledger.block(self.key_id, time.time() + wait, time.time())
+        return r
     def get(self, path, **kwargs):
-        return self.s.get(path, timeout=40, **kwargs)
-    def post(self, path, files=None, **kwargs):
-        return self.s.post(path, files=files, timeout=600, **kwargs)
+        self._reserve()
+        return self._note(self.transport.get(path, self.key, timeout=40, **kwargs))
+    def post(self, path, files=None, timeout=600, metered=True, **kwargs):
+        # the signed upload_url POST is not an API call and is not metered
+        if metered: self._reserve()
+        return self._note(self.transport.post(path, self.key, files=files, timeout=timeout, **kwargs))
+    def lookup(self, sha):
+        cached = self.cache.get(sha)
+        if cached: return found_result_from_report(cached, cached=True)
+        for attempt in range(LOOKUP_ATTEMPTS):
+            r = self.get(f"{BASE_URL}/files/{sha}")
+            if r.status_code != 429: break
+            wait = retry_after_seconds(r, RATE_LIMIT_WAIT)
+            print(f"{NEON_YELLOW}⚠️ Rate limited on lookup — retrying after {wait:.0f}s ({attempt + 1}/{LOOKUP_ATTEMPTS}){RESET}")
+        if r.status_code == 200:
+            report = r.json()
+            self.cache.put(sha, report)
+            return found_result_from_report(report)
+        if r.status_code == 404: return {"status": "not_found"}
+        if r.status_code == 429: return {"status": "rate_limited_after_retries"}
+        return {"status": "api_error", "code": r.status_code}
+    def upload(self, apk, size, route):
+        upload_resp = upload_apk(self, apk, size, route)
+        if upload_resp is not None and upload_resp.status_code in (200, 201):
+            try:
+                analysis_id = (upload_resp.json().get("data") or {}).get("id")
+            except Exception:
+                analysis_id = None  # the poller falls back to hash lookups
+            return {"status": "uploaded", "analysis_id": analysis_id}
+        note = f"HTTP {upload_resp.status_code}" if upload_resp is not None else "no response"
+        return {"status": "upload_failed", "error": note}
+    def close(self):
+        self.cache.close()
+        self.ledger.close()
+
+# Upload progress line: sent / total, percentage and running throughput
+class UploadMeter:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.shown = 0.0
+        self.open = False  # progress line printed without its newline yet
+    def rate(self, sent):
+        elapsed = time.monotonic() - self.started
+        return sent / elapsed if elapsed > 0 else 0.0
+    def update(self, sent, total):
+        now = time.monotonic()
+        if sent < total and now - self.shown < 0.5: return
+        self.shown, self.open = now, True
+        print(f"\r{NEON_BLUE}   ⬆️ {human(sent)} / {human(total)} ({sent * 100 // max(total, 1)}%) at {human(self.rate(sent))}/s{RESET}", end="", flush=True)
+    def finish(self, sent):
+        elapsed = time.monotonic() - self.started
+        self.open = False
+        print(f"\n{NEON_BLUE}   Sent {human(sent)} in {elapsed:.1f}s ({human(self.rate(sent))}/s){RESET}")
+
+# Stream an APK to VT as multipart without loading it into memory.
+# The "upload_url" lane gets a fresh upload_url on every attempt; transient failures back off and retry.
+# Returns the last response (None if no attempt got one). QuotaExhausted propagates to the caller.
+def upload_apk(vt, apk, size, route="direct"):
+    print(f"{NEON_BLUE}⬆️ Uploading {colorize_name(apk.name)} {NEON_BLUE}({human(size)}) to VirusTotal...{RESET}")
+    upload_resp = meter = None
+    for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+        try:
+            url, metered, timeout = f"{BASE_URL}/files", True, 600
+            if route == "upload_url":
+                uu = vt.get(f"{BASE_URL}/files/upload_url")
+                if uu.status_code != 200: raise RuntimeError(f"upload_url request returned {uu.status_code}")
+                j = uu.json()
+                url = (j.get("data") or {}).get("upload_url") if isinstance(j.get("data"), dict) else j.get("data")
+                if not url: raise RuntimeError("upload_url missing from response")
+                metered, timeout = False, 900
+            meter = UploadMeter()
+            with MultipartFileStream(apk, filename=apk.name, progress=meter.update) as body:
+                upload_resp = vt.post(url, data=body, headers={"Content-Type": body.content_type},
+                                      timeout=timeout, metered=metered)
+                meter.finish(body.sent)
+            if upload_resp.status_code in (200, 201) or upload_resp.status_code not in UPLOAD_RETRY_STATUS:
+                return upload_resp
+            problem = f"HTTP {upload_resp.status_code}"
+        except QuotaExhausted:
+            raise
+        except Exception as e:
+            problem = str(e)
+        if meter is not None and meter.open: print()
+        if attempt == UPLOAD_ATTEMPTS: break
+        # a 429 already blocked the key in the ledger, so the next reservation does the waiting
+        wait = 0 if upload_resp is not None and upload_resp.status_code == 429 else UPLOAD_RETRY_WAIT * 2 ** (attempt - 1)
+        print(f"{NEON_YELLOW}⚠️ Upload attempt {attempt}/{UPLOAD_ATTEMPTS} failed ({problem}) — retrying in {wait}s{RESET}")
+        time.sleep(wait)
+    return upload_resp
 
 # Extract last_analysis_results safely
 def parse_last_analysis_results(vt_file_json):
@@ -215,7 +313,127 @@ def parse_last_analysis_stats(vt_file_json):
     except Exception:
         return {}
 
+# Apply whitelist/blacklist & heuristics to vendor results; returns (category, vendor->result map)
+def categorize_results(last_results):
+    results_map = {}
+    for vendor, info in last_results.items():
+        # 'result' sometimes None; fallback to category or engine name
+        res = info.get("result") or info.get("category") or info.get("engine_name") or "unknown"
+        results_map[vendor] = res
+    mal_count = 0
+    for vendor, res in results_map.items():
+        labels = detection_manager.classify(vendor, res)
+        if "whitelisted" in labels:
+            continue
+        # blacklist or heuristic
+        if "blacklisted" in labels or "malicious" in labels:
+            mal_count += 1
+    return ("INFECTED" if mal_count > 0 else "CLEAN"), results_map
+
+# One status check for an uploaded file; returns (stats, vendor results) once VT has finished, else None
+def poll_analysis(vt, entry):
+    if entry["analysis_id"]:
+        r = vt.get(f"{BASE_URL}/analyses/{entry['analysis_id']}")
+        if r.status_code != 200: return None
+        attrs = (r.json().get("data") or {}).get("attributes") or {}
+        if attrs.get("status") != "completed": return None
+        return attrs.get("stats") or {}, attrs.get("results") or {}
+    r = vt.get(f"{BASE_URL}/files/{entry['sha256']}")
+    if r.status_code != 200: return None
+    file_json = r.json()
+    return parse_last_analysis_stats(file_json) or {}, parse_last_analysis_results(file_json)
+
+# Move every copy of a finished upload out of Pending into Clean / Infected and save its result
+def finalize_analysis(entry, stats, last_results):
+    category, results_map = categorize_results(last_results)
+    dest_dir = CLEAN_APKS_DIR if category == "CLEAN" else INFECTED_APKS_DIR
+    mal, susp = stats.get("malicious", 0), stats.get("suspicious", 0)
+    color = NEON_RED if category == "INFECTED" else NEON_GREEN
+    for path in entry["paths"]:
+        if not os.path.exists(path):
+            log(f"Pending copy {path} is gone; nothing to move", "WARNING")
+            continue
+        moved = move_file_to_folder(path, dest_dir, entry["sha256"])
+        print(f"{NEON_BLUE}🔄 Analysis finished for {colorize_name(os.path.basename(path))}: {color}{category}{RESET}")
+        save_scan_text_result({
+            "file": os.path.basename(path),
+            "path": moved or path,
+            "size": human(os.path.getsize(moved or path)),
+            "category": category,
+            "method": "analysis_poll",
+            "file_hash": entry["sha256"],
+            "detection_summary": {"malicious": mal, "suspicious": susp, "total": sum(stats.values())},
+            "detailed": results_map
+        })
+    log(f"Finalized pending analysis {entry['sha256'][:12]} as {category}")
+    return category
+
+# Background poller for the pending-analysis queue.
+# It shares the key's ledger with the scan (so polls are paced with lookups) and stops
+# polling while fewer than PENDING_CONFIG["daily_reserve"] requests are left today.
+class AnalysisPoller:
+    def __init__(self, vt, queue):
+        self.vt = vt
+        self.queue = queue
+        self.lock = threading.Lock()  # held while the copies of a pending hash are checked or moved
+        self.stopping = threading.Event()
+        self.thread = None
+        self.finalized = 0
+    def headroom(self):
+        usage = self.vt.ledger.usage(self.vt.key_id, time.time())
+        return QUOTA_CONFIG["daily_limit"] - usage["day"] > PENDING_CONFIG["daily_reserve"]
+    def poll_due(self):
+        done = 0
+        for entry in self.queue.due(time.time()):
+            if self.stopping.is_set() or not self.headroom(): break
+            try:
+                verdict = poll_analysis(self.vt, entry)
+            except QuotaExhausted:
+                break
+            except Exception as e:
+                log(f"Analysis poll failed for {entry['sha256'][:12]}: {e}", "WARNING")
+                verdict = None
+            if verdict is None:
+                interval = self.queue.reschedule(entry["sha256"], time.time())
+                log(f"Analysis {entry['sha256'][:12]} still queued; next check in {interval:.0f}s")
+                continue
+            with self.lock:
+                finalize_analysis(entry, *verdict)
+                self.queue.resolve(entry["sha256"])
+            done += 1
+        self.finalized += done
+        return done
+    def _run(self):
+        while not self.stopping.is_set():
+            self.poll_due()
+            next_poll = self.queue.next_poll_at()
+            wait = PENDING_CONFIG["idle_wait"] if next_poll is None else max(1, next_poll - time.time())
+            self.stopping.wait(min(wait, PENDING_CONFIG["idle_wait"]))
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="vt-analysis-poller", daemon=True)
+        self.thread.start()
+    def stop(self):
+        self.stopping.set()
+        if self.thread: self.thread.join()
+
 # Main scanning loop
+# Fold identical copies next to where their primary ended up; returns the paths of new links
+def fold_copies(copies, primary, sha):
+    linked = []
+    for copy in copies:
+        action = dedupe_copy(str(copy), primary, sha)
+        print(f"🧬 {copy.name}: {action} next to {os.path.basename(primary)}")
+        log(f"Duplicate {copy} of {primary}: {action}")
+        if action == "linked":
+            linked.append(os.path.join(os.path.dirname(primary), copy.name))
+    return linked
+
+# The shared ScanEngine with this scanner's hash-failure reporting
+class LargeScanEngine(ScanEngine):
+    def on_hash_failed(self, apk, error):
+        print(f"{NEON_RED}❌ Failed to hash {colorize_name(apk.name)}{NEON_RED}: {error}{RESET}")
+        log(f"Hash failed for {apk.name}: {error}", "ERROR")
+
 def scan_files():
     if not API_KEY:
         print(f"{NEON_RED}❌ VT_API_KEY missing in .env{RESET}")
@@ -224,18 +442,15 @@ def scan_files():
     # header already printed in Part A run; optional here as well
     show_header()
 
-    # gather apks
-    all_apks = []
+    # gather apks (one scandir pass, each file once even if reachable twice)
+    all_apks = discover_apks(SCAN_DIRS, exclude=DISCOVERY_CONFIG["exclude"] + [APK_BASE])
     for d in SCAN_DIRS:
-        p = Path(d)
-        if not p.exists(): continue
-        found = sorted(list(p.glob("*.apk")))
+        found = [a for a in all_apks if a.root == d]
         if found:
             print(dual_line(f"📂 Scanning Directory: {PATH_COLOR}{shorten(d)}{RESET}",
                             f"📁 Found {len(found)} APK Files"))
             for a in found:
-                print(f"      • {colorize_name(a.name)}")
-            all_apks.extend(found)
+                print(f"      • {colorize_name(a.path.name)}")
 
     if not all_apks:
         print(f"{NEON_YELLOW}❌ No APK files found.{RESET}")
@@ -244,63 +459,72 @@ def scan_files():
     print(rule_line("=", 60))
     vt = VT(API_KEY)
     results = []
-
-    for idx, apk in enumerate(all_apks, start=1):
+    pending = PendingAnalyses(STATE_DB)
+    poller = AnalysisPoller(vt, pending)
+    poller.start()
+
+    # the shared engine hashes each file once, folds identical copies into one lookup,
+    # skips hashes already pending and routes 404s into the size lanes (direct / upload_url / too large)
+    # files from signers with a clean record are looked up after unknown publishers
+    engine = LargeScanEngine(vt.lookup, [all_apks], STATE_DB, upload=vt.upload, max_std=MAX_STD, max_large=MAX_LARGE,
+                             clean_dirs=[CLEAN_APKS_DIR])
+    for idx, (sha, info) in enumerate(engine.run(), start=1):
+        apk, size, copies = info["apk_file"], info["size"], info["copies"]
+        scan_result = info["scan_result"]
+        status = scan_result["status"]
         print(rule_line("=", 60))
-        print(f"🔍 Processing File {idx} of {len(all_apks)}: {colorize_name(apk.name)}")
+        print(f"🔍 Processing File {idx}: {colorize_name(apk.name)}")
         print(f"📍 Path: {PATH_COLOR}{shorten(str(apk.parent))}{RESET}")
-        size = apk.stat().st_size
         print(f"💾 Size: {human(size)}")
-        sha = sha256sum(apk)
         print(f"🔑 Hash: {sha[:20]}...")
-
-        # 1) Try hash lookup
-        try:
-            r = vt.get(f"{BASE_URL}/files/{sha}")
-        except Exception as e:
-            print(f"{NEON_YELLOW}⚠️ Network error during lookup: {e}{RESET}")
-            results.append({"file":apk.name,"category":"unknown","note":"network_error"})
-            # move on
-            if idx < len(all_apks): time.sleep(WAIT_BETWEEN)
-            continue
-
-        if r.status_code == 200:
-            file_json = r.json()
+        identity, trusted = info["identity"], info["trusted"]
+        if identity and identity.package:
+            print(f"📦 Package: {identity.package} {identity.version_name or ''}".rstrip())
+        if trusted:
+            print(f"🛡️  Known signer ({trusted['clean']} clean builds) — looked up after unknown publishers")
+        for copy in copies:
+            print(f"🧬 Identical copy: {PATH_COLOR}{shorten(str(copy))}{RESET}")
+        share = 1 + len(copies)  # every copy counts toward the summary
+
+        if status == "pending":
+            # uploaded earlier and still being analysed: park these copies with it for the poller
+            with poller.lock:
+                entry = pending.get(sha)
+                primary = next((p for p in entry["paths"] if os.path.exists(p)), None) if entry else None
+                parked = [apk] + copies
+                if entry and not primary:
+                    # the pending file itself went missing: this copy takes its place
+                    primary = move_file_to_folder(str(apk), PENDING_DIR, sha)
+                    if primary:
+                        pending.add_path(sha, primary)
+                        parked = copies
+                if primary:
+                    for linked in fold_copies(parked, primary, sha):
+                        pending.add_path(sha, linked)
+            print(f"{NEON_BLUE}⏳ Already uploaded, analysis pending{RESET}" if primary else
+                  f"{NEON_YELLOW}⚠️ Analysis finished while this file was queued — left for the next run{RESET}")
+            results.extend(["PENDING"] * share)
+
+        elif status == "found":
+            file_json = scan_result["full_data"]
             stats = parse_last_analysis_stats(file_json) or {}
             mal = stats.get("malicious", 0)
             susp = stats.get("suspicious", 0)
             tot = sum(stats.values()) if stats else 0
-            # Build simple vendor->result map
-            results_map = {}
-            last_results = parse_last_analysis_results(file_json)
-            for vendor, info in last_results.items():
-                # 'result' sometimes None; fallback to category or engine name
-                res = info.get("result") or info.get("category") or info.get("engine_name") or "unknown"
-                results_map[vendor] = res
-
-            # Apply whitelist/blacklist & heuristics
-            mal_count = 0
-            for vendor, res in results_map.items():
-                if detection_manager.is_whitelisted(vendor, res):
-                    continue
-                if detection_manager.is_blacklisted(vendor, res):
-                    mal_count += 1
-                    continue
-                # heuristic
-                low = (res or "").lower()
-                if any(k in low for k in MALICIOUS_INDICATORS):
-                    mal_count += 1
-
-            # final categorization
-            category = "INFECTED" if mal_count > 0 else "CLEAN"
+            category, results_map = categorize_results(parse_last_analysis_results(file_json))
+            engine.record_verdict(info, category == "CLEAN")
             color = NEON_RED if category == "INFECTED" else NEON_GREEN
             print(f"📊 Detection Summary: {mal} malicious, {susp} suspicious out of {tot}")
+            if scan_result.get("cached"):
+                print("⚡ Cached verdict (no API quota used)")
             print(f"🏷️  Categorization: {color}{category}{RESET}")
 
             # move file
             dest_dir = CLEAN_APKS_DIR if category == "CLEAN" else INFECTED_APKS_DIR
-            moved = move_file_to_folder(str(apk), dest_dir)
+            moved = move_file_to_folder(str(apk), dest_dir, sha)
             moved_path = moved or str(apk)
+            if moved:
+                fold_copies(copies, moved, sha)
             # save result
             scan_result = {
                 "file": apk.name,
@@ -313,65 +537,55 @@ def scan_files():
                 "detailed": results_map
             }
             save_scan_text_result(scan_result)
-            results.append(category)
-
-        elif r.status_code == 404:
-            # Not found -> attempt upload if allowed by size
-            if size > MAX_LARGE:
-                note = f"File larger than allowed maximum ({human(MAX_LARGE)})"
-                print(f"{NEON_YELLOW}⚠️ {note}{RESET}")
-                moved = move_file_to_folder(str(apk), TOO_LARGE_DIR)
-                scan_result = {"file": apk.name, "path": moved or str(apk), "size": human(size), "category":"TOO_LARGE", "method":"skip_too_large", "note":note}
-                save_scan_text_result(scan_result)
-                results.append("TOO_LARGE")
-            else:
-                print(f"{NEON_BLUE}⬆️ Uploading {human(size)} to VirusTotal...{RESET}")
-                upload_ok = False
-                upload_resp = None
-                try:
-                    if size <= MAX_STD:
-                        with open(apk, "rb") as f:
-                            files = {"file": (apk.name, f)}
-                            upload_resp = vt.post(f"{BASE_URL}/files", files=files)
-                    else:
-                        # try getting upload URL
-                        uu = vt.get(f"{BASE_URL}/files/upload_url")
-                        if uu.status_code == 200:
-                            j = uu.json()
-                            upload_url = (j.get("data") or {}).get("upload_url") or j.get("data")
-                            if upload_url:
-                                with open(apk, "rb") as f:
-                                    files = {"file": (apk.name, f)}
-                                    upload_resp = requests.post(upload_url, files=files, timeout=900)
-                except Exception as e:
-                    print(f"{NEON_YELLOW}⚠️ Upload error: {e}{RESET}")
-
-                if upload_resp is not None and upload_resp.status_code in (200,201):
-                    print(f"{NEON_GREEN}✔ Uploaded successfully. File moved to Pending for manual review while VT processes it.{RESET}")
-                    moved = move_file_to_folder(str(apk), PENDING_DIR)
-                    scan_result = {"file": apk.name, "path": moved or str(apk), "size": human(size), "category":"PENDING", "method":"uploaded", "note":"uploaded_wait"}
-                    save_scan_text_result(scan_result)
-                    results.append("PENDING")
-                else:
-                    print(f"{NEON_RED}❌ Upload failed or not available. Moved to Too_Large / Pending as fallback.{RESET}")
-                    # fallback: move to TOO_LARGE to avoid frantic retries
-                    moved = move_file_to_folder(str(apk), TOO_LARGE_DIR)
-                    scan_result = {"file": apk.name, "path": moved or str(apk), "size": human(size), "category":"UPLOAD_FAILED", "method":"upload_failed", "note": str(upload_resp)}
-                    save_scan_text_result(scan_result)
-                    results.append("UPLOAD_FAILED")
-
-        elif r.status_code == 429:
-            print(f"{NEON_YELLOW}⚠️ Rate limited on lookup — waiting {RATE_LIMIT_WAIT}s{RESET}")
-            time.sleep(RATE_LIMIT_WAIT)
-            results.append("RATE_LIMIT")
+            results.extend([category] * share)
+
+        elif status == "too_large":
+            note = f"File larger than allowed maximum ({human(MAX_LARGE)})"
+            print(f"{NEON_YELLOW}⚠️ {note}{RESET}")
+            moved = move_file_to_folder(str(apk), TOO_LARGE_DIR, sha)
+            if moved:
+                fold_copies(copies, moved, sha)
+            scan_result = {"file": apk.name, "path": moved or str(apk), "size": human(size), "category":"TOO_LARGE", "method":"skip_too_large", "note":note}
+            save_scan_text_result(scan_result)
+            results.extend(["TOO_LARGE"] * share)
+
+        elif status == "uploaded":
+            analysis_id = scan_result.get("analysis_id")
+            print(f"{NEON_GREEN}✔ Uploaded successfully ({info['route']}). File moved to Pending until VT finishes its analysis.{RESET}")
+            with poller.lock:
+                moved = move_file_to_folder(str(apk), PENDING_DIR, sha)
+                pending.add(sha, analysis_id, moved or str(apk))
+                if moved:
+                    for linked in fold_copies(copies, moved, sha):
+                        pending.add_path(sha, linked)
+            scan_result = {"file": apk.name, "path": moved or str(apk), "size": human(size), "category":"PENDING", "method":"uploaded", "note":f"analysis {analysis_id or 'queued'}"}
+            save_scan_text_result(scan_result)
+            results.extend(["PENDING"] * share)
+
+        elif status == "upload_failed":
+            # the file fits VT's limit, so it stays where it is and the next run uploads it again
+            note = scan_result.get("error") or "no response"
+            print(f"{NEON_RED}❌ Upload failed after {UPLOAD_ATTEMPTS} attempts ({note}). Left in place for the next run.{RESET}")
+            scan_result = {"file": apk.name, "path": str(apk), "size": human(size), "category":"UPLOAD_FAILED", "method":"upload_failed", "note": note}
+            save_scan_text_result(scan_result)
+            results.extend(["UPLOAD_FAILED"] * share)
+
+        elif status == "quota_exhausted":
+            print(f"{NEON_YELLOW}⚠️ Daily or monthly VirusTotal quota used up — left for the next run{RESET}")
+            results.extend(["QUOTA_EXHAUSTED"] * share)
+        elif status == "rate_limited_after_retries":
+            print(f"{NEON_YELLOW}⚠️ Still rate limited after {LOOKUP_ATTEMPTS} attempts — leaving it for the next run{RESET}")
+            results.extend(["RATE_LIMIT"] * share)
         else:
-            print(f"{NEON_YELLOW}⚠️ Unexpected response from VT: {r.status_code}{RESET}")
-            results.append("ERROR")
+            print(f"{NEON_YELLOW}⚠️ Unexpected response from VT: {scan_result.get('code') or scan_result.get('error') or status}{RESET}")
+            results.extend(["ERROR"] * share)
+
+    results.extend(["ERROR"] * engine.hash_failures)
 
-        # inter-file wait
-        if idx < len(all_apks):
-            print(f"⏳ Waiting {WAIT_BETWEEN}s before next file...")
-            time.sleep(WAIT_BETWEEN)
+    poller.stop()
+    still_pending = pending.count()
+    pending.close()
+    vt.close()
 
     # Summary block (matching v1.5.7 style)
     print(rule_line("=", 60))
@@ -382,6 +596,12 @@ def scan_files():
     print(f"      ✅ {NEON_GREEN}Clean & Safe: {clean_count}{RESET}")
     print(f"      🚨 {NEON_RED}Infected & High Risk: {infected_count}{RESET}")
     print(f"      ❓ {NEON_YELLOW}Unknown / Pending: {unknown_count}{RESET}")
+    if poller.finalized:
+        print(f"      🔄 {NEON_BLUE}Pending analyses finalized: {poller.finalized}{RESET}")
+    if engine.deprioritized:
+        print(f"      🛡️  Known-signer files looked up last: {engine.deprioritized}")
+    if still_pending:
+        print(f"      ⏳ {NEON_YELLOW}Still awaiting VT analysis: {still_pending} (run with --poll to wait for them){RESET}")
     print(rule_line("=", 60))
 
     # Organized Files Snapshot
@@ -398,6 +618,37 @@ def scan_files():
     print(f"      ⚠️ Too Large For VT: {too_large_files}")
     print(f"\n📄 Session Log: {PATH_COLOR}{shorten(LOGS_DIR)}/scan_session_*.log{RESET}\n")
 
+# Wait in the foreground until every pending upload has a verdict (--poll)
+def poll_pending():
+    if not API_KEY:
+        print(f"{NEON_RED}❌ VT_API_KEY missing in .env{RESET}")
+        sys.exit(1)
+    show_header()
+    vt = VT(API_KEY)
+    pending = PendingAnalyses(STATE_DB)
+    poller = AnalysisPoller(vt, pending)
+    print(f"⏳ Pending analyses: {pending.count()}")
+    try:
+        while pending.count():
+            poller.poll_due()
+            if not poller.headroom():
+                print(f"{NEON_YELLOW}⚠️ Daily quota nearly used up; polling resumes on the next run{RESET}")
+                break
+            next_poll = pending.next_poll_at()
+            wait = next_poll - time.time() if next_poll is not None else 0
+            if wait > 0:
+                print(f"{NEON_BLUE}💤 Next check in {wait:.0f}s ({pending.count()} pending){RESET}")
+                time.sleep(wait)
+    except KeyboardInterrupt:
+        print(f"\n{NEON_YELLOW}⚠️ Interrupted; the queue is saved for the next run{RESET}")
+    finally:
+        print(f"🔄 Finalized: {poller.finalized}, still pending: {pending.count()}")
+        pending.close()
+        vt.close()
+
 # Run scanner when this block is executed
 if __name__ == "__main__":
-    scan_files()
+    if "--poll" in sys.argv[1:]:
+        poll_pending()
+    else:
+        scan_files()
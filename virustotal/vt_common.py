@@ -0,0 +1,1532 @@
+#!/usr/bin/env python3
+# vt_common.py
+# Shared building blocks for detailed_apk_scanner and large_apk_scanner.
+# Lives next to the scanners, which import it from their own directory.
+
+import os
+import re
+import atexit
+import sqlite3
+import hashlib
+import threading
+import json
+import time
+import shutil
+import uuid
+import queue
+import struct
+import zipfile
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from fnmatch import fnmatchcase
+from pathlib import Path
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# =============================================
+# HASHING CONFIGURATION
+# =============================================
+HASH_CONFIG = {
+    "chunk_size": 1024 * 1024,  # 1 MiB reads instead of 4 KB
+    "workers": min(4, os.cpu_count() or 1)  # hashlib releases the GIL, so threads scale
+}
+
+# =============================================
+# DISCOVERY CONFIGURATION
+# =============================================
+DISCOVERY_CONFIG = {
+    "include": ["*.apk"],  # File name patterns to pick up
+    "exclude": [],  # Name or full-path patterns to skip (files and directories)
+    "recursive": False  # Descend into subdirectories of each scan directory
+}
+
+# =============================================
+# SCANDIR-BASED APK DISCOVERY
+# =============================================
+
+# root is the scan directory the file was found under; stat is the os.stat_result
+DiscoveredFile = namedtuple("DiscoveredFile", "path root stat")
+
+def _excluded(entry, exclude):
+    return any(fnmatchcase(entry.name, p) or fnmatchcase(entry.path, p) for p in exclude)
+
+def matches_discovery_rules(name, path=None):
+    """Whether a single file name (or path) passes the include and exclude rules"""
+    path = path or name
+    if any(fnmatchcase(name, p) or fnmatchcase(path, p) for p in DISCOVERY_CONFIG["exclude"]):
+        return False
+    return any(fnmatchcase(name, p) for p in DISCOVERY_CONFIG["include"])
+
+def discover_apks(directories, include=None, exclude=None, recursive=None):
+    """Find APKs with os.scandir, reusing dirent types and one stat per file.
+
+    Files reachable through several directories (overlapping scan roots, bind
+    mounts, hardlinks) are returned once, deduplicated on (st_dev, st_ino).
+    """
+    include = DISCOVERY_CONFIG["include"] if include is None else include
+    exclude = DISCOVERY_CONFIG["exclude"] if exclude is None else exclude
+    recursive = DISCOVERY_CONFIG["recursive"] if recursive is None else recursive
+
+    found = []
+    seen_files = set()
+    seen_dirs = set()
+    for root in directories:
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                dir_st = os.stat(directory)
+            except OSError:
+                continue
+            if (dir_st.st_dev, dir_st.st_ino) in seen_dirs:
+                continue
+            seen_dirs.add((dir_st.st_dev, dir_st.st_ino))
+
+            files = []
+            subdirs = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if _excluded(entry, exclude):
+                                continue
+                            if entry.is_file():
+                                if any(fnmatchcase(entry.name, p) for p in include):
+                                    files.append((entry.name, entry.path, entry.stat()))
+                            elif recursive and entry.is_dir():
+                                subdirs.append(entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+            for name, path, st in sorted(files):
+                if (st.st_dev, st.st_ino) in seen_files:
+                    continue
+                seen_files.add((st.st_dev, st.st_ino))
+                found.append(DiscoveredFile(Path(path), root, st))
+            stack.extend(sorted(subdirs, reverse=True))
+    return found
+
+# =============================================
+# DUPLICATE-CONTENT FAN-OUT
+# =============================================
+DEDUPE_CONFIG = {
+    "mode": "hardlink"  # "hardlink": keep each copy's name in the destination; "remove": keep one file
+}
+
+def dedupe_copy(copy_path, primary_path, primary_hash=None, mode=None):
+    """Fold a byte-identical copy into the folder its primary was organized into.
+
+    The copy is rehashed first, so one edited in place since hashing is kept
+    even at the same size; primary_hash (the group's digest) spares rehashing
+    the primary. The copy is then hardlinked next to the primary under its own
+    name (falling back to plain removal where links are unsupported, e.g. FUSE
+    storage), and the original copy is deleted. Returns "linked", "removed" or
+    "kept".
+    """
+    mode = mode or DEDUPE_CONFIG["mode"]
+    if not files_identical(primary_path, copy_path, primary_hash):
+        return "kept"  # Changed since it was hashed; leave it for the next run
+
+    action = "removed"
+    target = os.path.join(os.path.dirname(primary_path), os.path.basename(copy_path))
+    if mode == "hardlink" and not os.path.exists(target):
+        try:
+            os.link(primary_path, target)
+            action = "linked"
+        except OSError:
+            pass
+    try:
+        os.remove(copy_path)
+    except OSError:
+        return "kept"
+    return action
+
+# =============================================
+# APK ORGANIZER
+# =============================================
+ORGANIZER_CONFIG = {
+    "chunk_size": 4 * 1024 * 1024,  # Cross-device copy chunk
+    "fsync": True  # Flush copied bytes to disk before the source is deleted
+}
+
+def same_device(path, directory):
+    """True when a rename from path into directory cannot cross a filesystem boundary"""
+    try:
+        return os.stat(path).st_dev == os.stat(directory).st_dev
+    except OSError:
+        return False
+
+def files_identical(path, other, path_hash=None):
+    """Byte-identical check: sizes first, then SHA-256 (path_hash skips rehashing path)"""
+    try:
+        if os.path.getsize(path) != os.path.getsize(other):
+            return False
+    except OSError:
+        return False
+    return (path_hash or sha256_file(path)) == sha256_file(other)
+
+def versioned_siblings(path):
+    """path itself and every "name (N).ext" beside it that exists"""
+    directory, name = os.path.split(path)
+    base, ext = os.path.splitext(name)
+    pattern = re.compile(re.escape(base) + r"(?: \(\d+\))?" + re.escape(ext) + "$")
+    try:
+        with os.scandir(directory) as entries:
+            return sorted(e.path for e in entries if pattern.match(e.name) and e.is_file())
+    except OSError:
+        return []
+
+def _claim_path(path):
+    """Atomically reserve the first free name of path, "name (2).ext", ... as an empty file"""
+    base, ext = os.path.splitext(path)
+    candidate, n = path, 2
+    while True:
+        try:
+            os.close(os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return candidate
+        except FileExistsError:
+            candidate = f"{base} ({n}){ext}"
+            n += 1
+
+def _fsync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # Not supported on every platform or filesystem
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _durable_copy(src, dest, chunk_size=None):
+    """Chunked copy to a temp name beside dest, fsync'd, then renamed into place"""
+    chunk_size = chunk_size or ORGANIZER_CONFIG["chunk_size"]
+    tmp_path = f"{dest}.part"
+    try:
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        with open(src, "rb", buffering=0) as fin, open(tmp_path, "wb") as fout:
+            while True:
+                read = fin.readinto(buffer)
+                if not read:
+                    break
+                fout.write(view[:read])
+            if ORGANIZER_CONFIG["fsync"]:
+                fout.flush()
+                os.fsync(fout.fileno())
+        try:
+            shutil.copystat(src, tmp_path)
+        except OSError:
+            pass  # Timestamps are cosmetic; shared storage often refuses them
+        os.replace(tmp_path, dest)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def place_file(src, dest_dir, src_hash=None):
+    """Move src into dest_dir without ever overwriting a different file.
+
+    When the name or any "name (N).ext" version of it already holds the same
+    content, src is dropped. Otherwise the first free name is claimed with
+    O_EXCL, so concurrent placements (or both scanners) never pick the same
+    one, and src replaces the claimed placeholder: a single atomic rename on
+    the same device, a chunked, fsync'd copy before deleting the source across
+    devices. Returns (final_path, action) with action "renamed", "copied" or
+    "duplicate"; raises OSError when the move fails.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    dest = os.path.join(dest_dir, os.path.basename(src))
+    size = os.path.getsize(src)
+    for existing in versioned_siblings(dest):
+        try:
+            if os.path.samefile(src, existing):
+                return existing, "duplicate"
+            if os.path.getsize(existing) != size:
+                continue
+        except OSError:
+            continue
+        src_hash = src_hash or sha256_file(src)
+        if files_identical(src, existing, src_hash):
+            os.remove(src)
+            return existing, "duplicate"
+    dest = _claim_path(dest)
+    try:
+        if same_device(src, dest_dir):
+            os.replace(src, dest)
+            return dest, "renamed"
+        _durable_copy(src, dest)
+    except BaseException:
+        try:
+            os.remove(dest)
+        except OSError:
+            pass
+        raise
+    os.remove(src)
+    return dest, "copied"
+
+class ApkOrganizer:
+    """Collects moves while a pipeline stage runs and places them together at its end.
+
+    Each queued move reports back through its callback as (path, action), or
+    (None, error) when it failed, so callers log and journal after the fact.
+    """
+    def __init__(self):
+        self.queued = []
+        self.lock = threading.Lock()
+
+    def add(self, src, dest_dir, src_hash=None, on_placed=None):
+        with self.lock:
+            self.queued.append((str(src), dest_dir, src_hash, on_placed))
+
+    def flush(self):
+        """Place every queued file; returns how many moves were attempted"""
+        with self.lock:
+            batch, self.queued = self.queued, []
+        copied_into = set()
+        for src, dest_dir, src_hash, on_placed in batch:
+            try:
+                path, action = place_file(src, dest_dir, src_hash)
+            except OSError as e:
+                path, action = None, str(e)
+            if action == "copied":
+                copied_into.add(dest_dir)
+            if on_placed:
+                on_placed(path, action)
+        # One directory fsync per batch makes every cross-device rename durable
+        if ORGANIZER_CONFIG["fsync"]:
+            for directory in copied_into:
+                _fsync_directory(directory)
+        return len(batch)
+
+# =============================================
+# PARALLEL HASHING STAGE
+# =============================================
+
+def sha256_file(path, chunk_size=None):
+    """SHA-256 of a file read through one reusable large buffer"""
+    chunk_size = chunk_size or HASH_CONFIG["chunk_size"]
+    sha256_hash = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            sha256_hash.update(view[:read])
+    return sha256_hash.hexdigest()
+
+# =============================================
+# STAT-KEYED HASH INDEX
+# =============================================
+
+class HashIndex:
+    """Persistent SHA-256 index keyed on (device, inode, size, mtime_ns)"""
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_hashes ("
+                "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, sha256 TEXT, "
+                "PRIMARY KEY (dev, ino))"
+            )
+        return self.conn
+
+    def lookup(self, st):
+        """Digest for an unchanged file, None if the file is new or was modified"""
+        try:
+            with self.lock:
+                row = self._connect().execute(
+                    "SELECT size, mtime_ns, sha256 FROM file_hashes WHERE dev = ? AND ino = ?",
+                    (st.st_dev, st.st_ino)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        return None
+
+    def store(self, st, digest):
+        """Record a digest, replacing whatever an earlier version of the inode had"""
+        try:
+            with self.lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)",
+                    (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, digest)
+                )
+                conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+def _same_file_state(a, b):
+    return (a.st_dev, a.st_ino, a.st_size, a.st_mtime_ns) == (b.st_dev, b.st_ino, b.st_size, b.st_mtime_ns)
+
+def hash_files(paths, workers=None, index=None):
+    """Hash files on a thread pool, yielding (path, digest, error) as each one finishes.
+
+    paths may be plain paths or DiscoveredFile entries, whose stat is reused.
+    With a HashIndex, unchanged files are answered from the index without being read.
+    """
+    pending = []
+    for item in paths:
+        if isinstance(item, DiscoveredFile):
+            path, st = item.path, item.stat
+        else:
+            path = item
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                yield path, None, e
+                continue
+        digest = index.lookup(st) if index else None
+        if digest:
+            yield path, digest, None
+        else:
+            pending.append((path, st))
+
+    if not pending:
+        return
+
+    workers = max(1, min(workers or HASH_CONFIG["workers"], len(pending)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(sha256_file, path): (path, st) for path, st in pending}
+        for future in as_completed(futures):
+            path, st = futures[future]
+            try:
+                digest = future.result()
+            except Exception as e:
+                yield path, None, e
+                continue
+            # Only index the digest if the file did not change while it was being read
+            if index:
+                try:
+                    if _same_file_state(st, os.stat(path)):
+                        index.store(st, digest)
+                except OSError:
+                    pass
+            yield path, digest, None
+
+# =============================================
+# PER-KEY QUOTA LEDGER
+# =============================================
+
+def key_fingerprint(api_key):
+    """Stable id for an API key that never stores the key itself"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+QUOTA_CONFIG = {
+    "requests_per_minute": 4,  # VT public API, per key
+    "burst": 1,  # Requests that may go back-to-back before pacing kicks in
+    "daily_limit": 500,
+    "monthly_limit": 15500
+}
+
+class QuotaLedger:
+    """Per-key request pacing and quota shared by every scanner process.
+
+    Lives in the SQLite state DB. Each reservation runs in a BEGIN IMMEDIATE
+    transaction, so concurrent scanners serialize on the database lock and
+    together stay within one key's limits. Pacing is a GCRA token bucket whose
+    single state column ("tat", theoretical arrival time) replaces an in-memory
+    request list. Daily and monthly counts are UTC periods; 429 Retry-After
+    blocks are persisted too.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.conn is None:
+            # Autocommit mode so BEGIN IMMEDIATE controls the transactions
+            self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                        check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS key_usage ("
+                "key_id TEXT PRIMARY KEY, minute TEXT, minute_count INTEGER, "
+                "day TEXT, day_count INTEGER, month TEXT, month_count INTEGER, "
+                "blocked_until REAL, tat REAL)"
+            )
+            try:
+                self.conn.execute("ALTER TABLE key_usage ADD COLUMN tat REAL")
+            except sqlite3.OperationalError:
+                pass  # Already there
+        return self.conn
+
+    @staticmethod
+    def _periods(now):
+        t = time.gmtime(now)
+        return time.strftime("%Y-%m-%d %H:%M", t), time.strftime("%Y-%m-%d", t), time.strftime("%Y-%m", t)
+
+    def _usage(self, conn, key_id, now):
+        minute, day, month = self._periods(now)
+        row = conn.execute(
+            "SELECT minute, minute_count, day, day_count, month, month_count, blocked_until, tat "
+            "FROM key_usage WHERE key_id = ?", (key_id,)
+        ).fetchone() or (minute, 0, day, 0, month, 0, 0.0, 0.0)
+        return {
+            "minute": row[1] if row[0] == minute else 0,
+            "day": row[3] if row[2] == day else 0,
+            "month": row[5] if row[4] == month else 0,
+            "blocked_until": row[6] or 0.0,
+            "tat": row[7] or 0.0
+        }
+
+    def _write(self, conn, key_id, usage, now):
+        minute, day, month = self._periods(now)
+        conn.execute(
+            "INSERT OR REPLACE INTO key_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key_id, minute, usage["minute"], day, usage["day"], month, usage["month"],
+             usage["blocked_until"], usage["tat"])
+        )
+
+    def _transaction(self, fn):
+        """Run fn(conn) inside BEGIN IMMEDIATE, holding the cross-process write lock"""
+        with self.lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def usage(self, key_id, now=None):
+        """Counts for the current periods plus any persisted 429 block"""
+        now = now or time.time()
+        with self.lock:
+            return self._usage(self._connect(), key_id, now)
+
+    def reserve(self, key_id, now=None, requests_per_minute=None, burst=None,
+                daily_limit=None, monthly_limit=None):
+        """Claim one request for a key.
+
+        Returns 0 when the request may go ahead (and counts it), the seconds to
+        wait when pacing or a 429 block says not yet, or None when the daily or
+        monthly quota is spent.
+        """
+        now = now or time.time()
+        interval = 60.0 / (requests_per_minute or QUOTA_CONFIG["requests_per_minute"])
+        tolerance = interval * (max(1, burst or QUOTA_CONFIG["burst"]) - 1)
+        daily_limit = daily_limit or QUOTA_CONFIG["daily_limit"]
+        monthly_limit = monthly_limit or QUOTA_CONFIG["monthly_limit"]
+
+        def claim(conn):
+            usage = self._usage(conn, key_id, now)
+            if usage["day"] >= daily_limit or usage["month"] >= monthly_limit:
+                return None
+            if usage["blocked_until"] > now:
+                return usage["blocked_until"] - now
+            tat = max(usage["tat"], now)
+            if tat - now > tolerance:
+                return tat - tolerance - now
+            usage["tat"] = tat + interval
+            for period in ("minute", "day", "month"):
+                usage[period] += 1
+            self._write(conn, key_id, usage, now)
+            return 0.0
+
+        return self._transaction(claim)
+
+    def acquire(self, key_id, clock=time, **limits):
+        """Block until reserve() grants a request; False once the quota is spent"""
+        while True:
+            wait = self.reserve(key_id, clock.time(), **limits)
+            if wait is None:
+                return False
+            if wait <= 0:
+                return True
+            clock.sleep(wait)
+
+    def block(self, key_id, until, now=None):
+        """Persist a rate-limit block (e.g. from Retry-After) for every process"""
+        now = now or time.time()
+
+        def extend(conn):
+            usage = self._usage(conn, key_id, now)
+            usage["blocked_until"] = max(usage["blocked_until"], until)
+            self._write(conn, key_id, usage, now)
+
+        self._transaction(extend)
+
+    def close(self):
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+def retry_after_seconds(response, default=None):
+    """Seconds from a Retry-After header (delta-seconds form), else default"""
+    try:
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError, AttributeError):
+        return default
+
+class QuotaExhausted(Exception):
+    """Every usable key has spent its daily or monthly quota"""
+
+# =============================================
+# PERSISTENT VERDICT CACHE
+# =============================================
+
+VERDICT_CACHE_CONFIG = {
+    "enabled": True,
+    "ttl_days": 30,  # Trust a cached report while VT's last analysis is newer than this
+    "min_ttl_hours": 24  # Never re-query a hash fetched within this window
+}
+
+class VerdictCache:
+    """SQLite store of VirusTotal file reports keyed by SHA-256.
+
+    Shared by both scanners, so a hash one of them already looked up costs the
+    other no quota. on_error(message) is told about read/write failures.
+    """
+    def __init__(self, db_path, on_error=None):
+        self.db_path = db_path
+        self.on_error = on_error
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "sha256 TEXT PRIMARY KEY, last_analysis_date INTEGER, "
+                "cached_at INTEGER, report TEXT)"
+            )
+        return self.conn
+
+    def is_fresh(self, last_analysis_date, cached_at, now=None):
+        """A report is fresh while VT's analysis or our fetch is recent enough"""
+        now = now or time.time()
+        if last_analysis_date and now - last_analysis_date < VERDICT_CACHE_CONFIG["ttl_days"] * 86400:
+            return True
+        return now - cached_at < VERDICT_CACHE_CONFIG["min_ttl_hours"] * 3600
+
+    def get(self, file_hash):
+        """Return the cached report JSON for a hash, or None when missing or stale"""
+        if not VERDICT_CACHE_CONFIG["enabled"]:
+            return None
+        try:
+            with self.lock:
+                row = self._connect().execute(
+                    "SELECT last_analysis_date, cached_at, report FROM verdicts WHERE sha256 = ?",
+                    (file_hash,)
+                ).fetchone()
+            if row and self.is_fresh(row[0], row[1]):
+                return json.loads(row[2])
+        except Exception as e:
+            if self.on_error:
+                self.on_error(f"Verdict cache read failed: {e}")
+        return None
+
+    def put(self, file_hash, report):
+        """Store a report JSON returned by /files/{hash}"""
+        if not VERDICT_CACHE_CONFIG["enabled"]:
+            return
+        try:
+            last_analysis_date = report.get("data", {}).get("attributes", {}).get("last_analysis_date")
+            if not isinstance(last_analysis_date, (int, float)):
+                last_analysis_date = None
+            with self.lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)",
+                    (file_hash, last_analysis_date, int(time.time()), json.dumps(report, default=str))
+                )
+                conn.commit()
+        except Exception as e:
+            if self.on_error:
+                self.on_error(f"Verdict cache write failed: {e}")
+
+    def close(self):
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+def found_result_from_report(report, cached=False):
+    """Build a 'found' lookup result from a /files/{hash} JSON report"""
+    stats = report["data"]["attributes"]["last_analysis_stats"]
+    return {
+        "status": "found",
+        "malicious": stats["malicious"],
+        "suspicious": stats["suspicious"],
+        "undetected": stats["undetected"],
+        "harmless": stats["harmless"],
+        "total": sum(stats.values()),
+        "full_data": report,
+        "cached": cached
+    }
+
+# =============================================
+# PENDING ANALYSIS QUEUE
+# =============================================
+
+PENDING_CONFIG = {
+    "first_poll": 120,  # Seconds after upload before the first status check
+    "backoff": 2,  # Poll interval multiplier after each still-queued answer
+    "max_interval": 3600,
+    "daily_reserve": 50,  # Polling pauses when fewer requests than this are left today
+    "idle_wait": 30  # Poller wake-up interval when nothing is due
+}
+
+class PendingAnalyses:
+    """Uploaded files waiting on a VirusTotal analysis, persisted in the state DB.
+
+    One row per SHA-256 with the analysis id from the upload response, every
+    path holding that content, and an exponential poll schedule.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending_analyses ("
+                "sha256 TEXT PRIMARY KEY, analysis_id TEXT, paths TEXT, "
+                "submitted REAL, attempts INTEGER, next_poll REAL)"
+            )
+        return self.conn
+
+    @staticmethod
+    def _entry(row):
+        return {"sha256": row[0], "analysis_id": row[1], "paths": json.loads(row[2] or "[]"),
+                "submitted": row[3], "attempts": row[4], "next_poll": row[5]}
+
+    def add(self, sha256, analysis_id, path, now=None):
+        now = now or time.time()
+        with self.lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO pending_analyses VALUES (?, ?, ?, ?, 0, ?)",
+                (sha256, analysis_id, json.dumps([path]), now, now + PENDING_CONFIG["first_poll"])
+            )
+            conn.commit()
+
+    def get(self, sha256):
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT * FROM pending_analyses WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    def add_path(self, sha256, path):
+        """Attach another copy of pending content so it is finalized with the first"""
+        with self.lock:
+            conn = self._connect()
+            row = conn.execute("SELECT paths FROM pending_analyses WHERE sha256 = ?", (sha256,)).fetchone()
+            if row:
+                paths = json.loads(row[0] or "[]")
+                if path not in paths:
+                    conn.execute("UPDATE pending_analyses SET paths = ? WHERE sha256 = ?",
+                                 (json.dumps(paths + [path]), sha256))
+                    conn.commit()
+
+    def due(self, now=None):
+        """Entries whose next poll time has passed, oldest schedule first"""
+        now = now or time.time()
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT * FROM pending_analyses WHERE next_poll <= ? ORDER BY next_poll", (now,)
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def next_poll_at(self):
+        with self.lock:
+            row = self._connect().execute("SELECT MIN(next_poll) FROM pending_analyses").fetchone()
+        return row[0]
+
+    def reschedule(self, sha256, now=None):
+        """Push the next poll out exponentially; returns the new interval in seconds"""
+        now = now or time.time()
+        with self.lock:
+            conn = self._connect()
+            row = conn.execute("SELECT attempts FROM pending_analyses WHERE sha256 = ?", (sha256,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            interval = min(PENDING_CONFIG["first_poll"] * PENDING_CONFIG["backoff"] ** attempts,
+                           PENDING_CONFIG["max_interval"])
+            conn.execute("UPDATE pending_analyses SET attempts = ?, next_poll = ? WHERE sha256 = ?",
+                         (attempts, now + interval, sha256))
+            conn.commit()
+        return interval
+
+    def resolve(self, sha256):
+        with self.lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM pending_analyses WHERE sha256 = ?", (sha256,))
+            conn.commit()
+
+    def count(self):
+        with self.lock:
+            return self._connect().execute("SELECT COUNT(*) FROM pending_analyses").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+# =============================================
+# COMPILED DETECTION MATCHER
+# =============================================
+
+SAFE_INDICATORS = ['pup', 'pua', 'riskware', 'potentially unwanted', 'unwanted', 'adware']
+MALICIOUS_INDICATORS = ['trojan', 'virus', 'malware', 'worm', 'backdoor', 'exploit', 'ransomware']
+
+# Heuristic labels only count when the indicator sits in the result, not the vendor name
+RESULT_ONLY_LABELS = {"safe", "malicious"}
+
+class DetectionMatcher:
+    """Aho-Corasick automaton over whitelist, blacklist and heuristic indicators.
+
+    One pass over "vendor: result" returns every label that matched, case-insensitively.
+    """
+    def __init__(self, whitelist=(), blacklist=()):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self.always = set()  # Labels of empty patterns, which match everything
+        for pattern in whitelist:
+            self._add(pattern, "whitelisted")
+        for pattern in blacklist:
+            self._add(pattern, "blacklisted")
+        for pattern in SAFE_INDICATORS:
+            self._add(pattern, "safe")
+        for pattern in MALICIOUS_INDICATORS:
+            self._add(pattern, "malicious")
+        self._build_failure_links()
+
+    def _add(self, pattern, label):
+        pattern = pattern.lower()
+        if not pattern:
+            self.always.add(label)
+            return
+        node = 0
+        for ch in pattern:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append((label, len(pattern)))
+
+    def _build_failure_links(self):
+        level = list(self.goto[0].values())
+        while level:
+            next_level = []
+            for node in level:
+                for ch, child in self.goto[node].items():
+                    f = self.fail[node]
+                    while f and ch not in self.goto[f]:
+                        f = self.fail[f]
+                    target = self.goto[f].get(ch, 0)
+                    self.fail[child] = target if target != child else 0
+                    self.out[child] = self.out[child] + self.out[self.fail[child]]
+                    next_level.append(child)
+            level = next_level
+
+    def classify(self, vendor, result):
+        """Set of labels ('whitelisted', 'blacklisted', 'safe', 'malicious') for one detection"""
+        labels = set(self.always)
+        result_offset = len(vendor) + 2
+        text = f"{vendor}: {result}".lower()
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for label, length in self.out[node]:
+                if label in RESULT_ONLY_LABELS and i - length + 1 < result_offset:
+                    continue
+                labels.add(label)
+        if not result:
+            labels -= RESULT_ONLY_LABELS
+        return labels
+
+# =============================================
+# STREAMING MULTIPART UPLOAD BODY
+# =============================================
+
+class MultipartFileStream:
+    """multipart/form-data body for one file, read from disk a chunk at a time.
+
+    Pass it as data= with its content_type header. The exact Content-Length is
+    known up front, and memory use stays at one chunk whatever the file size.
+    progress(sent, total) is called as the HTTP client pulls bytes.
+    """
+    def __init__(self, path, field="file", filename=None, chunk_size=None, progress=None):
+        self.boundary = uuid.uuid4().hex
+        filename = (filename or os.path.basename(str(path))).replace('"', "%22").replace("\r", "").replace("\n", "")
+        self.head = (
+            f"--{self.boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode("utf-8")
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self.chunk_size = chunk_size or HASH_CONFIG["chunk_size"]
+        self.file = open(path, "rb")
+        self.total = len(self.head) + os.fstat(self.file.fileno()).st_size + len(self.tail)
+        self.progress = progress
+        self.sent = 0
+        self.stage = 0
+        self.buffer = memoryview(b"")
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self.total
+
+    def _next_piece(self):
+        if self.stage == 0:
+            self.stage = 1
+            return self.head
+        if self.stage == 1:
+            data = self.file.read(self.chunk_size)
+            if data:
+                return data
+            self.stage = 2
+            return self.tail
+        return b""
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.chunk_size
+        out = bytearray()
+        while len(out) < size:
+            if not self.buffer:
+                self.buffer = memoryview(self._next_piece())
+                if not self.buffer:
+                    break
+                if self.stage == 2:
+                    self.stage = 3  # Tail handed out once
+            take = self.buffer[:size - len(out)]
+            out += take
+            self.buffer = self.buffer[len(take):]
+        self.sent += len(out)
+        if self.progress and out:
+            self.progress(self.sent, self.total)
+        return bytes(out)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# =============================================
+# SHARED KEEP-ALIVE TRANSPORT
+# =============================================
+TRANSPORT_CONFIG = {
+    "pool_size": 4,  # Kept-alive connections per host; grown to match lookup concurrency
+    "connect_retries": 3,  # Retries for failed connects/resets, never for HTTP status codes
+    "backoff_factor": 0.5,  # 0.5s, 1s, 2s between connection retries
+    "gzip": True  # Ask for compressed JSON; file reports shrink several times over
+}
+
+class VTTransport:
+    """One pooled requests.Session for every VirusTotal call from either scanner.
+
+    Connections stay open between lookups, so each call skips the TCP and TLS
+    handshake. 429s and other statuses are returned to the caller untouched; only
+    connection-level failures are retried here.
+    """
+    def __init__(self, pool_size=None):
+        self.pool_size = pool_size or TRANSPORT_CONFIG["pool_size"]
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip, deflate" if TRANSPORT_CONFIG["gzip"] else "identity"
+        self._mount()
+
+    def _mount(self):
+        retries = Retry(
+            total=TRANSPORT_CONFIG["connect_retries"],
+            connect=TRANSPORT_CONFIG["connect_retries"],
+            read=TRANSPORT_CONFIG["connect_retries"],
+            status=0,
+            allowed_methods=frozenset(["GET"]),  # A half-sent upload is retried by its caller
+            backoff_factor=TRANSPORT_CONFIG["backoff_factor"],
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size, max_retries=retries)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def ensure_pool_size(self, pool_size):
+        """Grow the pool so every concurrent lookup can hold its own connection"""
+        with self.lock:
+            if pool_size > self.pool_size:
+                self.pool_size = pool_size
+                self._mount()
+
+    def request(self, method, url, api_key=None, **kwargs):
+        headers = kwargs.pop("headers", None) or {}
+        if api_key:
+            headers["x-apikey"] = api_key
+        return self.session.request(method, url, headers=headers, **kwargs)
+
+    def get(self, url, api_key=None, **kwargs):
+        return self.request("GET", url, api_key, **kwargs)
+
+    def post(self, url, api_key=None, **kwargs):
+        return self.request("POST", url, api_key, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def shared_transport(pool_size=None):
+    """The process-wide VTTransport, created on first use and closed at exit"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = VTTransport(pool_size)
+            atexit.register(_transport.close)
+        elif pool_size:
+            _transport.ensure_pool_size(pool_size)
+        return _transport
+
+# =============================================
+# SIGNER / PACKAGE TRIAGE
+# =============================================
+
+TRIAGE_CONFIG = {
+    "enabled": True,
+    "min_clean": 1,  # Clean verdicts a signer+package needs before it counts as known
+    "max_manifest": 4 * 1024 * 1024,  # Skip absurdly large AndroidManifest.xml entries
+    "max_signing_block": 16 * 1024 * 1024
+}
+
+ApkIdentity = namedtuple("ApkIdentity", "signer package version_code version_name")
+
+APK_SIG_BLOCK_MAGIC = b"APK Sig Block 42"
+APK_SIGNATURE_SCHEMES = (0x7109871a, 0xf05368c0)  # v2 first: v3 may carry a rotated key
+MANIFEST_RESOURCE_NAMES = {0x0101021b: "versionCode", 0x0101021c: "versionName"}
+
+def _length_prefixed(buf, offset):
+    size = struct.unpack_from("<I", buf, offset)[0]
+    end = offset + 4 + size
+    if end > len(buf):
+        raise ValueError("truncated length-prefixed field")
+    return buf[offset + 4:end], end
+
+def _central_directory_offset(f, file_size):
+    """Offset of the ZIP central directory, from the end-of-central-directory record"""
+    tail_size = min(file_size, 65535 + 22)
+    f.seek(file_size - tail_size)
+    tail = f.read(tail_size)
+    eocd = tail.rfind(b"PK\x05\x06")
+    if eocd < 0 or eocd + 22 > len(tail):
+        return None
+    return struct.unpack_from("<I", tail, eocd + 16)[0]
+
+def _signing_block_certificate(f, cd_offset):
+    """First signer's certificate (DER) from a v2/v3 APK Signing Block, or None"""
+    if cd_offset < 32:
+        return None
+    f.seek(cd_offset - 24)
+    block_size, magic = struct.unpack("<Q16s", f.read(24))
+    if magic != APK_SIG_BLOCK_MAGIC or block_size > min(cd_offset - 8, TRIAGE_CONFIG["max_signing_block"]):
+        return None
+    f.seek(cd_offset - block_size - 8)
+    block = f.read(block_size - 16)[8:]  # Drop the leading size field and the trailing size + magic
+    schemes = {}
+    offset = 0
+    while offset + 12 <= len(block):
+        pair_size, pair_id = struct.unpack_from("<QI", block, offset)
+        schemes[pair_id] = block[offset + 12:offset + 8 + pair_size]
+        offset += 8 + pair_size
+    for scheme in APK_SIGNATURE_SCHEMES:
+        if scheme in schemes:
+            signers, _ = _length_prefixed(schemes[scheme], 0)
+            signer, _ = _length_prefixed(signers, 0)
+            signed_data, _ = _length_prefixed(signer, 0)
+            _, offset = _length_prefixed(signed_data, 0)  # Digests
+            certificates, _ = _length_prefixed(signed_data, offset)
+            certificate, _ = _length_prefixed(certificates, 0)
+            return certificate
+    return None
+
+def _der_element(buf, offset):
+    """(tag, content start, end) of the DER element at offset"""
+    tag, length = buf[offset], buf[offset + 1]
+    offset += 2
+    if length & 0x80:
+        count = length & 0x7f
+        length = int.from_bytes(buf[offset:offset + count], "big")
+        offset += count
+    return tag, offset, offset + length
+
+def _pkcs7_certificate(data):
+    """First certificate (DER) in a v1 PKCS#7 signature file (META-INF/*.RSA|DSA|EC)"""
+    _, content, _ = _der_element(data, 0)  # ContentInfo
+    _, _, offset = _der_element(data, content)  # contentType OID
+    _, explicit, _ = _der_element(data, offset)  # [0] EXPLICIT
+    _, offset, _ = _der_element(data, explicit)  # SignedData
+    for _ in range(3):  # version, digestAlgorithms, encapContentInfo
+        _, _, offset = _der_element(data, offset)
+    tag, certificates, _ = _der_element(data, offset)
+    if tag != 0xa0:
+        return None
+    _, _, end = _der_element(data, certificates)
+    return data[certificates:end]
+
+def _string_pool(data, offset):
+    header_size, _, count, _, flags, strings_start = struct.unpack_from("<HIIIII", data, offset + 2)
+    utf8 = flags & 0x100
+    strings = []
+    for i in range(count):
+        at = offset + strings_start + struct.unpack_from("<I", data, offset + header_size + 4 * i)[0]
+        if utf8:
+            at += 2 if data[at] & 0x80 else 1  # Length in characters
+            size = data[at]
+            if size & 0x80:
+                size = ((size & 0x7f) << 8) | data[at + 1]
+                at += 1
+            strings.append(data[at + 1:at + 1 + size].decode("utf-8", "replace"))
+        else:
+            size = struct.unpack_from("<H", data, at)[0]
+            if size & 0x8000:
+                size = ((size & 0x7fff) << 16) | struct.unpack_from("<H", data, at + 2)[0]
+                at += 2
+            strings.append(data[at + 2:at + 2 + 2 * size].decode("utf-16-le", "replace"))
+    return strings
+
+def _manifest_attributes(data):
+    """package / versionCode / versionName of the <manifest> element in binary (or plain) XML"""
+    if data.lstrip()[:1] == b"<":
+        text = data.decode("utf-8", "replace")
+        return {key: value for key, value in
+                re.findall(r'(?:android:)?(package|versionCode|versionName)\s*=\s*"([^"]*)"', text)}
+    strings, resource_ids = [], []
+    offset = 8  # Past the XML chunk header
+    while offset + 8 <= len(data):
+        chunk_type, header_size, chunk_size = struct.unpack_from("<HHI", data, offset)
+        if chunk_size < 8:
+            break
+        if chunk_type == 0x0001:
+            strings = _string_pool(data, offset)
+        elif chunk_type == 0x0180:
+            resource_ids = list(struct.unpack_from(f"<{(chunk_size - header_size) // 4}I", data, offset + header_size))
+        elif chunk_type == 0x0102:
+            ext = offset + header_size
+            _, name, attr_start, attr_size, attr_count = struct.unpack_from("<IIHHH", data, ext)
+            if name >= len(strings) or strings[name] != "manifest":
+                return {}
+            attributes = {}
+            for i in range(attr_count):
+                _, attr_name, raw, _, _, data_type, value = struct.unpack_from(
+                    "<IIIHBBI", data, ext + attr_start + i * attr_size)
+                key = strings[attr_name] if attr_name < len(strings) else ""
+                if not key and attr_name < len(resource_ids):
+                    key = MANIFEST_RESOURCE_NAMES.get(resource_ids[attr_name], "")
+                if raw != 0xFFFFFFFF and raw < len(strings):
+                    attributes[key] = strings[raw]
+                elif data_type in (0x10, 0x11):
+                    attributes[key] = value
+                elif data_type == 0x03 and value < len(strings):
+                    attributes[key] = strings[value]
+            return attributes
+        offset += chunk_size
+    return {}
+
+def read_apk_identity(path):
+    """Signing-certificate SHA-256 plus package and version, read via the ZIP central directory.
+
+    Nothing is extracted: the signer comes from the APK Signing Block in front
+    of the central directory (v1 PKCS#7 as a fallback) and the manifest entry
+    is the only member decompressed. Returns None for files that are not
+    readable APKs; fields that cannot be read are None. Never raises.
+    """
+    try:
+        with open(path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            certificate = None
+            cd_offset = _central_directory_offset(f, file_size)
+            if cd_offset is not None:
+                try:
+                    certificate = _signing_block_certificate(f, cd_offset)
+                except (ValueError, struct.error):
+                    certificate = None
+            f.seek(0)
+            with zipfile.ZipFile(f) as apk:
+                attributes = {}
+                try:
+                    info = apk.getinfo("AndroidManifest.xml")
+                    if info.file_size <= TRIAGE_CONFIG["max_manifest"]:
+                        attributes = _manifest_attributes(apk.read(info))
+                except Exception:
+                    # Missing, encrypted, badly compressed or malformed: no package, no trust
+                    attributes = {}
+                if certificate is None:
+                    for name in apk.namelist():
+                        if name.startswith("META-INF/") and name.upper().endswith((".RSA", ".DSA", ".EC")):
+                            try:
+                                certificate = _pkcs7_certificate(apk.read(name))
+                            except Exception:
+                                certificate = None
+                            break
+    except Exception:
+        # Scanners get hostile files: any parse failure means "no identity", never a dead hash stage
+        return None
+
+    version_code = attributes.get("versionCode")
+    try:
+        version_code = int(version_code) if version_code is not None else None
+    except (TypeError, ValueError):
+        version_code = None
+    return ApkIdentity(
+        hashlib.sha256(certificate).hexdigest() if certificate else None,
+        attributes.get("package") or None,
+        version_code,
+        attributes.get("versionName") if isinstance(attributes.get("versionName"), str) else None
+    )
+
+class SignerTrust:
+    """Signer + package pairs with a clean track record, learned from past verdicts.
+
+    A pair is known once it has TRIAGE_CONFIG["min_clean"] clean verdicts and
+    no infected one; a single infected verdict revokes it for good.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS signer_trust ("
+                "signer TEXT, package TEXT, clean INTEGER, infected INTEGER, "
+                "version_code INTEGER, version_name TEXT, updated REAL, "
+                "PRIMARY KEY (signer, package))"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS signer_trust_meta (key TEXT PRIMARY KEY, value TEXT)")
+        return self.conn
+
+    def lookup(self, identity):
+        """The trust record for a known signer + package, else None"""
+        if not identity or not identity.signer or not identity.package:
+            return None
+        try:
+            with self.lock:
+                row = self._connect().execute(
+                    "SELECT clean, infected, version_code, version_name FROM signer_trust "
+                    "WHERE signer = ? AND package = ?", (identity.signer, identity.package)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row and row[0] >= TRIAGE_CONFIG["min_clean"] and not row[1]:
+            return {"clean": row[0], "version_code": row[2], "version_name": row[3]}
+        return None
+
+    def learn(self, identity, clean):
+        """Record a clean or infected verdict for a signer + package"""
+        if not identity or not identity.signer or not identity.package:
+            return
+        try:
+            with self.lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT INTO signer_trust VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (signer, package) DO UPDATE SET "
+                    "clean = clean + excluded.clean, infected = infected + excluded.infected, "
+                    "version_code = CASE WHEN excluded.clean THEN MAX(COALESCE(version_code, 0), COALESCE(excluded.version_code, 0)) ELSE version_code END, "
+                    "version_name = CASE WHEN excluded.clean AND COALESCE(excluded.version_code, 0) >= COALESCE(version_code, 0) THEN excluded.version_name ELSE version_name END, "
+                    "updated = excluded.updated",
+                    (identity.signer, identity.package, 1 if clean else 0, 0 if clean else 1,
+                     identity.version_code, identity.version_name, time.time())
+                )
+                conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def count(self):
+        with self.lock:
+            return self._connect().execute("SELECT COUNT(*) FROM signer_trust").fetchone()[0]
+
+    def is_seeded(self):
+        """True once seed() has run against this index"""
+        try:
+            with self.lock:
+                return self._connect().execute(
+                    "SELECT 1 FROM signer_trust_meta WHERE key = 'seeded_at'").fetchone() is not None
+        except sqlite3.Error:
+            return False
+
+    def seed(self, directories):
+        """Learn every APK already sorted into a clean folder; returns how many were read.
+
+        Runs once per index: an index that already learned from verdicts is
+        only marked as seeded, and later runs skip the folder walk.
+        """
+        learned = 0
+        if not self.count():
+            for item in discover_apks(directories, recursive=False):
+                identity = read_apk_identity(item.path)
+                if identity and identity.signer and identity.package:
+                    self.learn(identity, True)
+                    learned += 1
+        try:
+            with self.lock:
+                conn = self._connect()
+                conn.execute("INSERT OR REPLACE INTO signer_trust_meta VALUES ('seeded_at', ?)", (str(time.time()),))
+                conn.commit()
+        except sqlite3.Error:
+            pass
+        return learned
+
+    def close(self):
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+# =============================================
+# SIZE-AWARE SCAN ENGINE
+# =============================================
+
+UPLOAD_LIMITS = {
+    "max_std": 32 * 1024 * 1024,  # POST /files accepts files up to this size
+    "max_large": 650 * 1024 * 1024  # Ceiling of the upload_url flow; beyond it VT refuses the file
+}
+
+def upload_route(size, max_std=None, max_large=None):
+    """Upload lane for content VT has never seen: "direct", "upload_url" or "too_large" """
+    if size > (max_large or UPLOAD_LIMITS["max_large"]):
+        return "too_large"
+    if size > (max_std or UPLOAD_LIMITS["max_std"]):
+        return "upload_url"
+    return "direct"
+
+class ScanEngine:
+    """Hash every file once, look every distinct content up once, route 404s by size.
+
+    Both scanners are front-ends to this engine. They supply lookup(file_hash)
+    and, to enable uploads, upload(path, size, route). Each returns a status
+    dict, and the front-end categorizes, moves and reports whatever run()
+    yields. Hashing feeds the lookup workers through a bounded queue.
+    Identical copies ride on one lookup, and a hash whose upload is still being
+    analysed comes back as "pending" without spending quota. Each new file's
+    signer and package are read offline first. Files from a signer + package
+    with a clean record are queued behind the rest of their batch, so quota
+    goes to unknown publishers first. Front-ends feed verdicts back through
+    record_verdict(), and clean_dirs seeds an empty trust index once. Subclasses
+    hook in through on_hash_failed, on_hashed, known_result and on_lookup.
+    """
+    _DONE = object()
+
+    def __init__(self, lookup, batches, db_path, upload=None, workers=1, queue_size=8,
+                 max_std=None, max_large=None, clean_dirs=None):
+        # batches: iterable of file lists; a one-shot scan passes one list, watch mode an endless stream
+        self.lookup = lookup
+        self.upload = upload
+        self.batches = batches
+        self.db_path = db_path
+        self.lookup_workers = max(1, workers)
+        self.max_std = max_std
+        self.max_large = max_large
+        self.hash_queue = queue.Queue(maxsize=queue_size)
+        self.result_queue = queue.Queue(maxsize=queue_size)
+        self.pending = PendingAnalyses(db_path)
+        self.trust = SignerTrust(db_path) if TRIAGE_CONFIG["enabled"] else None
+        self.clean_dirs = clean_dirs or []
+        self.seeded = 0
+        self.deprioritized = 0
+        self.queued = 0
+        self.hashed = 0
+        self.hash_failures = 0
+        self.duplicates = 0
+        self.exhausted = False  # Once a lookup reports the quota spent, the rest skip the network
+        # digest -> every path with that content still waiting on its verdict
+        self.groups = {}
+        self.groups_lock = threading.Lock()
+
+    def on_hash_failed(self, path, error):
+        pass
+
+    def on_hashed(self, file_hash, path):
+        """Called once per new content; return False to drop it without a lookup"""
+        return True
+
+    def known_result(self, file_hash):
+        """A lookup result already on hand, or None to ask VirusTotal"""
+        return None
+
+    def on_lookup(self, file_hash, result):
+        pass
+
+    def record_verdict(self, file_info, clean):
+        """Teach the trust index a clean or infected verdict for this file's signer + package"""
+        if self.trust and file_info.get('identity'):
+            self.trust.learn(file_info['identity'], clean)
+
+    def _hash_stage(self):
+        """Producer: stream digests into the lookup queue as each file finishes"""
+        hash_index = HashIndex(self.db_path)
+        try:
+            if self.trust and self.clean_dirs and not self.trust.is_seeded():
+                self.seeded = self.trust.seed(self.clean_dirs)
+            for batch in self.batches:
+                self._hash_batch(batch, hash_index)
+        finally:
+            hash_index.close()
+            for _ in range(self.lookup_workers):
+                self.hash_queue.put(self._DONE)
+
+    def _hash_batch(self, batch, hash_index):
+        self.queued += len(batch)
+        sizes = {item.path: item.stat.st_size for item in batch if isinstance(item, DiscoveredFile)}
+        deferred = []  # Known signers, looked up once the rest of the batch is queued
+        for path, file_hash, error in hash_files(batch, index=hash_index):
+            if not file_hash:
+                self.hash_failures += 1
+                self.on_hash_failed(path, error)
+                continue
+            self.hashed += 1
+            with self.groups_lock:
+                group = self.groups.get(file_hash)
+                if group is not None:
+                    # Same content already queued: ride along on its lookup
+                    group.append(path)
+                    self.duplicates += 1
+                    continue
+            if not self.on_hashed(file_hash, path):
+                continue
+            size = sizes.get(path)
+            if size is None:
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    size = 0
+            identity = read_apk_identity(path) if self.trust else None
+            trusted = self.trust.lookup(identity) if identity else None
+            with self.groups_lock:
+                self.groups[file_hash] = [path]
+            if trusted:
+                deferred.append((file_hash, path, size, identity, trusted))
+            else:
+                self.hash_queue.put((file_hash, path, size, identity, None))
+        self.deprioritized += len(deferred)
+        for item in deferred:
+            self.hash_queue.put(item)
+
+    def _resolve(self, file_hash, path, size, route):
+        """One lookup (or none), then the size lane for content VT does not know"""
+        if self.pending.get(file_hash):
+            return {"status": "pending"}
+        result = self.known_result(file_hash)
+        if result is None:
+            if self.exhausted:
+                return {"status": "quota_exhausted"}
+            try:
+                result = self.lookup(file_hash)
+            except QuotaExhausted:
+                result = {"status": "quota_exhausted"}
+            except Exception as e:
+                result = {"status": "error", "error": str(e)}
+            if result["status"] == "quota_exhausted":
+                self.exhausted = True
+            self.on_lookup(file_hash, result)
+        if result["status"] != "not_found" or self.upload is None:
+            return result
+        if route == "too_large":
+            return {"status": "too_large"}
+        try:
+            return self.upload(path, size, route)
+        except QuotaExhausted:
+            self.exhausted = True
+            return {"status": "quota_exhausted"}
+        except Exception as e:
+            return {"status": "upload_failed", "error": str(e)}
+
+    def _lookup_stage(self):
+        """Worker: wait on quota for each digest and hand the verdict downstream"""
+        try:
+            while True:
+                item = self.hash_queue.get()
+                if item is self._DONE:
+                    return
+                file_hash, path, size, identity, trusted = item
+                route = upload_route(size, self.max_std, self.max_large)
+                self.result_queue.put((file_hash, {
+                    'apk_file': path,
+                    'apk_name': path.name,
+                    'size': size,
+                    'route': route,
+                    'identity': identity,
+                    'trusted': trusted,
+                    'scan_result': self._resolve(file_hash, path, size, route)
+                }))
+        finally:
+            self.result_queue.put(self._DONE)
+
+    def run(self):
+        """Yield (file_hash, file_info) as verdicts arrive; the caller organizes and reports"""
+        threads = [threading.Thread(target=self._hash_stage, daemon=True)]
+        threads += [threading.Thread(target=self._lookup_stage, daemon=True) for _ in range(self.lookup_workers)]
+        for thread in threads:
+            thread.start()
+
+        finished_workers = 0
+        while finished_workers < self.lookup_workers:
+            item = self.result_queue.get()
+            if item is self._DONE:
+                finished_workers += 1
+                continue
+            file_hash, file_info = item
+            # Close the group; a copy hashed later forms a new group served by the verdict cache
+            with self.groups_lock:
+                group = self.groups.pop(file_hash, [file_info['apk_file']])
+            file_info['copies'] = group[1:]
+            yield item
+
+        for thread in threads:
+            thread.join()
+        self.pending.close()
+        if self.trust:
+            self.trust.close()